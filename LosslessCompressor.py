@@ -1,17 +1,126 @@
-import tkinter as tk
-import tkinter.filedialog
-from time import sleep
-from threading import Thread
-import os, struct, heapq, time
-
-old_pixels = [] #original image size
-current_pixels = [] #current image so that brightness and scaler can both work at the same time
+try:
+    import tkinter as tk
+    import tkinter.filedialog
+except ImportError:
+    #python built without tk can still use the codec and the command line
+    tk = None
+from threading import Thread, Event, Lock, local
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial, wraps
+from contextlib import contextmanager
+import os, sys, struct, heapq, time, array, operator, argparse, queue, io, hashlib, json, mmap, tracemalloc, math, re, codecs
+from collections import namedtuple, OrderedDict
+
+old_pixels = None #original image size
+current_pixels = None #current image so that brightness and scaler can both work at the same time
 # to keep track of r,g,b enable/disable
 r = True
 g = True
 b = True
 file_type = b'CMPT365' #to check file types
+# old single table files: magic, original size, w, h, bpp, colour table size,
+# pixel data size, then the colour table, 256 code lengths and the bit length
+V1_HEADER = struct.Struct("<7sIIIHII")
+V1_BITLENGTH = struct.Struct("<Q")
+V1_LENGTHS = struct.Struct("256B")
+HUFFMAN_TABLE_BITS = 11 #bits looked up per decoding step
+MAX_CODE_LENGTH = 15 #longest huffman code the tree builder will produce
+ENCODE_CHUNK = 1 << 16 #symbols packed per step when encoding
+BLOCK_SIZE = 1 << 17 #target bytes of pixel data per block
+# versioned files write 0xFFFFFFFF where old files keep the original size
+CONTAINER_ESCAPE = 0xFFFFFFFF
+CONTAINER_VERSION = 3 #version 2 kept huffman code lengths in the block index and had a static table coder
+# magic, escape, version, flags, original size, w, h, bpp, bmp header size,
+# pixel data size, rows per block, block count
+CONTAINER_HEADER = struct.Struct("<7sIBHIIIHIIII")
+# raw size, bit length, payload offset, then the coder's table
+BLOCK_ENTRY = struct.Struct("<IQQ")
+FLAG_FILTERED = 0x0001 #every row in a block starts with its filter type byte
+FLAG_PLANAR = 0x0002 #24 bpp blocks are stored as B, G, R planes plus the leftover bytes
+FLAG_TILED = 0x0004 #row bands are cut into tile columns, the tile width follows the header
+FLAG_PREVIEW = 0x0008 #a small coded preview sits between the bmp header and the block index
+FLAG_RLE = 0x0010 #every stream starts with a byte saying whether it is run length coded
+FLAG_DELTA = 0x0020 #pixel bytes are differences from a reference image, its hash follows the header
+CODER_SHIFT = 8 #bits 8-11 of the flags hold the entropy coder id
+CODER_MASK = 0x0F00
+KNOWN_FLAGS = FLAG_FILTERED | FLAG_PLANAR | FLAG_TILED | FLAG_PREVIEW | FLAG_RLE | FLAG_DELTA | CODER_MASK
+PLANE_COUNT = 4 #index entries per tile in planar files
+TILE_HEADER = struct.Struct("<I") #tile width in pixels
+TILE_ALIGN = 32 #tile widths are a multiple of this so tile rows never need padding
+DELTA_HEADER = struct.Struct("<32s") #sha-256 of the reference bmp file, after the tile header
+HEADER_READ = CONTAINER_HEADER.size + TILE_HEADER.size + DELTA_HEADER.size #enough for every fixed header
+# bytes after this header, scale, preview width, preview height, then one
+# block entry (offset 0) and the encoded top down r,g,b preview pixels
+PREVIEW_HEADER = struct.Struct("<IBII")
+RANS_SCALE_BITS = 14 #rans symbol frequencies add up to 1 << 14
+RANS_LOW = 1 << 23 #rans state stays in [RANS_LOW, RANS_LOW << 8) between symbols
+# run length tokens: 0x00-0x7F literal span of 1-128 bytes that follow,
+# 0x80-0xFF run of RLE_MIN_RUN + (token & 0x7F) copies of the next byte, with a
+# base-128 length extension in between when the low bits are all set
+RLE_MIN_RUN = 3
+RLE_RUNS = re.compile(rb'(.)\1{%d,}' % (RLE_MIN_RUN - 1), re.S)
+RLE_PLAIN, RLE_CODED = 0, 1 #first byte of every stream in FLAG_RLE files
+LZ_MIN_MATCH = 4 #shortest match worth a sequence, also the prefix the hash chains are keyed on
+LZ_MAX_WINDOW = (1 << 24) - 1 #distances are stored in 3 bytes
+LZ_WINDOW = 1 << 16 #default distance a match can reach back
+LZ_EFFORT = 5 #default effort level
+LZ_INSERT_LIMIT = 32 #positions inside matches up to this long go into the hash chains too
+# effort level -> chain steps per position, stop searching at this match length,
+# lazy matching, skip ahead faster through data without matches
+LZ_LEVELS = {1: (1, 16, False, True), 2: (2, 32, False, True), 3: (4, 64, False, True), 4: (8, 64, False, False),
+             5: (16, 128, True, False), 6: (32, 258, True, False), 7: (64, 1024, True, False),
+             8: (256, 4096, True, False), 9: (1024, 1 << 16, True, False)}
+# raw size and bit length of the literal, length and two distance streams of an lz77 block
+LZ_STREAM = struct.Struct("<IQ")
+# per row prediction filters, the number is stored in front of the row
+FILTER_NONE, FILTER_SUB, FILTER_UP, FILTER_AVERAGE, FILTER_PAETH, FILTER_MED = range(6)
+PREDICTORS = {"none": FILTER_NONE, "sub": FILTER_SUB, "up": FILTER_UP, "average": FILTER_AVERAGE,
+              "paeth": FILTER_PAETH, "med": FILTER_MED, "adaptive": None}
+# residual byte to its distance from zero, used to pick the adaptive filter
+RESIDUAL_COST = bytes(min(x, 256 - x) for x in range(256))
+MODE_SAMPLE_BYTES = 1 << 16 #pixel bytes looked at to pick predictor, layout and coder for coder="auto"
+MODE_SAMPLE_RUNS = 8 #the sample is this many runs of whole rows spread over the image
+MODE_MARGIN = 0.01 #a slower mode has to be estimated at least this much smaller to be picked
+# rough encode plus decode time of each coder, predictor and the rle stage, cheapest first
+MODE_COST = {"stored": 0, "huffman": 1, "rans": 3, "lz77": 5, "rle": 1, None: 0, "none": 0, "sub": 1, "up": 1,
+             "average": 2, "paeth": 4, "med": 6, "adaptive": 8}
+MODE_LZ_EFFORT = 3 #match search effort of the lz77 estimate for coder="auto"
 image = None
+POLL_MS = 100 #how often the viewer checks on background jobs
+SLIDER_MS = 30 #slider ticks within this long are drawn once, with the latest values
+PYRAMID_MIN = 32 #halving stops once the long side of the image is this small
+VIEW_CACHE_BYTES = 64 << 20 #memory budget for resized and brightness adjusted images
+pyramid = [] #the shown image at full size then halved again and again
+view_cache = OrderedDict() #(width, height, brightness) -> pixels, least recently used first
+view_cache_bytes = 0
+render_pending = None #after id of the queued render
+rendered = None #(scale, brightness, r, g, b) on screen
+job_queue = queue.Queue() #jobs waiting for the worker thread
+job_events = queue.Queue() #(job, event, value) from the worker, read on the tk thread
+active_jobs = [] #queued and running jobs, oldest first
+worker = None
+CACHE_MANIFEST = ".cmpt365_cache.json" #one per output folder: output name -> input hash, settings and stats
+DECODED_CACHE_BYTES = 256 << 20 #memory budget for decoded images kept for reopening
+decoded_cache = OrderedDict() #(path, size, mtime) -> (result, bytes), least recently used first
+decoded_cache_bytes = 0
+cache_lock = Lock()
+cache_counters = {"compress_hits": 0, "compress_misses": 0, "decoded_hits": 0, "decoded_misses": 0,
+                  "decoded_evictions": 0}
+profile_state = local() #the profile collecting stages on each thread
+profile_hooks = [] #hook(operation, stats) after every outermost compress or decompress call
+ARCHIVE_MAGIC = b'CMPTARC'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct("<7sB")
+ARCHIVE_TRAILER = struct.Struct("<QQ7s") #index offset, index size, magic again, always the last bytes
+ARCHIVE_INDEX = struct.Struct("<II") #member count, shared table count
+#offset, size, original file size, w, h, bpp, bmp header size, pixel data size, bitlength, table, name length
+ARCHIVE_ENTRY = struct.Struct("<QQIIIHIIQIH")
+ARCHIVE_FIELDS = ("offset", "size", "original_size", "width", "height", "bpp", "header_size", "pixel_data_size",
+                  "bitlength", "table")
+ARCHIVE_CONTAINER = 0xFFFFFFFF #table value of a member stored as a whole .cmpt365 file
+ARCHIVE_OWN_TABLE = 0xFFFFFFFE #table value of a member with its own compact huffman table in front
+ARCHIVE_SMALL = 1 << 16 #members with at most this many pixel bytes are one huffman stream
+ARCHIVE_TABLE_ROUNDS = 6 #times a shared table is rebuilt from just the members it helps
 
 def huffman_code(length_table):
 
@@ -43,8 +152,10 @@ def huffman_code(length_table):
 
     return huffman_codes
 
-def huffman_tree(frequency_table):
+def huffman_tree(frequency_table, max_length=None):
     # build tree by combining two lowest frequency nodes until one node left
+    if max_length is None:
+        max_length = MAX_CODE_LENGTH
     heap_tree = []
     return_list = [0] * 256
     # if pixel frequency is more than 0, add it to the heap
@@ -63,7 +174,6 @@ def huffman_tree(frequency_table):
         return return_list
     
     heapq.heapify(heap_tree)
-    parent_nodes={}
     child_nodes={}
     next = 256 # to not mixup with 0-255 pixel values
     while (len(heap_tree) > 1):
@@ -72,32 +182,78 @@ def huffman_tree(frequency_table):
         frequency2, node2 = heapq.heappop(heap_tree)
         parent_node = next
         next = next + 1
-        parent_nodes[node1] = parent_node
-        parent_nodes[node2] = parent_node
         child_nodes[parent_node] = (node1, node2)
         heapq.heappush(heap_tree, (frequency1 + frequency2, parent_node))
     
     root_node = heap_tree[0][1]
-    for x in range(256):
-        #height would be the code length
-
-        if frequency_table[x] > 0:
-            curr_node = x
-            height = 0
-            #traverse heap
-            while curr_node in parent_nodes:
-                height = height + 1
-                curr_node = parent_nodes[curr_node]
-            return_list[x] = height
+    #height would be the code length, one walk down from the root
+    stack = [(root_node, 0)]
+    while stack:
+        node, height = stack.pop()
+        if node < 256:
+            return_list[node] = height
+        else:
+            node1, node2 = child_nodes[node]
+            stack.append((node1, height + 1))
+            stack.append((node2, height + 1))
+
+    if max_length and max(return_list) > max_length:
+        #too deep, rebuild with the length limit
+        return package_merge(frequency_table, max_length)
+    return return_list
+
+def package_merge(frequency_table, max_length):
+    # optimal code lengths with no code longer than max_length
+    # a package is (weight, symbols in it), every level pairs up the cheapest
+    # packages and merges them back with the single symbols
+    symbols = sorted((y, x) for x, y in enumerate(frequency_table) if y > 0)
+    if (1 << max_length) < len(symbols):
+        raise ValueError(f"{len(symbols)} symbols do not fit in {max_length}-bit codes")
+    return_list = [0] * 256
+    if len(symbols) == 1:
+        return_list[symbols[0][1]] = 1
+        return return_list
+
+    leaves = [(y, (x,)) for y, x in symbols]
+    packages = leaves
+    for level in range(max_length - 1):
+        paired = [(packages[i][0] + packages[i + 1][0], packages[i][1] + packages[i + 1][1])
+                  for i in range(0, len(packages) - 1, 2)]
+        packages = list(heapq.merge(leaves, paired, key=lambda package: package[0]))
+
+    # every time a symbol shows up in the cheapest 2n - 2 packages its code gets one bit longer
+    for weight, members in packages[:2 * len(symbols) - 2]:
+        for x in members:
+            return_list[x] += 1
     return return_list
 
 def pixel_frequency_table(data_bytes):
     # get the frequency of each pixel value in an image
+    # without numpy this loop is still the fastest exact count (Counter,
+    # bytes.count per value and sorting were all measured slower)
     x = [0] * 256
     for pixel in data_bytes:
         x[pixel] += 1
     return x
 
+def add_frequency_tables(tables):
+    return [sum(column) for column in zip(*tables)]
+
+def entropy_bits(frequency_table):
+    # order-0 entropy of the counted bytes times their number
+    total = sum(frequency_table)
+    return sum(y * math.log2(total / y) for y in frequency_table if y)
+
+def table_bits(frequency_table, lengths):
+    #bits to code a histogram with the given code lengths, None if a used symbol has no code
+    bits = 0
+    for x, y in zip(frequency_table, lengths):
+        if x:
+            if not y:
+                return None
+            bits += x * y
+    return bits
+
 def check_is_bmp(bmp_bytes):
     return bmp_bytes[:2]
 
@@ -122,366 +278,2634 @@ def get_colour_table(bmp_bytes):
     return bmp_bytes[54:colour_table_index]
 
 def compress_bmp():
-    #time compression
-    start_time = time.time()
-    try:
-        file_path = file_path_entry.get()
-        if not file_path:
-            print("No file selected")
-            check_label.config(text="No file selected")
-            #stop time get ms
-            end_time = time.time()
-            return
-        with open(file_path, "rb") as f:
-            bmp_bytes = f.read()
-    except Exception as e:
-        print(f"BMP file not read {e}")
-        check_label.config(text="BMP file not read")
-        #stop time get ms
-        end_time = time.time()
-        return
-
-    if (check_is_bmp(bmp_bytes) != b'BM'):
-        print("Not a BMP file")
-        check_label.config(text="This is not a BMP file, retry")
-        #stop time get ms
-        end_time = time.time()
+    file_path = file_path_entry.get()
+    if not file_path:
+        print("No file selected")
+        check_label.config(text="No file selected")
         return
-    
-    #get all metadata
-    o_size = get_file_size(bmp_bytes)
-    w = get_width(bmp_bytes)
-    h = get_height(bmp_bytes)
-    bpp = get_bpp(bmp_bytes)
-    pixel_data = get_pixel_data(bmp_bytes)
-    colour_table = None
-    if (bpp == 1 or bpp == 4 or bpp == 8):
-        #no colour table if bpp is 24
-        colour_table = get_colour_table(bmp_bytes)
-    #get frequency table and huffman tree
-    frequency_table = pixel_frequency_table(pixel_data)
-    huff_tree = huffman_tree(frequency_table)
-
-    newpath = file_path.rsplit('.', 1)[0] + '.cmpt365'
-    #create .cmpt365 compressed file
-    if (colour_table == None):
-
-        new_bytes = file_type_creator(newpath, o_size,w, h, bpp, b'', pixel_data, huff_tree)
-    else:
-        new_bytes = file_type_creator(newpath, o_size,w, h, bpp, colour_table, pixel_data, huff_tree)
-    
-    #stop time get ms
-    end_time = time.time()
-    compression_time = (end_time - start_time) * 1000
+    submit_job(f"Compressing {os.path.basename(file_path)}", partial(compress_job, file_path, cache=cache_var.get()),
+               compressed)
 
-    try:
-        comp_size = os.path.getsize(newpath)
-    except:
-        comp_size = new_bytes
-    
-    comp_ratio = o_size / comp_size 
-    
-    check_label.config(text=f"Compression finished"
-                       f"\nOriginal Size: {o_size} bytes"
-                       f"\nCompressed Size: {comp_size} bytes"
-                       f"\nCompression Ratio: {comp_ratio:.4f}"
-                       f"\nTime: {compression_time:.2f} ms")
+def compressed(stats):
+    check_label.config(text=f"Compression finished{' (cached)' if stats.get('cached') else ''}"
+                       f"\nOriginal Size: {stats['original_size']} bytes"
+                       f"\nCompressed Size: {stats['compressed_size']} bytes"
+                       f"\nCompression Ratio: {stats['ratio']:.4f}"
+                       f"\nTime: {stats['time_ms']:.2f} ms")
 
 def huffman_encoding(data_bytes, huffman_codes):
-    buffer = 0
-    counter = 0
+    # ascii bit string of every code, symbols without a code stay None
+    code_bits = [None] * 256
+    for symbol, (coding, length) in huffman_codes.items():
+        code_bits[symbol] = format(coding, f'0{length}b').encode('ascii')
+
     output = bytearray()
-    for data in data_bytes:
-        # get the huffman code and length
-        coding, length = huffman_codes[data]
-
-        counter = counter + length
-        buffer = (buffer << length) | coding
-        # take a byte while buffer has 8 or more bits while keeping remaining bits
-        while counter >= 8:
-
-            x = counter - 8
-            byte = (buffer >> x) & 0xFF
-            output.append(byte)
-            buffer = buffer & ((1<< x) - 1)
-            counter = counter - 8
-    
-    if counter > 0:
-        byte = (buffer << (8 - counter)) & 0xFF
-        output.append(byte) #zero padding on right for last byte
-
-    tot = 0
-    value = [huffman_codes[y][1] for y in data_bytes]
-    for x in value:
-        tot = tot + x
-    
-    #get total bit length
     bitlength = 0
-    for x in data_bytes:
-        bitlength = bitlength + huffman_codes[x][1]
+    carry = b''
+    for start in range(0, len(data_bytes), ENCODE_CHUNK):
+        # the charmap codec looks up and joins the codes of a whole chunk in C,
+        # with latin-1 every byte becomes the character with the same number
+        chunk = str(data_bytes[start:start + ENCODE_CHUNK], 'latin-1')
+        bits = codecs.charmap_encode(chunk, 'strict', code_bits)[0]
+        bitlength = bitlength + len(bits)
+        bits = carry + bits
+        # write whole bytes and keep the remaining bits for the next chunk
+        whole = len(bits) - len(bits) % 8
+        if whole:
+            output += int(bits[:whole], 2).to_bytes(whole // 8, 'big')
+        carry = bits[whole:]
+
+    if carry:
+        output += (int(carry, 2) << (8 - len(carry))).to_bytes(1, 'big') #zero padding on right for last byte
     return bytes(output), bitlength
 
 def decompress():
-    path = tk.filedialog.askopenfilename()
-    if not path:
+    #several files can be picked, they are decoded one after the other
+    paths = tk.filedialog.askopenfilenames()
+    if not paths:
         return
     file_path_entry.delete(0, tk.END)
-    file_path_entry.insert(0, path)
-    try:
-        metadata = read_special_file(path)
-    except Exception:
-        print("Not a .cmpt365 file")
-        check_label.config(text="Not a .cmpt365 file")
-        return
-    #get compressed metadata
-    lengths = metadata["lengths"]
-    bitlength = metadata["bitlength"]
-    compressed_bytes = metadata["encoded_bytes"]
-
-    #decompress the huffman encoding and get original pixel bytes
-    pixel_data = huffman_decoding(compressed_bytes, bitlength, lengths)
-    
-    w = metadata["width"]
-    h = metadata["height"]
-    bpp = metadata["bpp"]
-    colour_table = metadata["colour_table"] if metadata["colour_table"] else None
-    
-    try:
-        #display the image after decompressing
-        img = display_compressed_image(pixel_data, colour_table, w, h, bpp)
-    except Exception:
-        print("Decompression failed")
-        check_label.config(text="Decompression failed")
-        return
-    
-    global image
-    if image: #refresh
-        image.destroy()
-    image = tk.Label(root, image = img)
-    image.image = img
-    image.grid(row=3, column=1)
-
+    file_path_entry.insert(0, paths[-1])
+    for path in paths:
+        submit_job(f"Decompressing {os.path.basename(path)}", partial(decompress_job, path), decompressed,
+                   show_preview)
+
+def show_preview(pixels):
+    place_image(photo_image(pixels.data, pixels.width, pixels.height))
+    check_label.config(text="Showing preview, decoding...")
+
+def decompressed(result):
+    display_header_metadata(result["size"], result["width"], result["height"], result["bpp"])
+    show_pixels(result["pixels"], result["levels"])
     check_label.config(text= f"Decompression complete!\n"
-                       f'Decompressed Size: {metadata["original_file_size"]} bytes')
-
-
-def huffman_decoding(encoded_bytes, bitlength, lengths):
-    #huffman code from lengths
+                       f'Decompressed Size: {result["size"]} bytes')
+
+def huffman_decode_subtable(codes, consumed, width):
+    # lookup table indexed by the next width bits after the consumed prefix
+    # entries are (symbol bytes, code length) or (None, sub table, sub width)
+    table = [(None, None, 0)] * (1 << width)
+    overflow = {}
+    for symbol, code, length in codes:
+        rest = length - consumed
+        if rest <= width:
+            # every index starting with this code decodes to the symbol
+            start = (code & ((1 << rest) - 1)) << (width - rest)
+            entry = (bytes([symbol]), length)
+            for i in range(start, start + (1 << (width - rest))):
+                table[i] = entry
+        else:
+            prefix = (code >> (rest - width)) & ((1 << width) - 1)
+            overflow.setdefault(prefix, []).append((symbol, code, length))
+    # long codes go to overflow tables keyed by their first width bits
+    for prefix, long_codes in overflow.items():
+        sub_width = min(max(l for s, c, l in long_codes) - consumed - width, HUFFMAN_TABLE_BITS)
+        sub_table = huffman_decode_subtable(long_codes, consumed + width, sub_width)
+        table[prefix] = (None, sub_table, sub_width)
+    return table
+
+def huffman_decode_table(lengths, table_bits=None):
+    #precomputed tables for decoding several bits per step
+    if table_bits is None:
+        table_bits = HUFFMAN_TABLE_BITS
     huffman_codes = huffman_code(lengths)
     if not huffman_codes:
+        return None
+    codes = [(symbol, c, l) for symbol, (c, l) in huffman_codes.items()]
+    max_length = max(l for s, c, l in codes)
+    bits = min(table_bits, max_length)
+    single = huffman_decode_subtable(codes, 0, bits)
+
+    # primary table entries hold every complete symbol inside the window
+    # so one lookup can output more than one pixel
+    mask = (1 << bits) - 1
+    primary = []
+    for index in range(1 << bits):
+        entry = single[index]
+        if entry[0] is None:
+            #code longer than the window or not a valid code
+            primary.append(entry)
+            continue
+        symbols = bytearray()
+        used = 0
+        while True:
+            entry = single[(index << used) & mask]
+            if entry[0] is None or used + entry[1] > bits:
+                break
+            symbols += entry[0]
+            used = used + entry[1]
+        primary.append((bytes(symbols), used))
+    return bits, primary, max_length
+
+def huffman_decoding(encoded_bytes, bitlength, lengths, decode_table=None):
+    if decode_table is None:
+        decode_table = huffman_decode_table(lengths)
+    if decode_table is None:
         return b''
-    
-    #(code, length) gets a symbol
-    decoded={}
-    for index, (c, l) in huffman_codes.items():
-        decoded[(c, l)] = index
+    bits, primary, max_length = decode_table
+    mask = (1 << bits) - 1
+
+    # read the stream as big endian 32-bit words, zero padded at the end
+    data = bytes(encoded_bytes)
+    data = data + bytes(8 - len(data) % 4)
+    words = array.array('I')
+    words.frombytes(data)
+    if sys.byteorder == 'little':
+        words.byteswap()
 
     output = bytearray()
-    value = 0
-    length = 0
-    num_read = 0
-    tot_bits = bitlength
-    #go through every byte in the encoded bytes
-    for x in encoded_bytes:
-        for y in range(8):
-            if num_read >= tot_bits:
-                #break if the total bit length is reached
-                break
-            #Get most significant bit first
-            b = (x >> (7 - y)) & 0x01
-            value = (value << 1) | b
-            num_read = num_read + 1
-            length = length + 1
-            index = (value, length)
-
-            #check if it is valid
-            if index in decoded:
-                output.append(decoded[index])
-                value = 0
-                length = 0
-            
-        if num_read >= tot_bits:
+    buffer = 0
+    counter = 0
+    word = 0
+    pos = 0
+    # every bit inside the window is real data until the last max_length bits
+    limit = bitlength - max_length
+    while pos <= limit:
+        while counter < max_length:
+            buffer = ((buffer & ((1 << counter) - 1)) << 32) | words[word]
+            word = word + 1
+            counter = counter + 32
+        entry = primary[(buffer >> (counter - bits)) & mask]
+        symbols = entry[0]
+        if symbols is None:
+            symbols, length = huffman_long_code(buffer, counter, bits, entry)
+        else:
+            length = entry[1]
+        output += symbols
+        pos = pos + length
+        counter = counter - length
+
+    #decode the tail one symbol at a time
+    while pos < bitlength:
+        while counter < max_length and word < len(words):
+            buffer = ((buffer & ((1 << counter) - 1)) << 32) | words[word]
+            word = word + 1
+            counter = counter + 32
+        entry = primary[(buffer >> (counter - bits)) & mask]
+        if entry[0] is None:
+            symbols, length = huffman_long_code(buffer, counter, bits, entry)
+        else:
+            symbols = entry[0][:1]
+            length = lengths[symbols[0]]
+        if pos + length > bitlength:
             break
+        output += symbols
+        pos = pos + length
+        counter = counter - length
     return bytes(output)
 
-def read_special_file(filepath, update_label=True):
-    with open (filepath, "rb") as f:
-        cmpt365_bytes = f.read()
-    
-    if (cmpt365_bytes[:7] != file_type):
-        print("Not a CMPT365 file")
-        if update_label:
-            check_label.config(text="This is not a CMPT365 file, retry")
-    else:
-        print("This is a CMPT365 file")
-        if update_label:
-            check_label.config(text="CMPT365 file check successful")
-    #read metadata
-    original_file_size = int.from_bytes(cmpt365_bytes[7:11], 'little')
-
-    w = int.from_bytes(cmpt365_bytes[11:15], 'little')
-    h = int.from_bytes(cmpt365_bytes[15:19], 'little')
-    bpp = int.from_bytes(cmpt365_bytes[19:21], 'little')
-    colour_size = int.from_bytes(cmpt365_bytes[21:25], 'little')
-    pixel_data_size = int.from_bytes(cmpt365_bytes[25:29], 'little')
-   
-    #get colour table
-    colour_table = None
-    if colour_size > 0:
-        colour_table = cmpt365_bytes[29:29 + colour_size]
-    
-    byte_pos = 29 + colour_size
-    pixel_data = cmpt365_bytes[byte_pos:byte_pos + pixel_data_size]
-    
-    lengths = []
- 
-    for i in range(256):
-        lengths.append(cmpt365_bytes[byte_pos])
-        byte_pos += 1
+def huffman_long_code(buffer, counter, consumed, entry):
+    # walk the overflow tables for codes longer than the primary window
+    while entry[0] is None:
+        sub_table, sub_width = entry[1], entry[2]
+        if sub_table is None:
+            raise ValueError("Invalid huffman code")
+        entry = sub_table[(buffer >> (counter - consumed - sub_width)) & ((1 << sub_width) - 1)]
+        consumed = consumed + sub_width
+    return entry[0], entry[1]
+
+def rans_frequencies(frequency_table):
+    # scale the counts so they add up to 1 << RANS_SCALE_BITS, used symbols keep at least 1
+    total = sum(frequency_table)
+    return_list = [0] * 256
+    if not total:
+        return return_list
+    scale = 1 << RANS_SCALE_BITS
+    for x, y in enumerate(frequency_table):
+        if y > 0:
+            return_list[x] = max(1, y * scale // total)
+    # rounding error goes to (or comes from) the most frequent symbols
+    extra = scale - sum(return_list)
+    while extra:
+        x = max(range(256), key=return_list.__getitem__)
+        if extra > 0:
+            return_list[x] += extra
+            break
+        return_list[x] -= 1
+        extra += 1
+    return return_list
 
-    #read bit length
-    
-    bitlength = int.from_bytes(cmpt365_bytes[byte_pos:byte_pos + 8], 'little')
-    byte_pos += 8
+def rans_table_bytes(frequencies):
+    # bitmap of the used symbols, then frequency - 1 of each one in 1 byte (< 0x80) or 2 bytes
+    bitmap = 0
+    output = bytearray()
+    for x, y in enumerate(frequencies):
+        if y > 0:
+            bitmap |= 1 << x
+            y -= 1
+            if y < 0x80:
+                output.append(y)
+            else:
+                output += bytes([0x80 | (y >> 8), y & 0xFF])
+    return bitmap.to_bytes(32, 'little') + bytes(output)
+
+def parse_rans_table(encoded_bytes):
+    #frequencies and the position the rans stream starts at
+    if len(encoded_bytes) < 32:
+        raise ValueError("Corrupt CMPT365 file")
+    bitmap = int.from_bytes(encoded_bytes[:32], 'little')
+    frequencies = [0] * 256
+    pos = 32
+    try:
+        for x in range(256):
+            if (bitmap >> x) & 1:
+                y = encoded_bytes[pos]
+                pos += 1
+                if y & 0x80:
+                    y = ((y & 0x7F) << 8) | encoded_bytes[pos]
+                    pos += 1
+                frequencies[x] = y + 1
+    except IndexError:
+        raise ValueError("Corrupt CMPT365 file") from None
+    return frequencies, pos
+
+def rans_encoding(data_bytes, frequencies):
+    # symbols go in back to front so the decoder can read front to back
+    starts = [0] * 256
+    start = 0
+    for x, y in enumerate(frequencies):
+        starts[x] = start
+        start += y
+    # the state has to be below limit before a symbol can be pushed
+    limits = [((RANS_LOW >> RANS_SCALE_BITS) << 8) * y for y in frequencies]
+    output = bytearray()
+    state = RANS_LOW
+    for pixel in reversed(data_bytes):
+        limit = limits[pixel]
+        while state >= limit:
+            output.append(state & 0xFF)
+            state >>= 8
+        q, r = divmod(state, frequencies[pixel])
+        state = (q << RANS_SCALE_BITS) + r + starts[pixel]
+    output += state.to_bytes(4, 'little')
+    output.reverse()
+    return bytes(output)
 
-    # read encoded bytes
-    encoded_bytes = cmpt365_bytes[byte_pos:]
+def rans_decoding(encoded_bytes, raw_size, frequencies):
+    if not raw_size:
+        return b''
+    scale = 1 << RANS_SCALE_BITS
+    if sum(frequencies) != scale:
+        raise ValueError("Corrupt CMPT365 file")
+    # one entry per slot of the scaled range: symbol, its frequency, slot - symbol start
+    symbols = bytearray()
+    slot_frequency = []
+    bias = []
+    for x, y in enumerate(frequencies):
+        symbols += bytes([x]) * y
+        slot_frequency += [y] * y
+        bias += range(y)
+    if len(encoded_bytes) < 4:
+        raise ValueError("Corrupt CMPT365 file")
+    top = max(frequencies)
+    if top == scale:
+        #only one symbol, the state never changes
+        return bytes(symbols[:1]) * raw_size
+    #every symbol grows the encoder state by at least scale / top (less what the floor loses at the lowest
+    #state), so the payload bits put a cap on the symbol count that is checked before allocating the output
+    symbol_bits = math.log2(scale / top - (scale - top) / RANS_LOW)
+    if raw_size * symbol_bits > 8 * len(encoded_bytes) + 64:
+        raise ValueError("Corrupt CMPT365 file")
+
+    mask = scale - 1
+    state = int.from_bytes(encoded_bytes[:4], 'big')
+    pos = 4
+    output = bytearray(raw_size)
+    try:
+        for i in range(raw_size):
+            slot = state & mask
+            output[i] = symbols[slot]
+            state = slot_frequency[slot] * (state >> RANS_SCALE_BITS) + bias[slot]
+            while state < RANS_LOW:
+                state = (state << 8) | encoded_bytes[pos]
+                pos += 1
+    except IndexError:
+        raise ValueError("Corrupt CMPT365 file") from None
+    return bytes(output)
+
+def huffman_block_encoding(data_bytes):
+    #the code lengths go in front of the stream as a compact table, the bit length counts them too
+    with stage("frequency", len(data_bytes), len(data_bytes)):
+        frequency_table = pixel_frequency_table(data_bytes)
+    with stage("tree", symbols=256 - frequency_table.count(0)):
+        lengths = huffman_tree(frequency_table)
+    table_bytes = huffman_table_bytes(lengths)
+    with stage("huffman", len(data_bytes), len(data_bytes)) as record:
+        encoded_bytes, bitlength = huffman_encoding(data_bytes, huffman_code(lengths))
+        record["bytes_out"] = len(table_bytes) + len(encoded_bytes)
+    return [], 8 * len(table_bytes) + bitlength, table_bytes + encoded_bytes
+
+def huffman_block_decoding(encoded_bytes, bitlength, table, raw_size):
+    lengths, pos = parse_huffman_table(encoded_bytes, 0)
+    bitlength -= 8 * pos
+    if bitlength < 0 or 8 * (len(encoded_bytes) - pos) < bitlength:
+        raise ValueError("Corrupt CMPT365 file")
+    return huffman_decoding(encoded_bytes[pos:], bitlength, lengths)
+
+def rans_block_encoding(data_bytes):
+    #the frequency table is small once packed, so it goes in front of the stream
+    with stage("frequency", len(data_bytes), len(data_bytes)):
+        frequencies = rans_frequencies(pixel_frequency_table(data_bytes))
+    with stage("rans", len(data_bytes), len(data_bytes)) as record:
+        encoded_bytes = rans_table_bytes(frequencies) + rans_encoding(data_bytes, frequencies)
+        record["bytes_out"] = len(encoded_bytes)
+    return [], 8 * len(encoded_bytes), encoded_bytes
+
+def rans_block_decoding(encoded_bytes, bitlength, table, raw_size):
+    frequencies, pos = parse_rans_table(encoded_bytes)
+    return rans_decoding(encoded_bytes[pos:], raw_size, frequencies)
+
+def huffman_table_bytes(lengths):
+    # bitmap of the used symbols, then their code lengths two to a byte
+    bitmap = 0
+    used = []
+    for x, y in enumerate(lengths):
+        if y:
+            bitmap |= 1 << x
+            used.append(y)
+    if len(used) % 2:
+        used.append(0)
+    return bitmap.to_bytes(32, 'little') + bytes(used[i] << 4 | used[i + 1] for i in range(0, len(used), 2))
+
+def parse_huffman_table(encoded_bytes, pos):
+    #code lengths and the position after the table
+    if len(encoded_bytes) < pos + 32:
+        raise ValueError("Corrupt CMPT365 file")
+    bitmap = int.from_bytes(encoded_bytes[pos:pos + 32], 'little')
+    symbols = [x for x in range(256) if (bitmap >> x) & 1]
+    packed = encoded_bytes[pos + 32:pos + 32 + (len(symbols) + 1) // 2]
+    if len(packed) != (len(symbols) + 1) // 2:
+        raise ValueError("Corrupt CMPT365 file")
+    lengths = [0] * 256
+    for i, x in enumerate(symbols):
+        lengths[x] = (packed[i // 2] >> 4) if i % 2 == 0 else (packed[i // 2] & 0x0F)
+    return lengths, pos + 32 + len(packed)
+
+def match_length(data_bytes, a, b, limit):
+    #common prefix of data_bytes[a:] and data_bytes[b:], compared in slices that grow while they match
+    length = 0
+    step = 8
+    while length < limit:
+        step = min(step, limit - length)
+        if data_bytes[a + length:a + length + step] == data_bytes[b + length:b + length + step]:
+            length += step
+            step <<= 1
+        elif step > 1:
+            step >>= 1
+        else:
+            break
+    return length
+
+def lz77_sequences(data_bytes, window=LZ_WINDOW, effort=LZ_EFFORT):
+    # (literal run, match length, distance) for every match, hash chains over
+    # LZ_MIN_MATCH byte prefixes find the candidates
+    steps, nice, lazy, accelerate = LZ_LEVELS[effort]
+    head = {}
+    chain = array.array('l', [-1]) * len(data_bytes)
+    sequences = []
+    end = len(data_bytes) - LZ_MIN_MATCH
+    inserted = 0 #positions below this are in the chains
+    literal_start = 0
+    misses = 0
+
+    def longest(pos):
+        #longest match for pos among the chained earlier positions, pos is chained as well
+        nonlocal inserted
+        key = data_bytes[pos:pos + LZ_MIN_MATCH]
+        candidate = head.get(key, -1)
+        head[key] = pos
+        chain[pos] = candidate
+        inserted = pos + 1
+        best_length = best_distance = 0
+        limit = len(data_bytes) - pos
+        for i in range(steps):
+            if candidate < 0 or pos - candidate > window:
+                break
+            #a longer match has to agree on the byte just past the best one
+            if best_length < limit and data_bytes[candidate + best_length] == data_bytes[pos + best_length]:
+                length = match_length(data_bytes, candidate, pos, limit)
+                if length > best_length:
+                    best_length, best_distance = length, pos - candidate
+                    if length >= nice:
+                        break
+            candidate = chain[candidate]
+        return best_length, best_distance
+
+    pos = 0
+    while pos <= end:
+        length, distance = longest(pos)
+        if length < LZ_MIN_MATCH:
+            misses += 1
+            pos += 1 + (misses >> 6 if accelerate else 0)
+            continue
+        misses = 0
+        if lazy and length < nice and pos < end:
+            #a longer match one byte later wins over this one
+            next_length, next_distance = longest(pos + 1)
+            if next_length > length:
+                pos += 1
+                length, distance = next_length, next_distance
+        sequences.append((pos - literal_start, length, distance))
+        if length <= LZ_INSERT_LIMIT:
+            for i in range(max(inserted, pos + 1), min(pos + length, end + 1)):
+                key = data_bytes[i:i + LZ_MIN_MATCH]
+                chain[i] = head.get(key, -1)
+                head[key] = i
+        pos += length
+        literal_start = pos
+    return sequences, literal_start
+
+def lz77_length(output, length):
+    #one byte below 255, else 255 and four bytes
+    if length < 0xFF:
+        output.append(length)
+    else:
+        output.append(0xFF)
+        output += length.to_bytes(4, 'little')
+
+def lz77_streams(data_bytes, window=LZ_WINDOW, effort=LZ_EFFORT):
+    # literals, lengths (literal run then match length of every sequence, then
+    # the trailing literal run) and distances low byte / upper two bytes
+    sequences, tail = lz77_sequences(data_bytes, window, effort)
+    literals = []
+    lengths = bytearray()
+    distance_low = bytearray()
+    distance_high = bytearray()
+    pos = 0
+    for run, length, distance in sequences:
+        literals.append(data_bytes[pos:pos + run])
+        lz77_length(lengths, run)
+        lz77_length(lengths, length - LZ_MIN_MATCH)
+        distance -= 1
+        distance_low.append(distance & 0xFF)
+        distance_high += (distance >> 8).to_bytes(2, 'little')
+        pos += run + length
+    literals.append(data_bytes[tail:])
+    lz77_length(lengths, len(data_bytes) - tail)
+    return b''.join(literals), bytes(lengths), bytes(distance_low), bytes(distance_high)
+
+def lz77_block_encoding(data_bytes, window=LZ_WINDOW, effort=LZ_EFFORT):
+    #the four streams each get their own huffman table like deflate's
+    output = bytearray()
+    for stream in lz77_streams(data_bytes, window, effort):
+        table, bitlength, encoded_bytes = huffman_block_encoding(stream)
+        output += LZ_STREAM.pack(len(stream), bitlength) + encoded_bytes
+    return [], 8 * len(output), bytes(output)
+
+def lz77_block_decoding(encoded_bytes, bitlength, table, raw_size):
+    streams = []
+    pos = 0
+    for i in range(4):
+        if len(encoded_bytes) < pos + LZ_STREAM.size:
+            raise ValueError("Corrupt CMPT365 file")
+        size, bits = LZ_STREAM.unpack_from(encoded_bytes, pos)
+        pos += LZ_STREAM.size
+        encoded = encoded_bytes[pos:pos + (bits + 7) // 8]
+        if len(encoded) != (bits + 7) // 8:
+            raise ValueError("Corrupt CMPT365 file")
+        stream = huffman_block_decoding(encoded, bits, [], size)
+        if len(stream) != size:
+            raise ValueError("Corrupt CMPT365 file")
+        streams.append(stream)
+        pos += (bits + 7) // 8
+    literals, lengths, distance_low, distance_high = streams
+
+    # literal runs and copies from what is already decoded
+    output = bytearray()
+    literal = 0
+    pos = 0
+    try:
+        for i in range(len(distance_low) + 1):
+            run = lengths[pos]
+            pos += 1
+            if run == 0xFF:
+                run = int.from_bytes(lengths[pos:pos + 4], 'little')
+                pos += 4
+            output += literals[literal:literal + run]
+            literal += run
+            if i == len(distance_low):
+                break
+            length = lengths[pos]
+            pos += 1
+            if length == 0xFF:
+                length = int.from_bytes(lengths[pos:pos + 4], 'little')
+                pos += 4
+            length += LZ_MIN_MATCH
+            distance = (distance_low[i] | distance_high[2 * i] << 8 | distance_high[2 * i + 1] << 16) + 1
+            start = len(output) - distance
+            if start < 0 or len(output) + length > raw_size:
+                raise IndexError
+            if distance >= length:
+                output += output[start:start + length]
+            else:
+                #overlapping copy, the last distance bytes repeat
+                output += (output[start:] * (length // distance + 1))[:length]
+    except IndexError:
+        raise ValueError("Corrupt CMPT365 file") from None
+    if literal != len(literals) or pos != len(lengths):
+        raise ValueError("Corrupt CMPT365 file")
+    return bytes(output)
+
+def check_lz_options(effort, window):
+    if effort not in LZ_LEVELS:
+        raise ValueError(f"LZ77 effort has to be 1-{max(LZ_LEVELS)}, not {effort}")
+    if not 1 <= window <= LZ_MAX_WINDOW:
+        raise ValueError(f"LZ77 window has to be 1-{LZ_MAX_WINDOW} bytes, not {window}")
+
+def stored_block_encoding(data_bytes):
+    #incompressible data is kept as it is
+    return [], 8 * len(data_bytes), bytes(data_bytes)
+
+def stored_block_decoding(encoded_bytes, bitlength, table, raw_size):
+    return bytes(encoded_bytes[:raw_size])
+
+# entropy coders for the block container, the id is stored in the header flags
+# and table is the layout of the per block table kept in the block index
+EntropyCoder = namedtuple("EntropyCoder", ["coder_id", "table", "encode", "decode"])
+ENTROPY_CODERS = {
+    "huffman": EntropyCoder(0, struct.Struct(""), huffman_block_encoding, huffman_block_decoding),
+    "rans": EntropyCoder(1, struct.Struct(""), rans_block_encoding, rans_block_decoding),
+    "stored": EntropyCoder(2, struct.Struct(""), stored_block_encoding, stored_block_decoding),
+    "lz77": EntropyCoder(3, struct.Struct(""), lz77_block_encoding, lz77_block_decoding)
+}
+CODER_NAMES = {coder.coder_id: name for name, coder in ENTROPY_CODERS.items()}
+
+def map_file(f):
+    #read only view of an open file, pages are only read when something touches them
+    try:
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except ValueError:
+        #empty files can't be mapped
+        return memoryview(b'')
+
+def read_special_file(filepath):
+    #byte strings in the result are views into the mapped file, nothing is copied until decoding
+    with open(filepath, "rb") as f:
+        return parse_special_file(map_file(f))
+
+def parse_special_file(cmpt365_bytes):
+    cmpt365_bytes = memoryview(cmpt365_bytes)
+    if cmpt365_bytes[:7] != file_type:
+        raise ValueError("Not a CMPT365 file")
+    if int.from_bytes(cmpt365_bytes[7:11], 'little') == CONTAINER_ESCAPE:
+        return parse_block_file(cmpt365_bytes)
+    if len(cmpt365_bytes) < V1_HEADER.size:
+        raise ValueError("Truncated CMPT365 file")
+    #read metadata
+    magic, original_file_size, w, h, bpp, colour_size, pixel_data_size = V1_HEADER.unpack_from(cmpt365_bytes)
+    byte_pos = V1_HEADER.size
+    lengths_pos = byte_pos + colour_size
+    payload_pos = lengths_pos + 256 + V1_BITLENGTH.size
+    if len(cmpt365_bytes) < payload_pos:
+        raise ValueError("Truncated CMPT365 file")
+    bitlength, = V1_BITLENGTH.unpack_from(cmpt365_bytes, lengths_pos + 256)
+    if len(cmpt365_bytes) - payload_pos < (bitlength + 7) // 8:
+        raise ValueError("Truncated CMPT365 file")
 
     return {
+        "version": 1,
         "original_file_size": original_file_size,
         "width": w,
         "height": h,
         "bpp": bpp,
-        "colour_table": colour_table,
-        "pixel_data": pixel_data,
-        "lengths": lengths,
+        "colour_table": cmpt365_bytes[byte_pos:lengths_pos] if colour_size else None,
+        "pixel_data_size": pixel_data_size,
+        "lengths": V1_LENGTHS.unpack_from(cmpt365_bytes, lengths_pos),
         "bitlength": bitlength,
-        "encoded_bytes": encoded_bytes
+        "encoded_bytes": cmpt365_bytes[payload_pos:payload_pos + (bitlength + 7) // 8]
     }
 
-def file_type_creator(filepath, original_file_size, w, h, bpp, colour_table, pixel_data, lengths):
-    huffman_codes = huffman_code(lengths)
-    size = 293
-    #encode
-    encoded_bytes, bitlength = huffman_encoding(pixel_data, huffman_codes)
-    #write metadata for .CMPT365 file
-    with open(filepath, "wb") as f:
-        f.write(file_type) #.CMPT365 file 7 bytes
-        f.write(struct.pack("<I", original_file_size)) #4 bytes
-        f.write(struct.pack("<I", w)) #4 bytes
-        f.write(struct.pack("<I", h)) #4 bytes
-        f.write(struct.pack("<H", bpp)) #2 
-        colour_size = 0
-        if colour_table is not None:
-            colour_size = len(colour_table)
-        f.write(struct.pack("<I", colour_size))
-        f.write(struct.pack("<I", len(pixel_data)))
-        if colour_size:
-            f.write(colour_table) 
-        
-        for x in lengths:
-            f.write(struct.pack("<B", x)) #256 bytes
-        
-        f.write(struct.pack("<Q", bitlength)) #8 bytes
-        f.write(encoded_bytes)
-    
-    return len(encoded_bytes) + size + colour_size
-        
+def parse_block_header(cmpt365_bytes):
+    #fixed header of a versioned file
+    if len(cmpt365_bytes) < CONTAINER_HEADER.size:
+        raise ValueError("Truncated CMPT365 file")
+    (magic, escape, version, flags, original_file_size, w, h, bpp, header_size,
+     pixel_data_size, block_rows, block_count) = CONTAINER_HEADER.unpack_from(cmpt365_bytes)
+    if magic != file_type or escape != CONTAINER_ESCAPE:
+        raise ValueError("Not a CMPT365 file")
+    if version != CONTAINER_VERSION or flags & ~KNOWN_FLAGS:
+        raise ValueError(f"Unsupported CMPT365 version {version}")
+    header_end = CONTAINER_HEADER.size
+    tile_width = w
+    if flags & FLAG_TILED:
+        if len(cmpt365_bytes) < header_end + TILE_HEADER.size:
+            raise ValueError("Truncated CMPT365 file")
+        tile_width, = TILE_HEADER.unpack_from(cmpt365_bytes, header_end)
+        header_end += TILE_HEADER.size
+        if not tile_width or tile_width % TILE_ALIGN or tile_width >= w:
+            raise ValueError("Corrupt CMPT365 file")
+    reference_hash = None
+    if flags & FLAG_DELTA:
+        if len(cmpt365_bytes) < header_end + DELTA_HEADER.size:
+            raise ValueError("Truncated CMPT365 file")
+        reference_hash, = DELTA_HEADER.unpack_from(cmpt365_bytes, header_end)
+        header_end += DELTA_HEADER.size
+    group = PLANE_COUNT if flags & FLAG_PLANAR else 1
+    if (flags & FLAG_PLANAR and bpp != 24) or not 1 <= block_rows <= max(h, 1):
+        raise ValueError("Corrupt CMPT365 file")
+    #the writer cuts the pixel data into bands of block_rows rows, every band has the same tiles and planes
+    block_bytes = block_rows * max(((bpp * w + 31) // 32) * 4, 1)
+    bands = (pixel_data_size + block_bytes - 1) // block_bytes
+    columns = (w + tile_width - 1) // tile_width if tile_width else 1
+    if block_count != bands * group * columns:
+        raise ValueError("Corrupt CMPT365 file")
+    coder = CODER_NAMES.get((flags & CODER_MASK) >> CODER_SHIFT)
+    if coder is None:
+        raise ValueError(f"Unsupported CMPT365 entropy coder {(flags & CODER_MASK) >> CODER_SHIFT}")
+    return {
+        "version": version,
+        "flags": flags,
+        "original_file_size": original_file_size,
+        "width": w,
+        "height": h,
+        "bpp": bpp,
+        "header_size": header_size,
+        "pixel_data_size": pixel_data_size,
+        "block_rows": block_rows,
+        "block_count": block_count,
+        "tile_width": tile_width,
+        "reference_hash": reference_hash,
+        "header_end": header_end,
+        "coder": coder,
+        "index_size": block_count * (BLOCK_ENTRY.size + ENTROPY_CODERS[coder].table.size)
+    }
 
+def parse_block_index(index_bytes, block_count, coder="huffman", limit=None):
+    #limit is the biggest raw size an entry can have, a corrupt index can't ask for more
+    table_struct = ENTROPY_CODERS[coder].table
+    if len(index_bytes) < block_count * (BLOCK_ENTRY.size + table_struct.size):
+        raise ValueError("Truncated CMPT365 file")
+    blocks = []
+    byte_pos = 0
+    for i in range(block_count):
+        raw_size, bitlength, offset = BLOCK_ENTRY.unpack_from(index_bytes, byte_pos)
+        byte_pos += BLOCK_ENTRY.size
+        if limit is not None and raw_size > limit:
+            raise ValueError("Corrupt CMPT365 file")
+        table = list(table_struct.unpack_from(index_bytes, byte_pos))
+        byte_pos += table_struct.size
+        blocks.append({
+            "raw_size": raw_size,
+            "table": table,
+            "bitlength": bitlength,
+            "offset": offset
+        })
+    return blocks
+
+def parse_block_file(cmpt365_bytes):
+    metadata = parse_block_header(cmpt365_bytes)
+    byte_pos = metadata["header_end"]
+    #the header is small and gets joined to the pixels later, so it is the one copy
+    bmp_header = bytes(cmpt365_bytes[byte_pos:byte_pos + metadata["header_size"]])
+    byte_pos += metadata["header_size"]
+    if len(bmp_header) != metadata["header_size"]:
+        raise ValueError("Truncated CMPT365 file")
+    metadata["preview"] = None
+    if metadata["flags"] & FLAG_PREVIEW:
+        metadata["preview"] = parse_preview(cmpt365_bytes, byte_pos, metadata["coder"])
+        byte_pos += metadata["preview"]["size"]
+    blocks = parse_block_index(cmpt365_bytes[byte_pos:byte_pos + metadata["index_size"]], metadata["block_count"],
+                               metadata["coder"], band_limit(metadata))
+    payload_pos = byte_pos + metadata["index_size"]
+
+    for block in blocks:
+        start = payload_pos + block["offset"]
+        block["encoded_bytes"] = cmpt365_bytes[start:start + (block["bitlength"] + 7) // 8]
+        if len(block["encoded_bytes"]) != (block["bitlength"] + 7) // 8:
+            raise ValueError("Truncated CMPT365 file")
 
-def display_compressed_image(pixel_data, colour_table, w, h, bpp):
+    colour_table = None
+    if metadata["bpp"] in (1, 4, 8):
+        colour_table = get_colour_table(bmp_header) or None
+    metadata["colour_table"] = colour_table
+    metadata["bmp_header"] = bmp_header
+    metadata["blocks"] = blocks
+    return metadata
+
+def parse_preview(cmpt365_bytes, byte_pos, coder="huffman"):
+    # preview entry at byte_pos, its bytes are sliced out but not decoded
+    if len(cmpt365_bytes) < byte_pos + PREVIEW_HEADER.size:
+        raise ValueError("Truncated CMPT365 file")
+    section_size, scale, w, h = PREVIEW_HEADER.unpack_from(cmpt365_bytes, byte_pos)
+    entry_pos = byte_pos + PREVIEW_HEADER.size
+    preview = parse_block_index(cmpt365_bytes[entry_pos:entry_pos + section_size], 1, coder, w * h * 3)[0]
+    start = entry_pos + BLOCK_ENTRY.size + ENTROPY_CODERS[coder].table.size + preview["offset"]
+    preview["encoded_bytes"] = cmpt365_bytes[start:start + (preview["bitlength"] + 7) // 8]
+    if len(preview["encoded_bytes"]) != (preview["bitlength"] + 7) // 8:
+        raise ValueError("Truncated CMPT365 file")
+    preview.update(scale=scale, width=w, height=h, size=PREVIEW_HEADER.size + section_size)
+    return preview
+
+def read_exact(f, size):
+    #size bytes from the current position, a size from a corrupt header must not allocate past the end of the file
+    if f.tell() + size > os.fstat(f.fileno()).st_size:
+        raise ValueError("Truncated CMPT365 file")
+    return f.read(size)
+
+def skip_preview(f, metadata):
+    #leave f at the block index, right after the preview if there is one
+    if metadata["flags"] & FLAG_PREVIEW:
+        preview_header = f.read(PREVIEW_HEADER.size)
+        if len(preview_header) != PREVIEW_HEADER.size:
+            raise ValueError("Truncated CMPT365 file")
+        f.seek(PREVIEW_HEADER.unpack(preview_header)[0], 1)
+
+def bytes_add(x, y):
+    # (x + y) mod 256 for every byte at once, carries are kept inside each byte
+    n = len(x)
+    high = int.from_bytes(b'\x80' * n, 'big')
+    low = high ^ ((1 << (8 * n)) - 1)
+    x = int.from_bytes(x, 'big')
+    y = int.from_bytes(y, 'big')
+    return (((x & low) + (y & low)) ^ ((x ^ y) & high)).to_bytes(n, 'big')
+
+def bytes_sub(x, y):
+    # (x - y) mod 256 for every byte at once, borrows are kept inside each byte
+    n = len(x)
+    high = int.from_bytes(b'\x80' * n, 'big')
+    low = high ^ ((1 << (8 * n)) - 1)
+    x = int.from_bytes(x, 'big')
+    y = int.from_bytes(y, 'big')
+    return (((x | high) - (y & low)) ^ ((x ^ ~y) & high)).to_bytes(n, 'big')
+
+def bytes_average(x, y):
+    # floor((x + y) / 2) for every byte at once
+    n = len(x)
+    low7 = int.from_bytes(b'\x7f' * n, 'big')
+    x = int.from_bytes(x, 'big')
+    y = int.from_bytes(y, 'big')
+    return ((x & y) + (((x ^ y) >> 1) & low7)).to_bytes(n, 'big')
+
+def filter_row(filter_type, row, prev, step):
+    # residual of one row, step is the bytes per pixel (3 for BGR)
+    # a is the byte to the left, b the byte above and c above left
+    if filter_type == FILTER_NONE:
+        return bytes(row)
+    a = bytes(step) + row[:-step]
+    if filter_type == FILTER_SUB:
+        return bytes_sub(row, a)
+    if filter_type == FILTER_UP:
+        return bytes_sub(row, prev)
+    if filter_type == FILTER_AVERAGE:
+        return bytes_sub(row, bytes_average(a, prev))
+    c = bytes(step) + prev[:-step]
+    if filter_type == FILTER_PAETH:
+        prediction = bytes([a if pa <= pb and pa <= pc else b if pb <= pc else c
+                            for a, b, c in zip(a, prev, c)
+                            for pa, pb, pc in ((abs(b - c), abs(a - c), abs(a + b - c - c)),)])
+    else:
+        #LOCO-I median edge detector
+        prediction = bytes([min(a, b) if c >= max(a, b) else max(a, b) if c <= min(a, b) else a + b - c
+                            for a, b, c in zip(a, prev, c)])
+    return bytes_sub(row, prediction)
+
+def unfilter_row(filter_type, residual, prev, step):
+    if filter_type == FILTER_NONE:
+        return bytes(residual)
+    if filter_type == FILTER_UP:
+        return bytes_add(residual, prev)
+    if filter_type == FILTER_SUB:
+        # running sum along the row, doubling the distance each pass
+        row = bytes(residual)
+        distance = step
+        while distance < len(row):
+            row = bytes_add(row, bytes(distance) + row[:-distance])
+            distance = distance * 2
+        return row
+    if filter_type not in (FILTER_AVERAGE, FILTER_PAETH, FILTER_MED):
+        raise ValueError(f"Unknown filter type {filter_type}")
+    # left neighbours are only known once decoded, so go byte by byte
+    # both rows get step leading zeros so index i is the left / above left byte
+    row = bytearray(step + len(residual))
+    up = bytes(step) + bytes(prev)
+    i = 0
+    for r in residual:
+        a = row[i]
+        b = up[i + step]
+        if filter_type == FILTER_AVERAGE:
+            prediction = (a + b) >> 1
+        else:
+            c = up[i]
+            if filter_type == FILTER_PAETH:
+                pa = abs(b - c)
+                pb = abs(a - c)
+                pc = abs(a + b - c - c)
+                prediction = a if pa <= pb and pa <= pc else b if pb <= pc else c
+            elif c >= max(a, b):
+                prediction = min(a, b)
+            elif c <= min(a, b):
+                prediction = max(a, b)
+            else:
+                prediction = a + b - c
+        row[i + step] = (r + prediction) & 0xFF
+        i = i + 1
+    return bytes(row[step:])
+
+def filter_block(block, w, bpp, predictor):
+    # filter type byte + filtered row for every whole row, the 4-byte padding
+    # at the end of each row is copied as it is
+    stride = ((bpp * w + 31) // 32) * 4
+    row_bytes = (bpp * w + 7) // 8
+    step = max(1, bpp // 8)
+    if not stride:
+        return bytes(block)
+    filter_types = [PREDICTORS[predictor]] if PREDICTORS[predictor] is not None else range(6)
+    output = []
+    prev = bytes(row_bytes) #rows above the block are not used
+    for start in range(0, len(block) - stride + 1, stride):
+        row = block[start:start + row_bytes]
+        best = None
+        for filter_type in filter_types:
+            residual = filter_row(filter_type, row, prev, step)
+            if len(filter_types) == 1:
+                best = (0, filter_type, residual)
+                break
+            cost = sum(residual.translate(RESIDUAL_COST))
+            if best is None or cost < best[0]:
+                best = (cost, filter_type, residual)
+        output.append(bytes([best[1]]))
+        output.append(best[2])
+        output.append(block[start + row_bytes:start + stride])
+        prev = row
+    output.append(block[len(block) - len(block) % stride:])
+    return b''.join(output)
+
+def unfilter_block(filtered, w, bpp):
+    stride = ((bpp * w + 31) // 32) * 4
+    row_bytes = (bpp * w + 7) // 8
+    step = max(1, bpp // 8)
+    if not stride:
+        return bytes(filtered)
+    output = []
+    prev = bytes(row_bytes)
+    pos = 0
+    while pos + 1 + stride <= len(filtered):
+        row = unfilter_row(filtered[pos], filtered[pos + 1:pos + 1 + row_bytes], prev, step)
+        output.append(row)
+        output.append(filtered[pos + 1 + row_bytes:pos + 1 + stride])
+        prev = row
+        pos += 1 + stride
+    output.append(filtered[pos:])
+    return b''.join(output)
+
+def split_block(block, w, bpp, predictor=None, filtered=False):
+    # B, G and R planes of every whole row, then a fourth stream with the filter
+    # type bytes, the row padding and any bytes after the last whole row;
+    # filtered blocks already went through filter_block
+    if predictor and not filtered:
+        block = filter_block(block, w, bpp, predictor)
+    row_bytes = 3 * w
+    head = 1 if predictor or filtered else 0
+    stride = ((bpp * w + 31) // 32) * 4
+    stride = stride + head if stride else 1
+    rows = len(block) // stride if row_bytes else 0
+    pixels = b''.join([block[i + head:i + head + row_bytes] for i in range(0, rows * stride, stride)])
+    rest = [block[i:i + head] + block[i + head + row_bytes:i + stride] for i in range(0, rows * stride, stride)]
+    rest.append(block[rows * stride:])
+    return [pixels[0::3], pixels[1::3], pixels[2::3], b''.join(rest)]
+
+def merge_block(planes, w, bpp, filtered=False):
+    # interleave the planes back into the row layout split_block started from
+    blue, green, red, rest = planes
+    row_bytes = 3 * w
+    head = 1 if filtered else 0
+    extra = ((bpp * w + 31) // 32) * 4 + head - row_bytes
+    pixels = bytearray(3 * len(blue))
+    pixels[0::3] = blue
+    pixels[1::3] = green
+    pixels[2::3] = red
+    output = []
+    pos = 0
+    for i in range(0, len(pixels), row_bytes) if row_bytes else ():
+        output.append(rest[pos:pos + head])
+        output.append(pixels[i:i + row_bytes])
+        output.append(rest[pos + head:pos + extra])
+        pos += extra
+    output.append(rest[pos:])
+    block = b''.join(output)
+    if filtered:
+        block = unfilter_block(block, w, bpp)
+    return block
+
+def tile_columns(w, bpp, tile_width):
+    # (first byte, end byte, width in pixels) of every tile column in a row,
+    # the last column keeps the row padding
+    stride = ((bpp * w + 31) // 32) * 4
+    if not tile_width or tile_width >= w:
+        return [(0, stride, w)]
+    columns = [(x * bpp // 8, (x + tile_width) * bpp // 8, min(tile_width, w - x)) for x in range(0, w, tile_width)]
+    columns[-1] = (columns[-1][0], stride, columns[-1][2])
+    return columns
+
+def cut_tiles(block, stride, columns):
+    # every tile is laid out like a narrow bmp, bytes after the last whole row go to the last tile
+    if len(columns) == 1:
+        return [block]
+    rows = len(block) // stride
+    tiles = [b''.join([block[i + start:i + end] for i in range(0, rows * stride, stride)])
+             for start, end, tile_w in columns]
+    tiles[-1] += block[rows * stride:]
+    return tiles
+
+def join_tiles(tiles, columns):
+    # side by side tiles back into whole rows, columns can be any run of neighbouring columns
+    if len(columns) == 1:
+        return tiles[0]
+    spans = [end - start for start, end, tile_w in columns]
+    rows = len(tiles[0]) // spans[0]
+    output = []
+    for i in range(rows):
+        for tile, span in zip(tiles, spans):
+            output.append(tile[i * span:(i + 1) * span])
+    output.append(tiles[-1][rows * spans[-1]:])
+    return b''.join(output)
+
+def rle_literals(output, data, start, end):
+    for i in range(start, end, 128):
+        span = data[i:min(i + 128, end)]
+        output.append(len(span) - 1)
+        output += span
+
+def rle_length(output, length):
+    #base-128, low bits first, high bit set on every byte but the last
+    while length >= 0x80:
+        output.append(0x80 | (length & 0x7F))
+        length >>= 7
+    output.append(length)
+
+def rle_encoding(data_bytes):
+    # the regex finds the runs, everything between them goes out as literal spans
+    output = bytearray()
+    pos = 0
+    for run in RLE_RUNS.finditer(data_bytes):
+        start, end = run.span()
+        rle_literals(output, data_bytes, pos, start)
+        length = end - start - RLE_MIN_RUN
+        output.append(0x80 | min(length, 0x7F))
+        if length >= 0x7F:
+            rle_length(output, length - 0x7F)
+        output.append(data_bytes[start])
+        pos = end
+    rle_literals(output, data_bytes, pos, len(data_bytes))
+    return bytes(output)
 
-    img = tk.PhotoImage(width=w, height=h)
+def rle_decoding(encoded_bytes, limit):
+    #limit is the most bytes the stream can decode to, corrupt run lengths stop there
+    output = bytearray()
+    pos = 0
+    try:
+        while pos < len(encoded_bytes):
+            token = encoded_bytes[pos]
+            pos += 1
+            if token < 0x80:
+                span = encoded_bytes[pos:pos + token + 1]
+                if len(span) != token + 1 or len(output) + len(span) > limit:
+                    raise IndexError
+                output += span
+                pos += token + 1
+                continue
+            length = token & 0x7F
+            if length == 0x7F:
+                shift = 0
+                while True:
+                    extra = encoded_bytes[pos]
+                    pos += 1
+                    length += (extra & 0x7F) << shift
+                    shift += 7
+                    if length > limit:
+                        raise IndexError
+                    if extra < 0x80:
+                        break
+            if len(output) + length + RLE_MIN_RUN > limit:
+                raise IndexError
+            output += encoded_bytes[pos:pos + 1] * (length + RLE_MIN_RUN)
+            pos += 1
+    except IndexError:
+        raise ValueError("Corrupt CMPT365 file") from None
+    return bytes(output)
 
-    if bpp == 24:
-        for y in range(h):
-            
-            # pad to 4-bytes, going from bottom to top
-            a = (((bpp * w + 31) // 32) * 4) * (h - 1 - y) 
-            for x in range(w):
-                #location of the pixel's first byte
-                c = a + x * 3
-                if c + 2 < len(pixel_data):
-                    
-                    r = pixel_data[c+2]
-                    g = pixel_data[c+1]
-                    b = pixel_data[c]
-                else:
-                    #prevent out of range indexing
-                    continue
+def pack_indices(indices, bpp):
+    # inverse of unpack_indices over whole bytes, one index byte per pixel in
+    if bpp == 4:
+        return bytes.fromhex(indices.translate(HEX_DIGITS).decode())
+    if bpp == 1:
+        if not indices:
+            return b''
+        return int(indices.translate(HEX_DIGITS), 2).to_bytes(len(indices) // 8, 'big')
+    return bytes(indices)
+
+def rle_stream(data, bpp=8):
+    # 1 and 4 bpp bytes are unpacked to one index per byte first so runs of a
+    # colour line up; the runs are only kept when they look cheaper to code
+    units = bytes(unpack_indices(data, len(data) * 8 // bpp, bpp)) if bpp < 8 else data
+    runs = rle_encoding(units)
+    if len(runs) < len(data):
+        cost = coded_size(pixel_frequency_table(runs), "huffman")[0]
+        if cost < coded_size(pixel_frequency_table(data), "huffman")[0]:
+            return bytes([RLE_CODED]) + runs
+    return bytes([RLE_PLAIN]) + data
+
+def unrle_stream(stream, bpp, limit):
+    #limit is the most bytes the unpacked stream can have
+    if stream[:1] == bytes([RLE_PLAIN]):
+        return stream[1:]
+    if stream[:1] != bytes([RLE_CODED]):
+        raise ValueError("Corrupt CMPT365 file")
+    units = rle_decoding(stream[1:], limit * (8 // bpp))
+    if len(units) % (8 // bpp):
+        raise ValueError("Corrupt CMPT365 file")
+    try:
+        return pack_indices(units, bpp)
+    except ValueError:
+        raise ValueError("Corrupt CMPT365 file") from None
+
+def rle_bpp(bpp, planar):
+    #size of the units runs are counted in, planes and 8 bpp or deeper images use bytes
+    return bpp if bpp in (1, 4) and not planar else 8
+
+def prepare_tile(tile, bpp=0, predictor=None, planar=False, rle=False):
+    #filtered (and for planar files split) streams of one tile, ready for the entropy coder
+    data, w = tile
+    if planar:
+        streams = split_block(data, w, bpp, predictor)
+    else:
+        streams = [filter_block(data, w, bpp, predictor) if predictor else data]
+    if rle:
+        with stage("rle", sum(map(len, streams))) as record:
+            streams = [rle_stream(stream, rle_bpp(bpp, planar)) for stream in streams]
+            record["bytes_out"] = sum(map(len, streams))
+    return streams
+
+def band_limit(metadata):
+    #no stream of a band is bigger than the band plus a filter byte per row and the rle flag byte
+    stride = ((metadata["bpp"] * metadata["width"] + 31) // 32) * 4
+    return metadata["block_rows"] * (stride + 1) + 1
+
+def finish_tile(tile, bpp=0, filtered=False, planar=False, rle=False, limit=0):
+    #undo prepare_tile on the decoded streams of one tile, limit is band_limit for rle files
+    streams, w = tile
+    if rle:
+        with stage("unrle", sum(map(len, streams))):
+            streams = [unrle_stream(stream, rle_bpp(bpp, planar), limit) for stream in streams]
+    if planar:
+        return merge_block(streams, w, bpp, filtered)
+    if filtered:
+        return unfilter_block(streams[0], w, bpp)
+    return streams[0]
+
+def encode_block(block, w=0, bpp=0, predictor=None, coder="huffman", lz_effort=LZ_EFFORT, lz_window=LZ_WINDOW):
+    #every row band gets its own frequency table (code lengths for huffman)
+    if predictor:
+        block = filter_block(block, w, bpp, predictor)
+    encode = ENTROPY_CODERS[coder].encode
+    if coder == "lz77":
+        encode = partial(encode, window=lz_window, effort=lz_effort)
+    table, bitlength, encoded_bytes = encode(block)
+    return len(block), table, bitlength, encoded_bytes
+
+def decode_block(block, w=0, bpp=0, filtered=False, coder="huffman"):
+    encoded_bytes, bitlength, table, raw_size = block
+    with stage(coder, len(encoded_bytes), raw_size) as record:
+        if not bitlength:
+            #written by zero_block (or an empty plane), no coder makes an empty payload for bytes that are there
+            pixel_data = bytes(raw_size)
+        else:
+            pixel_data = ENTROPY_CODERS[coder].decode(encoded_bytes, bitlength, table, raw_size)
+        record["bytes_out"] = len(pixel_data)
+    if len(pixel_data) != raw_size:
+        raise ValueError("Corrupt CMPT365 file")
+    if filtered:
+        with stage("unfilter", len(pixel_data)):
+            pixel_data = unfilter_block(pixel_data, w, bpp)
+    return pixel_data
+
+def map_blocks(function, blocks, jobs=1):
+    #blocks are independent, spread them over worker processes
+    if jobs is None or jobs <= 1 or len(blocks) <= 1:
+        return [function(block) for block in blocks]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(blocks))) as pool:
+        return list(pool.map(function, blocks))
+
+class Profile:
+    #per stage totals of compress/decompress calls, a stage opened inside another is named parent/child
+    #entering it collects every call made in the block into one profile, memory=True adds tracemalloc peaks
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = {}
+        self.open_stages = [] #[name, memory at entry, highest peak seen so far]
+        self.calls = 0
+        self.previous = None
+        self.tracing = False
+
+    def __enter__(self):
+        self.previous = getattr(profile_state, "profile", None)
+        profile_state.profile = self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+        return self
+
+    def __exit__(self, *exc):
+        profile_state.profile = self.previous
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def entry(self, name):
+        #created when the stage first opens so parents are listed before their children
+        return self.stages.setdefault(name, {"calls": 0, "ns": 0, "bytes_in": 0, "bytes_out": 0, "symbols": 0})
+
+    def add(self, name, ns, bytes_in=0, bytes_out=0, symbols=0, peak=None):
+        entry = self.entry(name)
+        entry["calls"] += 1
+        entry["ns"] += ns
+        entry["bytes_in"] += bytes_in
+        entry["bytes_out"] += bytes_out
+        entry["symbols"] += symbols
+        if peak is not None:
+            entry["peak"] = max(entry.get("peak", 0), peak)
+
+    def snapshot(self):
+        return {name: dict(entry) for name, entry in self.stages.items()}
+
+@contextmanager
+def stage(name, bytes_in=0, symbols=0):
+    #times the block into the active profile, the block can fill in bytes_out and symbols on the record
+    record = {"bytes_in": bytes_in, "bytes_out": 0, "symbols": symbols}
+    profile = getattr(profile_state, "profile", None)
+    if profile is None:
+        yield record
+        return
+    if profile.open_stages:
+        name = profile.open_stages[-1][0] + "/" + name
+    profile.entry(name)
+    memory = profile.memory and tracemalloc.is_tracing()
+    if memory:
+        #reset_peak forgets the parent's peak so far, keep it on the parent first
+        current, peak = tracemalloc.get_traced_memory()
+        if profile.open_stages:
+            profile.open_stages[-1][2] = max(profile.open_stages[-1][2], peak)
+        tracemalloc.reset_peak()
+    profile.open_stages.append([name, current if memory else 0, 0])
+    start = time.perf_counter_ns()
+    try:
+        yield record
+    finally:
+        ns = time.perf_counter_ns() - start
+        name, entry_memory, peak = profile.open_stages.pop()
+        if memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            if profile.open_stages:
+                profile.open_stages[-1][2] = max(profile.open_stages[-1][2], peak)
+        profile.add(name, ns, record["bytes_in"], record["bytes_out"], record["symbols"],
+                    peak - entry_memory if memory else None)
+
+@contextmanager
+def profiling():
+    #the profile already collecting on this thread, or a fresh one for this call
+    profile = getattr(profile_state, "profile", None)
+    owner = profile is None
+    if owner:
+        profile = Profile().__enter__()
+    profile.calls += 1
+    try:
+        yield profile
+    finally:
+        profile.calls -= 1
+        if owner:
+            profile.__exit__()
+
+def profiled(operation):
+    #stages of the wrapped call go into its stats, hooks only see the outermost call
+    def wrap(function):
+        @wraps(function)
+        def call(*args, **kwargs):
+            with profiling() as profile:
+                result = function(*args, **kwargs)
+                stats = result[1] if isinstance(result, tuple) else result
+                stats["stages"] = profile.snapshot()
+                if profile.calls == 1:
+                    for hook in profile_hooks:
+                        hook(operation, stats)
+            return result
+        return call
+    return wrap
+
+def block_layout(w, h, bpp, block_size):
+    #whole rows per block, about block_size bytes each and never more rows than the image has
+    stride = max(((bpp * w + 31) // 32) * 4, 1)
+    block_rows = max(1, min(block_size // stride, h))
+    return block_rows, block_rows * stride
+
+def block_index_entry(raw_size, table, bitlength, offset, coder="huffman"):
+    return BLOCK_ENTRY.pack(raw_size, bitlength, offset) + ENTROPY_CODERS[coder].table.pack(*table)
+
+def mode_sample(read, h, stride):
+    #MODE_SAMPLE_RUNS runs of whole rows spread evenly over the image, read(offset, size) gives the bytes
+    rows = min(h, MODE_SAMPLE_BYTES // stride) if stride else 0
+    runs = min(MODE_SAMPLE_RUNS, rows)
+    if not runs:
+        return []
+    run_rows = rows // runs
+    return [read(((h - run_rows) * i // max(runs - 1, 1)) * stride, run_rows * stride) for i in range(runs)]
+
+def coded_size(frequency_table, coder):
+    #estimated payload bytes of the counted data and the per stream overhead of the coder
+    total = sum(frequency_table)
+    if not total or coder == "stored":
+        return total, BLOCK_ENTRY.size
+    used = 256 - frequency_table.count(0)
+    if coder == "huffman":
+        #every huffman code is at least one bit long, the compact table is a bitmap and a nibble per used byte
+        bits = sum(y * max(1.0, math.log2(total / y)) for y in frequency_table if y)
+        return bits / 8, BLOCK_ENTRY.size + 32 + (used + 1) // 2
+    return entropy_bits(frequency_table) / 8, BLOCK_ENTRY.size + 36 + 2 * used
+
+def choose_mode(sample, w, h, bpp, pixel_data_size, block_size=BLOCK_SIZE, tile_width=None):
+    # predictor, planar, coder and rle with the smallest estimated file, from
+    # the histograms of the sample rows; candidates go from cheapest to slowest
+    # to encode and decode so a slower one has to win by MODE_MARGIN
+    sample_size = sum(map(len, sample))
+    block_rows, block_bytes = block_layout(w, h, bpp, block_size)
+    bands = (pixel_data_size + block_bytes - 1) // block_bytes
+    blocks = bands * len(tile_columns(w, bpp, tile_width))
+    best = (pixel_data_size + blocks * BLOCK_ENTRY.size, (None, False, "stored", False))
+    if not sample_size:
+        return best[1], best[0]
+    scale = pixel_data_size / sample_size
+
+    def estimate(tables, coder, lz_streams=0):
+        #lz77 codes each of its lz_streams streams as four huffman streams behind one index entry
+        sizes = [coded_size(table, coder) for table in tables]
+        size = sum(payload for payload, overhead in sizes) * scale
+        size += blocks * sum(overhead for payload, overhead in sizes)
+        if lz_streams:
+            size += blocks * (len(tables) * (LZ_STREAM.size - BLOCK_ENTRY.size) + lz_streams * BLOCK_ENTRY.size)
+        return size
+
+    estimates = []
+    streams = {}
+    for predictor in [None] + [name for name in PREDICTORS if name != "none"]:
+        runs = [[filter_block(run, w, bpp, predictor) if predictor else run] for run in sample]
+        if bpp == 24:
+            #planar streams hold the same bytes as the interleaved block, so their tables add up to its table
+            planes = [split_block(run[0], w, bpp, filtered=bool(predictor)) for run in runs]
+            tables = [add_frequency_tables(map(pixel_frequency_table, stream)) for stream in zip(*planes)]
+            layouts = [(True, planes, tables), (False, runs, [add_frequency_tables(tables)])]
+        else:
+            layouts = [(False, runs, [add_frequency_tables(pixel_frequency_table(run[0]) for run in runs)])]
+        for planar, runs, tables in layouts:
+            streams[predictor, planar] = runs
+            rle_runs = [[rle_stream(stream, rle_bpp(bpp, planar)) for stream in run] for run in runs]
+            rle_tables = [add_frequency_tables(map(pixel_frequency_table, stream)) for stream in zip(*rle_runs)]
+            for coder in ("huffman", "rans"):
+                estimates.append((estimate(tables, coder), (predictor, planar, coder, False)))
+                estimates.append((estimate(rle_tables, coder), (predictor, planar, coder, True)))
+    #the lz77 match stage has no histogram shortcut and costs about as much as all the
+    #estimates above, so it only runs on the raw bytes and on the predictor and layout
+    #estimated best so far, with the sample runs of each stream joined like rows of a block
+    predictor, planar = min(estimates, key=lambda estimate: estimate[0])[1][:2]
+    for predictor in dict.fromkeys([None, predictor]):
+        joined = [b''.join(stream) for stream in zip(*streams[predictor, planar])]
+        tables = [pixel_frequency_table(part) for stream in joined
+                  for part in lz77_streams(stream, LZ_WINDOW, MODE_LZ_EFFORT)]
+        estimates.append((estimate(tables, "huffman", len(joined)), (predictor, planar, "lz77", False)))
+    for size, mode in sorted(estimates, key=lambda estimate: MODE_COST[estimate[1][2]] + MODE_COST[estimate[1][0]]
+                             + (MODE_COST["rle"] if estimate[1][3] else 0)):
+        if size < best[0] * (1 - MODE_MARGIN):
+            best = (size, mode)
+    return best[1], best[0]
+
+def mode_name(predictor, planar, coder, rle=False):
+    return f"{coder}, {predictor or 'no'} predictor{', planar' if planar else ''}{', rle' if rle else ''}"
+
+def container_flags(predictor, planar, coder, tiled=False, preview=False, rle=False, delta=False):
+    flags = ENTROPY_CODERS[coder].coder_id << CODER_SHIFT
+    if delta:
+        flags |= FLAG_DELTA
+    if rle:
+        flags |= FLAG_RLE
+    if predictor:
+        flags |= FLAG_FILTERED
+    if planar:
+        flags |= FLAG_PLANAR
+    if tiled:
+        flags |= FLAG_TILED
+    if preview:
+        flags |= FLAG_PREVIEW
+    return flags
+
+def check_tile_width(w, tile_width):
+    #True when the image is wide enough to be cut into columns
+    if tile_width and tile_width % TILE_ALIGN:
+        raise ValueError(f"Tile width must be a multiple of {TILE_ALIGN}")
+    return bool(tile_width) and tile_width < w
+
+def preview_rows(h, scale, stride, pixel_data_size):
+    #top down source rows kept by a 1/scale preview, nearest neighbour
+    if not 1 < scale < 256:
+        raise ValueError("Preview scale must be between 2 and 255")
+    #a top down bmp has a negative height, which reads as about 4 billion rows
+    if h * max(stride, 1) > pixel_data_size:
+        raise ValueError(f"BMP height {h} does not fit its {pixel_data_size} bytes of pixel data")
+    return [y * scale for y in range(h // scale)]
+
+def make_preview(rows, colour_table, w, bpp, scale):
+    # rows are the padded bmp rows picked by preview_rows, top down
+    pick_count = w // scale
+    if not rows or not pick_count:
+        return None
+    rgb = bmp_to_rgb(b''.join(reversed(rows)), colour_table, w, len(rows), bpp)
+    pick = operator.itemgetter(*[x * scale * 3 + c for x in range(pick_count) for c in range(3)])
+    data = b''.join([bytes(pick(rgb[y * w * 3:(y + 1) * w * 3])) for y in range(len(rows))])
+    return PixelBuffer(pick_count, len(rows), data)
+
+def preview_section(preview, scale, coder="huffman"):
+    raw_size, table, bitlength, encoded_bytes = encode_block(preview.data, coder=coder)
+    entry = block_index_entry(raw_size, table, bitlength, 0, coder)
+    header = PREVIEW_HEADER.pack(len(entry) + len(encoded_bytes), scale, preview.width, preview.height)
+    return header + entry + encoded_bytes
+
+def container_header(flags, original_file_size, w, h, bpp, bmp_header, pixel_data_size, block_rows, block_count,
+                     tile_width=0, reference_hash=None):
+    header = CONTAINER_HEADER.pack(file_type, CONTAINER_ESCAPE, CONTAINER_VERSION, flags, original_file_size,
+                                   w, h, bpp, len(bmp_header), pixel_data_size, block_rows, block_count)
+    if flags & FLAG_TILED:
+        header += TILE_HEADER.pack(tile_width)
+    if flags & FLAG_DELTA:
+        header += DELTA_HEADER.pack(reference_hash)
+    return header + bytes(bmp_header)
+
+def reference_pixels(reference, w, h, bpp, pixel_data_size):
+    #pixel data of a reference bmp, which has to be laid out like the frame
+    if check_is_bmp(reference) != b'BM':
+        raise ValueError("Reference is not a BMP file")
+    pixels = get_pixel_data(reference)
+    if (get_width(reference), get_height(reference), get_bpp(reference)) != (w, h, bpp) or len(pixels) != pixel_data_size:
+        raise ValueError("Reference image has a different size or bit depth")
+    return pixels
+
+def delta_reference(metadata, reference):
+    #reference pixel data a delta file is added to, None for other files
+    if metadata["version"] == 1 or not metadata["reference_hash"]:
+        return None
+    if reference is None:
+        raise ValueError("This CMPT365 file is a delta frame, decode it with its reference image")
+    if hashlib.sha256(reference).digest() != metadata["reference_hash"]:
+        raise ValueError("Reference image does not match the one this file was made from")
+    return reference_pixels(reference, metadata["width"], metadata["height"], metadata["bpp"],
+                            metadata["pixel_data_size"])
+
+def load_reference(path):
+    #bmp bytes and sha-256 of a reference frame stored as .bmp or .cmpt365, kept decoded for the next frame
+    key = ("reference",) + decoded_key(path)
+    reference = decoded_cache_get(key)
+    if reference is None:
+        with open(path, "rb") as f:
+            bmp_bytes = f.read()
+        if bmp_bytes[:7] == file_type:
+            bmp_bytes = decompress_bytes(bmp_bytes)[0]
+        elif check_is_bmp(bmp_bytes) != b'BM':
+            raise ValueError("Reference is not a BMP or CMPT365 file")
+        reference = (bmp_bytes, hashlib.sha256(bmp_bytes).digest())
+        decoded_cache_put(key, reference, len(bmp_bytes))
+    return reference
+
+def zero_block(raw_size, coder):
+    #index entry of a stream that is all zero (unchanged in a delta frame), it has no payload
+    table = ENTROPY_CODERS[coder].table
+    return raw_size, table.unpack(bytes(table.size)), 0, b''
+
+def encode_streams(streams, coder, jobs=1, lz_effort=LZ_EFFORT, lz_window=LZ_WINDOW, delta=False):
+    #delta frames skip coding the streams of tiles that did not change
+    changed = [not delta or bool(stream.strip(b'\0')) for stream in streams]
+    encoded = iter(map_blocks(partial(encode_block, coder=coder, lz_effort=lz_effort, lz_window=lz_window),
+                              [stream for stream, keep in zip(streams, changed) if keep], jobs))
+    return [next(encoded) if keep else zero_block(len(stream), coder) for stream, keep in zip(streams, changed)]
+
+def block_file_bytes(bmp_header, pixel_data, original_file_size, w, h, bpp, block_size=BLOCK_SIZE, jobs=1,
+                     predictor=None, planar=True, coder="huffman", tile_width=None, preview=None, rle=False,
+                     lz_effort=LZ_EFFORT, lz_window=LZ_WINDOW, reference=None):
+    #with a reference bmp the differences from its pixels are coded, the preview still shows the frame
+    check_lz_options(lz_effort, lz_window)
+    block_rows, block_bytes = block_layout(w, h, bpp, block_size)
+    coded = pixel_data
+    reference_hash = None
+    if reference is not None:
+        with stage("delta", len(pixel_data)):
+            coded = bytes_sub(pixel_data, reference_pixels(reference, w, h, bpp, len(pixel_data)))
+            reference_hash = hashlib.sha256(reference).digest()
+    blocks = [coded[i:i + block_bytes] for i in range(0, len(coded), block_bytes)]
+    planar = planar and bpp == 24
+    tiled = check_tile_width(w, tile_width)
+    columns = tile_columns(w, bpp, tile_width)
+    stride = ((bpp * w + 31) // 32) * 4
+    tiles = [(tile, column[2]) for block in blocks for tile, column in zip(cut_tiles(block, stride, columns), columns)]
+    #filtering and plane splitting are only worth a worker when there are filters to run
+    with stage("prepare", len(pixel_data)):
+        streams = map_blocks(partial(prepare_tile, bpp=bpp, predictor=predictor, planar=planar, rle=rle), tiles,
+                             jobs if predictor or rle else 1)
+    #every stream (each plane of each tile) is its own job so they encode side by side
+    streams = [stream for group in streams for stream in group]
+    with stage("encode", sum(map(len, streams)), sum(map(len, streams))) as record:
+        encoded_blocks = encode_streams(streams, coder, jobs, lz_effort, lz_window, reference is not None)
+        record["bytes_out"] = sum(len(block[3]) for block in encoded_blocks)
 
-                img.put(f"#{r:02x}{g:02x}{b:02x}", (x, y))
-           
-    # for 8
-    elif bpp == 8:
-        #every pixel maps to one index
-        for y in range(h):
-           
-            # pad to 4-bytes, going from bottom to top
-            a = (((bpp * w + 31) // 32) * 4) * (h - 1 - y)
-            for x in range(w):
-                c = a + x 
-                colour_index = pixel_data[c]
-                if colour_table and (colour_index*4) + 2 < len(colour_table):
-                    # Every index is 4 bytes with reserved
-                    r = colour_table[(colour_index*4)+2]
-                    g = colour_table[(colour_index*4)+1]
-                    b = colour_table[(colour_index*4)]
-                else:
-                    continue
-                #print(colour)
-                img.put(f"#{r:02x}{g:02x}{b:02x}", (x, y))
-    #for 4
-    # two pixels per byte
-    elif bpp == 4:
-        for y in range(h):
-           
-            # padded, going from bottom to top
-            a = (((bpp * w + 31) // 32) * 4) * (h - 1 - y)
-            for x in range(w):
-                c = a + (x // 2) 
-                if x % 2 != 0:
-                    # lower part, four least significant bits
-                    # 4 right values
-                    colour_index = pixel_data[c] & 0x0F
-                else:
-                    # upper part four most significant bits
-                    # 4 left values
-                    # push values to the right and retrieve
-                    colour_index = (pixel_data[c] >> 4) & 0x0F
-                if colour_table and (colour_index*4) + 2 < len(colour_table):
-                    r = colour_table[(colour_index*4)+2]
-                    g = colour_table[(colour_index*4)+1]
-                    b = colour_table[(colour_index*4)]
-                else:
-                    continue
+    index = []
+    payload = []
+    offset = 0
+    for raw_size, table, bitlength, encoded_bytes in encoded_blocks:
+        index.append(block_index_entry(raw_size, table, bitlength, offset, coder))
+        payload.append(encoded_bytes)
+        offset += len(encoded_bytes)
+
+    preview_bytes = b''
+    if preview:
+        with stage("preview"):
+            colour_table = (get_colour_table(bmp_header) or None) if bpp in (1, 4, 8) else None
+            rows = [pixel_data[(h - 1 - y) * stride:(h - y) * stride].ljust(stride, b'\0')
+                    for y in preview_rows(h, preview, stride, len(pixel_data))]
+            preview_pixels = make_preview(rows, colour_table, w, bpp, preview)
+            if preview_pixels:
+                preview_bytes = preview_section(preview_pixels, preview, coder)
+
+    flags = container_flags(predictor, planar, coder, tiled, bool(preview_bytes), rle, reference is not None)
+    header = container_header(flags, original_file_size, w, h, bpp, bmp_header, len(pixel_data), block_rows,
+                              len(encoded_blocks), tile_width, reference_hash)
+    return b''.join([header, preview_bytes] + index + payload)
+
+class JobCancelled(Exception):
+    #raised from a progress callback to stop a streaming job between blocks
+    pass
+
+@profiled("compress")
+def compress_stream(file_path, output_path, buffer_size=BLOCK_SIZE, predictor=None, planar=True, coder="huffman",
+                    tile_width=None, preview=None, rle=False, lz_effort=LZ_EFFORT, lz_window=LZ_WINDOW, progress=None,
+                    reference=None):
+    #one block in memory at a time, the block index is patched in at the end
+    #progress(done, total) is called after every row band, reference is the bmp bytes of a reference frame
+    start_time = time.perf_counter()
+    check_lz_options(lz_effort, lz_window)
+    with open(file_path, "rb") as src, open(output_path, "wb") as dst:
+        try:
+            head = src.read(30)
+            if (check_is_bmp(head) != b'BM') or len(head) < 30:
+                raise ValueError("Not a BMP file")
+            pixel_data_index = int.from_bytes(head[10:14], 'little')
+            src.seek(0)
+            bmp_header = src.read(pixel_data_index)
+            pixel_data_size = max(os.fstat(src.fileno()).st_size - pixel_data_index, 0)
+            o_size = get_file_size(head)
+            w = get_width(head)
+            h = get_height(head)
+            bpp = get_bpp(head)
+            block_rows, block_bytes = block_layout(w, h, bpp, buffer_size)
+            band_count = (pixel_data_size + block_bytes - 1) // block_bytes
+            reference_hash = None
+            if reference is not None:
+                before = reference_pixels(reference, w, h, bpp, pixel_data_size)
+                reference_hash = hashlib.sha256(reference).digest()
+            mode = None
+            if coder == "auto":
+                with stage("mode"):
+                    def read(offset, size):
+                        src.seek(pixel_data_index + offset)
+                        data = src.read(size)
+                        return bytes_sub(data, before[offset:offset + len(data)]) if reference is not None else data
+                    sample = mode_sample(read, h, ((bpp * w + 31) // 32) * 4)
+                    mode, estimate = choose_mode(sample, w, h, bpp, pixel_data_size, buffer_size, tile_width)
+                    src.seek(pixel_data_index)
+                predictor, planar, coder, rle = mode
+            planar = planar and bpp == 24
+            tiled = check_tile_width(w, tile_width)
+            columns = tile_columns(w, bpp, tile_width)
+            stride = ((bpp * w + 31) // 32) * 4
+            block_count = band_count * len(columns) * (PLANE_COUNT if planar else 1)
+
+            preview_bytes = b''
+            if preview:
+                #an extra pass that only keeps the preview pixels, every wanted row is shrunk as it is read
+                with stage("preview"):
+                    wanted = {h - 1 - y: y for y in preview_rows(h, preview, stride, pixel_data_size)}
+                    colour_table = (get_colour_table(bmp_header) or None) if bpp in (1, 4, 8) else None
+                    rows = {}
+                    for row in range(h):
+                        line = src.read(stride)
+                        if row in wanted:
+                            small = make_preview([line], colour_table, w, bpp, preview)
+                            if small is None:
+                                break
+                            rows[wanted[row]] = small.data
+                    if rows:
+                        preview_bytes = preview_section(PixelBuffer(w // preview, len(wanted),
+                                                                    b''.join(rows[y] for y in sorted(rows))),
+                                                        preview, coder)
+                src.seek(pixel_data_index)
+
+            flags = container_flags(predictor, planar, coder, tiled, bool(preview_bytes), rle, reference is not None)
+            dst.write(container_header(flags, o_size, w, h, bpp, bmp_header, pixel_data_size, block_rows, block_count,
+                                       tile_width, reference_hash))
+            dst.write(preview_bytes)
+            index_pos = dst.tell()
+            dst.write(bytes(block_count * (BLOCK_ENTRY.size + ENTROPY_CODERS[coder].table.size)))
+
+            index = []
+            offset = 0
+            for i in range(band_count):
+                with stage("read") as record:
+                    block = src.read(block_bytes)
+                    record["bytes_out"] = len(block)
+                if reference is not None:
+                    with stage("delta", len(block)):
+                        block = bytes_sub(block, before[i * block_bytes:i * block_bytes + len(block)])
+                with stage("prepare", len(block)):
+                    streams = [stream for tile, column in zip(cut_tiles(block, stride, columns), columns)
+                               for stream in prepare_tile((tile, column[2]), bpp, predictor, planar, rle)]
+                with stage("encode", sum(map(len, streams)), sum(map(len, streams))) as record:
+                    encoded_blocks = encode_streams(streams, coder, 1, lz_effort, lz_window, reference is not None)
+                    record["bytes_out"] = sum(len(block[3]) for block in encoded_blocks)
+                with stage("write", record["bytes_out"]):
+                    for raw_size, table, bitlength, encoded_bytes in encoded_blocks:
+                        dst.write(encoded_bytes)
+                        index.append(block_index_entry(raw_size, table, bitlength, offset, coder))
+                        offset += len(encoded_bytes)
+                if progress:
+                    progress(i + 1, band_count)
+            comp_size = dst.tell()
+            dst.seek(index_pos)
+            dst.write(b''.join(index))
+        except BaseException:
+            #failed or cancelled, do not leave half a file behind
+            dst.close()
+            os.remove(output_path)
+            raise
+
+    compression_time = (time.perf_counter() - start_time) * 1000
+    stats = {
+        "width": w,
+        "height": h,
+        "bpp": bpp,
+        "original_size": o_size,
+        "compressed_size": comp_size,
+        "ratio": o_size / comp_size,
+        "time_ms": compression_time
+    }
+    if mode:
+        stats["mode"] = mode_name(*mode)
+    return stats
+
+def read_block(f, payload_pos, block):
+    #encoded bytes of one index entry straight from the file, as decode_block takes them
+    #a corrupt offset or bit length must not make read() allocate past the end of the file
+    size = (block["bitlength"] + 7) // 8
+    if payload_pos + block["offset"] + size > os.fstat(f.fileno()).st_size:
+        raise ValueError("Truncated CMPT365 file")
+    f.seek(payload_pos + block["offset"])
+    encoded_bytes = f.read(size)
+    if len(encoded_bytes) != size:
+        raise ValueError("Truncated CMPT365 file")
+    return encoded_bytes, block["bitlength"], block["table"], block["raw_size"]
+
+@profiled("decompress")
+def decompress_stream(file_path, sink, progress=None, reference=None):
+    #decoded blocks go to sink.write one at a time, progress(done, total) after every band
+    start_time = time.perf_counter()
+    with open(file_path, "rb") as f:
+        head = f.read(HEADER_READ)
+        if head[:7] == file_type and int.from_bytes(head[7:11], 'little') != CONTAINER_ESCAPE:
+            #old single table files have one bitstream, decode it in one go
+            bmp_bytes, stats = decompress_bytes(map_file(f), reference=reference)
+            sink.write(bmp_bytes)
+            if progress:
+                progress(1, 1)
+            return stats
+        with stage("parse"):
+            metadata = parse_block_header(head)
+            before = delta_reference(metadata, reference)
+            f.seek(metadata["header_end"])
+            bmp_header = read_exact(f, metadata["header_size"])
+            skip_preview(f, metadata)
+            blocks = parse_block_index(read_exact(f, metadata["index_size"]), metadata["block_count"], metadata["coder"],
+                                       band_limit(metadata))
+            payload_pos = f.tell()
+
+        sink.write(bmp_header)
+        out_size = len(bmp_header)
+        filtered = metadata["flags"] & FLAG_FILTERED
+        planar = metadata["flags"] & FLAG_PLANAR
+        rle = metadata["flags"] & FLAG_RLE
+        group = PLANE_COUNT if planar else 1
+        columns = tile_columns(metadata["width"], metadata["bpp"], metadata["tile_width"])
+        band_entries = group * len(columns)
+        for i in range(0, len(blocks), band_entries):
+            tiles = []
+            for j, column in enumerate(columns):
+                with stage("read") as record:
+                    encoded = [read_block(f, payload_pos, block) for block in blocks[i + j * group:i + (j + 1) * group]]
+                    record["bytes_out"] = sum(len(block[0]) for block in encoded)
+                with stage("decode", record["bytes_out"]) as record:
+                    streams = [decode_block(block, coder=metadata["coder"]) for block in encoded]
+                    record["bytes_out"] = sum(map(len, streams))
+                with stage("finish", record["bytes_out"]):
+                    tiles.append(finish_tile((streams, column[2]), metadata["bpp"], filtered, planar, rle,
+                                             band_limit(metadata)))
+            pixel_data = join_tiles(tiles, columns)
+            if before is not None:
+                with stage("delta", len(pixel_data)):
+                    done = out_size - len(bmp_header)
+                    pixel_data = bytes_add(pixel_data, before[done:done + len(pixel_data)])
+            with stage("write", len(pixel_data)):
+                sink.write(pixel_data)
+            out_size += len(pixel_data)
+            if progress:
+                progress(i // band_entries + 1, len(blocks) // band_entries)
+        comp_size = os.fstat(f.fileno()).st_size
+
+    decompression_time = (time.perf_counter() - start_time) * 1000
+    return {
+        "width": metadata["width"],
+        "height": metadata["height"],
+        "bpp": metadata["bpp"],
+        "original_size": out_size,
+        "compressed_size": comp_size,
+        "ratio": out_size / comp_size,
+        "time_ms": decompression_time
+    }
+
+def make_bmp_header(original_file_size, w, h, bpp, colour_table, pixel_data_size):
+    #.cmpt365 files only keep the image metadata, rebuild a plain BITMAPINFOHEADER
+    colour_size = len(colour_table) if colour_table else 0
+    header = struct.pack("<2sIHHI", b'BM', original_file_size, 0, 0, 54 + colour_size)
+    header += struct.pack("<IiiHHIIiiII", 40, w, h, 1, bpp, 0, pixel_data_size, 0, 0, colour_size // 4, 0)
+    if colour_size:
+        header += bytes(colour_table)
+    return header
+
+def decode_pixel_data(metadata, jobs=1):
+    if metadata["version"] == 1:
+        with stage("huffman", len(metadata["encoded_bytes"]), metadata["pixel_data_size"]) as record:
+            pixel_data = huffman_decoding(metadata["encoded_bytes"], metadata["bitlength"], metadata["lengths"])
+            record["bytes_out"] = len(pixel_data)
+        return pixel_data
+    blocks = [(block["encoded_bytes"], block["bitlength"], block["table"], block["raw_size"])
+              for block in metadata["blocks"]]
+    if jobs is not None and jobs > 1:
+        #views into a mapped file can't be sent to worker processes
+        blocks = [(bytes(block[0]),) + block[1:] for block in blocks]
+    filtered = metadata["flags"] & FLAG_FILTERED
+    planar = metadata["flags"] & FLAG_PLANAR
+    group = PLANE_COUNT if planar else 1
+    columns = tile_columns(metadata["width"], metadata["bpp"], metadata["tile_width"])
+    #decode every stream side by side, then put each tile and band back together
+    with stage("decode", sum(len(block[0]) for block in blocks)) as record:
+        streams = map_blocks(partial(decode_block, coder=metadata["coder"]), blocks, jobs)
+        record["bytes_out"] = sum(map(len, streams))
+    tiles = [(streams[i:i + group], columns[(i // group) % len(columns)][2]) for i in range(0, len(streams), group)]
+    rle = metadata["flags"] & FLAG_RLE
+    finish = partial(finish_tile, bpp=metadata["bpp"], filtered=filtered, planar=planar, rle=rle,
+                     limit=band_limit(metadata))
+    with stage("finish", record["bytes_out"]):
+        tiles = map_blocks(finish, tiles, jobs if filtered or rle else 1)
+    pixel_data = b''.join([join_tiles(tiles[i:i + len(columns)], columns) for i in range(0, len(tiles), len(columns))])
+    if len(pixel_data) != metadata["pixel_data_size"]:
+        raise ValueError("Corrupt CMPT365 file")
+    return pixel_data
+
+@profiled("compress")
+def compress_bytes(bmp_bytes, block_size=BLOCK_SIZE, jobs=1, predictor=None, planar=True, coder="huffman",
+                   tile_width=None, preview=None, rle=False, lz_effort=LZ_EFFORT, lz_window=LZ_WINDOW, reference=None):
+    #bmp bytes in, .cmpt365 bytes and stats out, reference is the bmp bytes of a frame to code the differences from
+    start_time = time.perf_counter()
+    if (check_is_bmp(bmp_bytes) != b'BM'):
+        raise ValueError("Not a BMP file")
+
+    #get all metadata
+    with stage("parse", len(bmp_bytes)):
+        o_size = get_file_size(bmp_bytes)
+        w = get_width(bmp_bytes)
+        h = get_height(bmp_bytes)
+        bpp = get_bpp(bmp_bytes)
+        pixel_data = get_pixel_data(bmp_bytes)
+        #keep the whole header so decompressing gives back the same file
+        bmp_header = bmp_bytes[:len(bmp_bytes) - len(pixel_data)]
+    mode = None
+    if coder == "auto":
+        with stage("mode"):
+            stride = ((bpp * w + 31) // 32) * 4
+            read = lambda offset, size: pixel_data[offset:offset + size]
+            if reference is not None:
+                before = reference_pixels(reference, w, h, bpp, len(pixel_data))
+                read = lambda offset, size: bytes_sub(pixel_data[offset:offset + size], before[offset:offset + size])
+            sample = mode_sample(read, h, stride)
+            mode, estimate = choose_mode(sample, w, h, bpp, len(pixel_data), block_size, tile_width)
+        predictor, planar, coder, rle = mode
+    new_bytes = block_file_bytes(bmp_header, pixel_data, o_size, w, h, bpp, block_size, jobs, predictor, planar,
+                                 coder, tile_width, preview, rle, lz_effort, lz_window, reference)
+    if mode and coder != "stored" and len(new_bytes) > len(bmp_bytes):
+        #the estimate was wrong, storing is only a copy
+        mode = (None, False, "stored", False)
+        new_bytes = block_file_bytes(bmp_header, pixel_data, o_size, w, h, bpp, block_size, jobs, None, False,
+                                     "stored", tile_width, preview, reference=reference)
 
-                #print(colour)
-                img.put(f"#{r:02x}{g:02x}{b:02x}", (x, y))
-    #for 1
-    # 8 pixels for a byte
-    elif bpp == 1:
-
-        for y in range(h):
-            
-            a = (((bpp * w + 31) // 32) * 4) * (h - 1 - y)
-            for x in range(w):
-                # byte index
-                c = a + (x // 8)
-                # bit index
-                z = 7 - (x % 8)
-                # get one bit for the pixel
-                colour_index = (pixel_data[c] >>  z) & 0x01
-                if colour_table and (colour_index*4) + 2 < len(colour_table):
-                    r=colour_table[(colour_index*4)+2]
-                    g=colour_table[(colour_index*4)+1]
-                    b=colour_table[(colour_index*4)]
+    #stop time get ms
+    compression_time = (time.perf_counter() - start_time) * 1000
+    stats = {
+        "width": w,
+        "height": h,
+        "bpp": bpp,
+        "original_size": o_size,
+        "compressed_size": len(new_bytes),
+        "ratio": o_size / len(new_bytes),
+        "time_ms": compression_time
+    }
+    if mode:
+        stats["mode"] = mode_name(*mode)
+    return new_bytes, stats
+
+@profiled("decompress")
+def decompress_bytes(cmpt365_bytes, jobs=1, reference=None):
+    #.cmpt365 bytes in, bmp bytes and stats out, delta frames also need the bmp bytes of their reference
+    start_time = time.perf_counter()
+    with stage("parse", len(cmpt365_bytes)):
+        metadata = parse_special_file(cmpt365_bytes)
+        before = delta_reference(metadata, reference)
+    pixel_data = decode_pixel_data(metadata, jobs)
+    if before is not None:
+        with stage("delta", len(pixel_data)):
+            pixel_data = bytes_add(pixel_data, before)
+    if metadata["version"] == 1:
+        bmp_header = make_bmp_header(metadata["original_file_size"], metadata["width"], metadata["height"],
+                                     metadata["bpp"], metadata["colour_table"], len(pixel_data))
+    else:
+        bmp_header = metadata["bmp_header"]
+    bmp_bytes = bmp_header + pixel_data
+    decompression_time = (time.perf_counter() - start_time) * 1000
+    stats = {
+        "width": metadata["width"],
+        "height": metadata["height"],
+        "bpp": metadata["bpp"],
+        "original_size": len(bmp_bytes),
+        "compressed_size": len(cmpt365_bytes),
+        "ratio": len(bmp_bytes) / len(cmpt365_bytes),
+        "time_ms": decompression_time
+    }
+    return bmp_bytes, stats
+
+@profiled("compress")
+def compress_file(file_path, output_path=None, jobs=1, block_size=BLOCK_SIZE, stream=False, predictor=None,
+                  planar=True, coder="huffman", tile_width=None, preview=None, rle=False, lz_effort=LZ_EFFORT,
+                  lz_window=LZ_WINDOW, progress=None, reference=None):
+    #reference is the path of a .bmp or .cmpt365 frame to code the differences from
+    if output_path is None:
+        output_path = file_path.rsplit('.', 1)[0] + '.cmpt365'
+    if reference is not None:
+        with stage("reference"):
+            reference = load_reference(reference)[0]
+    if stream:
+        stats = compress_stream(file_path, output_path, block_size, predictor, planar, coder, tile_width, preview,
+                                rle, lz_effort, lz_window, progress, reference)
+    else:
+        with stage("read") as record:
+            with open(file_path, "rb") as f:
+                bmp_bytes = f.read()
+            record["bytes_out"] = len(bmp_bytes)
+        new_bytes, stats = compress_bytes(bmp_bytes, block_size, jobs, predictor, planar, coder, tile_width,
+                                          preview, rle, lz_effort, lz_window, reference)
+        with stage("write", len(new_bytes)):
+            with open(output_path, "wb") as f:
+                f.write(new_bytes)
+    stats["input"] = file_path
+    stats["output"] = output_path
+    return stats
+
+@profiled("decompress")
+def decompress_file(file_path, output_path=None, jobs=1, stream=False, progress=None, reference=None):
+    if output_path is None:
+        output_path = file_path.rsplit('.', 1)[0] + '.bmp'
+    if reference is not None:
+        with stage("reference"):
+            reference = load_reference(reference)[0]
+    if stream:
+        with open(output_path, "wb") as f:
+            stats = decompress_stream(file_path, f, progress, reference)
+    else:
+        with open(file_path, "rb") as f:
+            cmpt365_bytes = map_file(f)
+        bmp_bytes, stats = decompress_bytes(cmpt365_bytes, jobs, reference)
+        with stage("write", len(bmp_bytes)):
+            with open(output_path, "wb") as f:
+                f.write(bmp_bytes)
+    stats["input"] = file_path
+    stats["output"] = output_path
+    return stats
+
+def decode_preview(metadata):
+    #PixelBuffer of the stored preview, None when the file has none
+    preview = metadata.get("preview")
+    if not preview:
+        return None
+    data = decode_block((preview["encoded_bytes"], preview["bitlength"], preview["table"], preview["raw_size"]),
+                        coder=metadata["coder"])
+    if len(data) != preview["width"] * preview["height"] * 3:
+        raise ValueError("Corrupt CMPT365 file")
+    return PixelBuffer(preview["width"], preview["height"], data)
+
+def read_preview(file_path):
+    #only the header and the preview are read, the pixel blocks are left alone
+    with open(file_path, "rb") as f:
+        head = f.read(HEADER_READ)
+        if head[:7] != file_type:
+            raise ValueError("Not a CMPT365 file")
+        if int.from_bytes(head[7:11], 'little') != CONTAINER_ESCAPE:
+            return None
+        metadata = parse_block_header(head)
+        if not metadata["flags"] & FLAG_PREVIEW:
+            return None
+        f.seek(metadata["header_end"] + metadata["header_size"])
+        section = f.read(PREVIEW_HEADER.size)
+        section += read_exact(f, PREVIEW_HEADER.unpack_from(section)[0] if len(section) == PREVIEW_HEADER.size else 0)
+    metadata["preview"] = parse_preview(section, 0, metadata["coder"])
+    return decode_preview(metadata)
+
+def decode_region(file_path, x, y, w, h, reference=None):
+    # r,g,b pixels of one region (y counts from the top), only the bands and
+    # tile columns that overlap it are read and decoded, delta frames need the bmp bytes of their reference
+    with open(file_path, "rb") as f:
+        head = f.read(HEADER_READ)
+        if head[:7] == file_type and int.from_bytes(head[7:11], 'little') != CONTAINER_ESCAPE:
+            #old single table files have one bitstream, decode it all and crop
+            metadata = parse_special_file(map_file(f))
+        else:
+            metadata = parse_block_header(head)
+        width, height, bpp = metadata["width"], metadata["height"], metadata["bpp"]
+        if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > width or y + h > height:
+            raise ValueError(f"Region {w}x{h} at {x},{y} is outside the {width}x{height} image")
+        if metadata["version"] == 1:
+            rgb = bmp_to_rgb(decode_pixel_data(metadata), metadata["colour_table"], width, height, bpp)
+            return crop_pixels(PixelBuffer(width, height, rgb), x, y, w, h)
+        before = delta_reference(metadata, reference)
+
+        f.seek(metadata["header_end"])
+        bmp_header = read_exact(f, metadata["header_size"])
+        skip_preview(f, metadata)
+        #index entries are all the same size, so only the ones of the overlapping tiles are read
+        index_pos = f.tell()
+        payload_pos = index_pos + metadata["index_size"]
+        if payload_pos > os.fstat(f.fileno()).st_size:
+            raise ValueError("Truncated CMPT365 file")
+        entry_size = metadata["index_size"] // metadata["block_count"] if metadata["block_count"] else 0
+        colour_table = (get_colour_table(bmp_header) or None) if bpp in (1, 4, 8) else None
+        filtered = metadata["flags"] & FLAG_FILTERED
+        planar = metadata["flags"] & FLAG_PLANAR
+        group = PLANE_COUNT if planar else 1
+        columns = tile_columns(width, bpp, metadata["tile_width"])
+        tile_width = metadata["tile_width"]
+        block_rows = metadata["block_rows"]
+        first_column = x // tile_width
+        last_column = (x + w - 1) // tile_width
+        #bmp rows go bottom up
+        first_band = (height - y - h) // block_rows
+        last_band = (height - 1 - y) // block_rows
+
+        bands = []
+        for band in range(first_band, last_band + 1):
+            tiles = []
+            for column in range(first_column, last_column + 1):
+                i = (band * len(columns) + column) * group
+                if i + group > metadata["block_count"]:
+                    raise ValueError("Truncated CMPT365 file")
+                f.seek(index_pos + i * entry_size)
+                blocks = parse_block_index(f.read(group * entry_size), group, metadata["coder"], band_limit(metadata))
+                streams = [decode_block(read_block(f, payload_pos, block), coder=metadata["coder"])
+                           for block in blocks]
+                tiles.append(finish_tile((streams, columns[column][2]), bpp, filtered, planar,
+                                         metadata["flags"] & FLAG_RLE, band_limit(metadata)))
+            pixel_data = join_tiles(tiles, columns[first_column:last_column + 1])
+            if before is not None:
+                #the same tiles cut from the reference band
+                stride = ((bpp * width + 31) // 32) * 4
+                band_bytes = before[band * block_rows * stride:(band + 1) * block_rows * stride]
+                reference_tiles = cut_tiles(band_bytes, stride, columns)[first_column:last_column + 1]
+                pixel_data = bytes_add(pixel_data, join_tiles(reference_tiles, columns[first_column:last_column + 1]))
+            bands.append(pixel_data)
+
+    span = sum(column[2] for column in columns[first_column:last_column + 1])
+    top_row = min((last_band + 1) * block_rows, height)
+    rows = top_row - first_band * block_rows
+    rgb = bmp_to_rgb(b''.join(bands), colour_table, span, rows, bpp)
+    return crop_pixels(PixelBuffer(span, rows, rgb), x - first_column * tile_width, y - (height - top_row), w, h)
+
+def file_info(file_path):
+    #header metadata of a .bmp or .cmpt365 file without decoding pixels
+    with open(file_path, "rb") as f:
+        head = f.read(HEADER_READ)
+    size = os.path.getsize(file_path)
+    if head[:7] == file_type and int.from_bytes(head[7:11], 'little') == CONTAINER_ESCAPE:
+        header = CONTAINER_HEADER.unpack_from(head)
+        flags = header[3]
+        original_file_size, w, h, bpp = header[4:8]
+        tile_width = None
+        reference = None
+        if len(head) == HEADER_READ:
+            metadata = parse_block_header(head)
+            tile_width = metadata["tile_width"] if flags & FLAG_TILED else None
+            reference = metadata["reference_hash"].hex() if flags & FLAG_DELTA else None
+        return {"input": file_path, "format": "CMPT365", "version": header[2], "width": w, "height": h,
+                "bpp": bpp, "size": size, "original_size": original_file_size,
+                "ratio": original_file_size / size, "blocks": header[11], "planar": bool(flags & FLAG_PLANAR),
+                "coder": CODER_NAMES.get((flags & CODER_MASK) >> CODER_SHIFT, "unknown"),
+                "tile_width": tile_width, "preview": bool(flags & FLAG_PREVIEW), "rle": bool(flags & FLAG_RLE),
+                "reference": reference}
+    if head[:7] == file_type:
+        original_file_size, w, h, bpp = V1_HEADER.unpack_from(head)[1:5]
+        return {"input": file_path, "format": "CMPT365", "version": 1, "width": w, "height": h, "bpp": bpp,
+                "size": size, "original_size": original_file_size, "ratio": original_file_size / size}
+    if check_is_bmp(head) == b'BM':
+        return {"input": file_path, "format": "BMP", "width": get_width(head), "height": get_height(head),
+                "bpp": get_bpp(head), "size": size}
+    if head[:7] == ARCHIVE_MAGIC:
+        with open(file_path, "rb") as f:
+            archive = read_archive_index(f)
+        original_size = sum(entry["original_size"] for entry in archive["members"].values())
+        return {"input": file_path, "format": "CMPTARC", "members": len(archive["members"]),
+                "tables": len(archive["tables"]), "size": size, "original_size": original_size,
+                "ratio": original_size / size}
+    raise ValueError("Not a BMP or CMPT365 file")
+
+def choose_archive_tables(images, tables):
+    #pick own table, a shared one or the container for each small image, adding shared tables that pay for themselves
+    for image in images:
+        lengths = huffman_tree(image["frequency"])
+        image["lengths"] = lengths
+        image["table"] = ARCHIVE_OWN_TABLE
+        image["bits"] = table_bits(image["frequency"], lengths) + 8 * len(huffman_table_bytes(lengths))
+        if "container_bytes" in image:
+            #coded with the caller's options as a whole .cmpt365 file, which repeats the bmp header
+            bits = 8 * (len(image["container_bytes"]) - len(image["bmp_header"]))
+            if bits < image["bits"]:
+                image["table"], image["bits"] = ARCHIVE_CONTAINER, bits
+        for table, lengths in enumerate(tables):
+            bits = table_bits(image["frequency"], lengths)
+            if bits is not None and bits < image["bits"]:
+                image["table"], image["lengths"], image["bits"] = table, lengths, bits
+    #images of one bpp are pooled into a table, the ones it does not help are dropped and the table rebuilt
+    #from the rest, then the images still on their own tables try again
+    groups = {}
+    for image in images:
+        groups.setdefault(image["bpp"], []).append(image)
+    for group in groups.values():
+        while len(group) >= 2:
+            members = group
+            for i in range(ARCHIVE_TABLE_ROUNDS):
+                lengths = huffman_tree(add_frequency_tables([image["frequency"] for image in members]))
+                gains = []
+                for image in group:
+                    bits = table_bits(image["frequency"], lengths)
+                    if bits is not None and bits < image["bits"]:
+                        gains.append((image, bits))
+                if len(gains) == len(members):
+                    break
+                if len(gains) >= 2:
+                    members = [image for image, bits in gains]
                 else:
-                    continue
-                img.put(f"#{r:02x}{g:02x}{b:02x}", (x, y))
-    #make a deep copy
-    #print(current_pixels)
-    return img
+                    #nobody is helped, keep the half the table fits best and try again
+                    fit = {id(image): (table_bits(image["frequency"], lengths) or 1 << 62) / image["bits"]
+                           for image in members}
+                    members = sorted(members, key=lambda image: fit[id(image)])[:len(members) // 2]
+                    if len(members) < 2:
+                        break
+            if len(gains) < 2 or sum(image["bits"] - bits for image, bits in gains) <= 8 * len(huffman_table_bytes(lengths)):
+                break
+            for image, bits in gains:
+                image["table"], image["lengths"], image["bits"] = len(tables), lengths, bits
+            tables.append(lengths)
+            group = [image for image in group if image["table"] in (ARCHIVE_OWN_TABLE, ARCHIVE_CONTAINER)]
+    return tables
+
+def archive_member_bytes(image):
+    #stored bytes of one small member: bmp header, its table if it has its own, then the huffman stream
+    encoded_bytes, bitlength = huffman_encoding(image["pixel_data"], huffman_code(image["lengths"]))
+    table_bytes = huffman_table_bytes(image["lengths"]) if image["table"] == ARCHIVE_OWN_TABLE else b''
+    return image["bmp_header"] + table_bytes + encoded_bytes, bitlength
+
+def archive_index_bytes(members, tables):
+    index = [ARCHIVE_INDEX.pack(len(members), len(tables))]
+    index += [huffman_table_bytes(lengths) for lengths in tables]
+    for name, entry in members.items():
+        name_bytes = name.encode("utf-8")
+        index.append(ARCHIVE_ENTRY.pack(*[entry[field] for field in ARCHIVE_FIELDS], len(name_bytes)) + name_bytes)
+    return b''.join(index)
+
+def parse_archive_index(index_bytes):
+    #members by name and the shared code lengths
+    if len(index_bytes) < ARCHIVE_INDEX.size:
+        raise ValueError("Truncated CMPT365 file")
+    member_count, table_count = ARCHIVE_INDEX.unpack_from(index_bytes)
+    pos = ARCHIVE_INDEX.size
+    tables = []
+    for i in range(table_count):
+        lengths, pos = parse_huffman_table(index_bytes, pos)
+        tables.append(lengths)
+    members = {}
+    for i in range(member_count):
+        if len(index_bytes) < pos + ARCHIVE_ENTRY.size:
+            raise ValueError("Truncated CMPT365 file")
+        fields = ARCHIVE_ENTRY.unpack_from(index_bytes, pos)
+        pos += ARCHIVE_ENTRY.size
+        name_bytes = bytes(index_bytes[pos:pos + fields[-1]])
+        pos += fields[-1]
+        entry = dict(zip(ARCHIVE_FIELDS, fields))
+        if len(name_bytes) != fields[-1] or ARCHIVE_OWN_TABLE > entry["table"] >= len(tables):
+            raise ValueError("Corrupt CMPT365 file")
+        members[name_bytes.decode("utf-8", "replace")] = entry
+    return members, tables
+
+def read_archive_index(f):
+    #the trailer at the end points at the index, the members stay on disk
+    f.seek(0, 2)
+    end = f.tell()
+    f.seek(0)
+    head = f.read(ARCHIVE_HEADER.size)
+    if len(head) < ARCHIVE_HEADER.size or head[:7] != ARCHIVE_MAGIC:
+        raise ValueError("Not a CMPT365 archive")
+    version = ARCHIVE_HEADER.unpack(head)[1]
+    if version != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported CMPT365 archive version {version}")
+    if end < ARCHIVE_HEADER.size + ARCHIVE_TRAILER.size:
+        raise ValueError("Truncated CMPT365 file")
+    f.seek(end - ARCHIVE_TRAILER.size)
+    index_offset, index_size, magic = ARCHIVE_TRAILER.unpack(f.read(ARCHIVE_TRAILER.size))
+    if magic != ARCHIVE_MAGIC or index_offset < ARCHIVE_HEADER.size or index_offset + index_size > end - ARCHIVE_TRAILER.size:
+        raise ValueError("Truncated CMPT365 file")
+    f.seek(index_offset)
+    members, tables = parse_archive_index(f.read(index_size))
+    return {"members": members, "tables": tables, "end": end}
+
+def archive_add(archive_path, file_paths, names=None, replace=False, **options):
+    #compress bmp files into an archive, appending after everything already in it
+    #options go to compress_bytes for members too big to be a single huffman stream; a small member is a
+    #plain huffman stream of its raw bytes, so with options it is also compressed with them and stored as
+    #a whole .cmpt365 file when that is smaller
+    start_time = time.perf_counter()
+    if names is None:
+        names = [os.path.basename(file_path) for file_path in file_paths]
+    if len(set(names)) != len(names):
+        raise ValueError("Member names must be unique")
+    exists = os.path.exists(archive_path)
+    if exists:
+        with open(archive_path, "rb") as f:
+            archive = read_archive_index(f)
+    else:
+        archive = {"members": {}, "tables": [], "end": 0}
+    members, tables = archive["members"], archive["tables"]
+    for name in names:
+        if name in members and not replace:
+            raise ValueError(f"{name} is already in {archive_path}")
+
+    images = []
+    for file_path, name in zip(file_paths, names):
+        with open(file_path, "rb") as f:
+            bmp_bytes = f.read()
+        if check_is_bmp(bmp_bytes) != b'BM':
+            raise ValueError(f"{file_path}: Not a BMP file")
+        pixel_data = get_pixel_data(bmp_bytes)
+        images.append({"input": file_path, "name": name, "bmp_bytes": bmp_bytes, "pixel_data": pixel_data,
+                       "bmp_header": bmp_bytes[:len(bmp_bytes) - len(pixel_data)], "bpp": get_bpp(bmp_bytes),
+                       "table": ARCHIVE_CONTAINER})
+    small = [image for image in images if len(image["pixel_data"]) <= ARCHIVE_SMALL]
+    for image in small:
+        image["frequency"] = pixel_frequency_table(image["pixel_data"])
+        if options:
+            image["container_bytes"] = compress_bytes(image["bmp_bytes"], **options)[0]
+    choose_archive_tables(small, tables)
+
+    #every member is encoded before the archive is touched, a failing encode leaves it as it was
+    for image in images:
+        image["bitlength"] = 0
+        if image["table"] == ARCHIVE_CONTAINER:
+            if "container_bytes" not in image:
+                image["container_bytes"] = compress_bytes(image["bmp_bytes"], **options)[0]
+            image["member_bytes"] = image["container_bytes"]
+            image["mode"] = "container"
+        else:
+            image["member_bytes"], image["bitlength"] = archive_member_bytes(image)
+            image["mode"] = "own table" if image["table"] == ARCHIVE_OWN_TABLE else f"shared table {image['table']}"
+
+    results = []
+    #members go after the old trailer so nothing written before moves, the old index is left as dead bytes
+    with open(archive_path, "r+b" if exists else "wb") as f:
+        try:
+            if exists:
+                f.seek(archive["end"])
+            else:
+                f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+            offset = f.tell()
+            for image in images:
+                bmp_bytes, member_bytes = image["bmp_bytes"], image["member_bytes"]
+                f.write(member_bytes)
+                members[image["name"]] = {"offset": offset, "size": len(member_bytes),
+                                          "original_size": get_file_size(bmp_bytes), "width": get_width(bmp_bytes),
+                                          "height": get_height(bmp_bytes), "bpp": image["bpp"],
+                                          "header_size": len(image["bmp_header"]),
+                                          "pixel_data_size": len(image["pixel_data"]),
+                                          "bitlength": image["bitlength"], "table": image["table"]}
+                offset += len(member_bytes)
+                stored_size = len(member_bytes) + ARCHIVE_ENTRY.size + len(image["name"].encode("utf-8"))
+                results.append({"input": image["input"], "output": f"{archive_path}:{image['name']}",
+                                "original_size": len(bmp_bytes), "compressed_size": stored_size,
+                                "ratio": len(bmp_bytes) / stored_size, "mode": image["mode"]})
+            index_bytes = archive_index_bytes(members, tables)
+            f.write(index_bytes)
+            f.write(ARCHIVE_TRAILER.pack(offset, len(index_bytes), ARCHIVE_MAGIC))
+        except BaseException:
+            #cut off the half written members so the old trailer is the last bytes again
+            f.truncate(archive["end"])
+            if not exists:
+                f.close()
+                os.remove(archive_path)
+            raise
+    archive_time = (time.perf_counter() - start_time) * 1000
+    for stats in results:
+        stats["time_ms"] = archive_time / len(results)
+    return results
+
+def decode_archive_member(entry, member_bytes, tables, decode_tables=None):
+    #bmp bytes of one member, decode_tables keeps the shared tables' decode tables between members
+    if len(member_bytes) != entry["size"]:
+        raise ValueError("Truncated CMPT365 file")
+    if entry["table"] == ARCHIVE_CONTAINER:
+        return decompress_bytes(member_bytes)[0]
+    bmp_header = bytes(member_bytes[:entry["header_size"]])
+    pos = entry["header_size"]
+    decode_table = None
+    if entry["table"] == ARCHIVE_OWN_TABLE:
+        lengths, pos = parse_huffman_table(member_bytes, pos)
+    else:
+        lengths = tables[entry["table"]]
+        if decode_tables is not None:
+            if entry["table"] not in decode_tables:
+                decode_tables[entry["table"]] = huffman_decode_table(lengths)
+            decode_table = decode_tables[entry["table"]]
+    encoded_bytes = member_bytes[pos:]
+    if len(encoded_bytes) * 8 < entry["bitlength"]:
+        raise ValueError("Truncated CMPT365 file")
+    pixel_data = huffman_decoding(encoded_bytes, entry["bitlength"], lengths, decode_table)
+    if len(pixel_data) != entry["pixel_data_size"]:
+        raise ValueError("Corrupt CMPT365 file")
+    return bmp_header + pixel_data
+
+def archive_extract(archive_path, names=None):
+    #(name, bmp bytes) for the named members, or all of them, reading only the index and those members
+    with open(archive_path, "rb") as f:
+        archive = read_archive_index(f)
+        members = archive["members"]
+        if names is None:
+            names = list(members)
+        decode_tables = {}
+        for name in names:
+            entry = members.get(name)
+            if entry is None:
+                raise ValueError(f"{name} is not in {archive_path}")
+            f.seek(entry["offset"])
+            yield name, decode_archive_member(entry, f.read(entry["size"]), archive["tables"], decode_tables)
+
+def archive_member(archive_path, name):
+    #bmp bytes of one member
+    for name, bmp_bytes in archive_extract(archive_path, [name]):
+        return bmp_bytes
+
+def archive_members(archive_path):
+    #index entries by name, in the order they were added
+    with open(archive_path, "rb") as f:
+        return read_archive_index(f)["members"]
+
+
+def cache_settings(options):
+    #codec settings that change the output bytes, compress_file defaults filled in
+    settings = {"version": CONTAINER_VERSION, "block_size": BLOCK_SIZE, "predictor": None, "planar": True,
+                "coder": "huffman", "tile_width": None, "preview": None, "rle": False, "lz_effort": LZ_EFFORT,
+                "lz_window": LZ_WINDOW, "reference": None}
+    settings.update((name, value) for name, value in options.items() if name in settings)
+    if settings["reference"]:
+        #the reference's content, not its path, decides the output
+        settings["reference"] = load_reference(settings["reference"])[1].hex()
+    return settings
+
+def content_key(file_path, settings):
+    #hash of the input bytes and the settings, equal keys give equal outputs
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(partial(f.read, 1 << 20), b''):
+            h.update(chunk)
+    h.update(json.dumps(settings, sort_keys=True).encode())
+    return h.hexdigest()
+
+def manifest_path_for(output_path):
+    return os.path.join(os.path.dirname(os.path.abspath(output_path)), CACHE_MANIFEST)
+
+def load_manifest(manifest_path):
+    #a missing or broken manifest just means nothing is cached
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+def save_manifest(manifest_path, manifest):
+    #write then rename so a crash never leaves half a manifest
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+def cache_lookup(manifest, key, file_path, output_path):
+    #stats of an up to date output, None when it has to be compressed
+    entry = manifest.get(os.path.basename(output_path))
+    try:
+        st = os.stat(output_path)
+    except OSError:
+        st = None
+    with cache_lock:
+        if (isinstance(entry, dict) and st and entry.get("key") == key and entry.get("size") == st.st_size
+                and entry.get("mtime_ns") == st.st_mtime_ns):
+            cache_counters["compress_hits"] += 1
+            return dict(entry["stats"], input=file_path, output=output_path, cached=True)
+        cache_counters["compress_misses"] += 1
+    return None
+
+def cache_store(manifest, key, output_path, stats):
+    st = os.stat(output_path)
+    manifest[os.path.basename(output_path)] = {"key": key, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                                               "stats": {name: value for name, value in stats.items()
+                                                         if name != "stages"}}
+
+def compress_cached(file_path, output_path=None, **options):
+    #compress_file that skips the work when the output already matches the input and settings
+    if output_path is None:
+        output_path = file_path.rsplit('.', 1)[0] + '.cmpt365'
+    key = content_key(file_path, cache_settings(options))
+    manifest_path = manifest_path_for(output_path)
+    manifest = load_manifest(manifest_path)
+    stats = cache_lookup(manifest, key, file_path, output_path)
+    if stats is None:
+        stats = compress_file(file_path, output_path, **options)
+        cache_store(manifest, key, output_path, stats)
+        save_manifest(manifest_path, manifest)
+    return stats
+
+def decoded_key(file_path):
+    #a rewritten file gets a new key
+    st = os.stat(file_path)
+    return os.path.abspath(file_path), st.st_size, st.st_mtime_ns
+
+def decoded_cache_get(key):
+    with cache_lock:
+        if key in decoded_cache:
+            decoded_cache.move_to_end(key)
+            cache_counters["decoded_hits"] += 1
+            return decoded_cache[key][0]
+        cache_counters["decoded_misses"] += 1
+    return None
+
+def decoded_cache_put(key, value, size):
+    global decoded_cache_bytes
+    if size > DECODED_CACHE_BYTES:
+        return
+    with cache_lock:
+        if key in decoded_cache:
+            decoded_cache_bytes -= decoded_cache.pop(key)[1]
+        decoded_cache[key] = (value, size)
+        decoded_cache_bytes += size
+        #drop the least recently used images until the budget fits again
+        while decoded_cache_bytes > DECODED_CACHE_BYTES:
+            old_key, (old_value, old_size) = decoded_cache.popitem(last=False)
+            decoded_cache_bytes -= old_size
+            cache_counters["decoded_evictions"] += 1
+
+def cache_stats():
+    with cache_lock:
+        return dict(cache_counters, decoded_entries=len(decoded_cache), decoded_bytes=decoded_cache_bytes,
+                    decoded_budget=DECODED_CACHE_BYTES)
+
+# lookup tables to unpack 4 and 1 bpp colour indices with bytes.translate
+HIGH_NIBBLE = bytes(x >> 4 for x in range(256))
+LOW_NIBBLE = bytes(x & 0x0F for x in range(256))
+BIT_TABLES = [bytes((x >> (7 - i)) & 0x01 for x in range(256)) for i in range(8)]
+HEX_DIGITS = b'0123456789abcdef'.ljust(256, b'x') #index bytes to hex digits, bad indices stop fromhex
+
+def unpack_indices(row, w, bpp):
+    # one colour index byte per pixel
+    if bpp == 8:
+        return row[:w]
+    if bpp == 4:
+        # two pixels per byte, upper four bits first
+        indices = bytearray(len(row) * 2)
+        indices[0::2] = row.translate(HIGH_NIBBLE)
+        indices[1::2] = row.translate(LOW_NIBBLE)
+        return indices[:w]
+    # 8 pixels for a byte, most significant bit first
+    indices = bytearray(len(row) * 8)
+    for i, table in enumerate(BIT_TABLES):
+        indices[i::8] = row.translate(table)
+    return indices[:w]
+
+def bmp_to_rgb(pixel_data, colour_table, w, h, bpp):
+    # bottom up, padded bmp rows to top down packed r,g,b bytes
+    stride = ((bpp * w + 31) // 32) * 4
+    row_bytes = (bpp * w + 7) // 8
+    pixel_data = bytes(pixel_data)
+    if len(pixel_data) < stride * h:
+        #missing pixels stay black
+        pixel_data += bytes(stride * h - len(pixel_data))
+    rows = [pixel_data[stride * (h - 1 - y):stride * (h - 1 - y) + row_bytes] for y in range(h)]
+    rgb = bytearray(w * h * 3)
+    if bpp == 24:
+        bgr = b''.join(rows)
+        rgb[0::3] = bgr[2::3]
+        rgb[1::3] = bgr[1::3]
+        rgb[2::3] = bgr[0::3]
+    elif bpp in (1, 4, 8):
+        indices = b''.join(unpack_indices(row, w, bpp) for row in rows)
+        # every colour table entry is b, g, r, reserved
+        palette = bytes(colour_table or b'')[:1024]
+        palette += bytes(1024 - len(palette))
+        rgb[0::3] = indices.translate(palette[2::4])
+        rgb[1::3] = indices.translate(palette[1::4])
+        rgb[2::3] = indices.translate(palette[0::4])
+    return bytes(rgb)
+
+def photo_image(rgb, w, h):
+    # one PPM upload instead of a put per pixel
+    if w <= 0 or h <= 0:
+        return tk.PhotoImage(width=max(w, 0), height=max(h, 0))
+    return tk.PhotoImage(width=w, height=h, data=b'P6\n%d %d\n255\n' % (w, h) + bytes(rgb), format='PPM')
+
+# decoded image as packed top down r,g,b bytes, 3 bytes per pixel
+PixelBuffer = namedtuple("PixelBuffer", ["width", "height", "data"])
+
+def crop_pixels(pixels, x, y, w, h):
+    row = pixels.width * 3
+    return PixelBuffer(w, h, b''.join([pixels.data[(y + i) * row + x * 3:(y + i) * row + (x + w) * 3]
+                                       for i in range(h)]))
+
+def adjust_brightness(pixels, factor):
+    # same change for every channel value, so one table covers all pixels
+    if (factor < 1.0): #make darker
+        table = bytes(min(255, int(x * factor)) for x in range(256))
+    else: #make brighter
+        table = bytes(min(255, int(x * factor + (factor-1)*128)) for x in range(256))
+    return pixels._replace(data=pixels.data.translate(table))
+
+def scale_pixels(pixels, factor):
+    if factor == 1.0:
+        return pixels
+    return resize_pixels(pixels, int(pixels.width * factor), int(pixels.height * factor))
+
+def resize_pixels(pixels, w, h):
+    # nearest neighbour resize, whole rows are gathered with itemgetter
+    if w == pixels.width and h == pixels.height:
+        return pixels
+    if w <= 0 or h <= 0:
+        return PixelBuffer(w, h, b'')
+    ratio_w = pixels.width / w
+    ratio_h = pixels.height / h
+    #using pixel aggregation and flooring them with int
+    pick = operator.itemgetter(*[int(x*ratio_w) * 3 + c for x in range(w) for c in range(3)])
+    row_size = pixels.width * 3
+    rows = {}
+    data = []
+    for y in range(h):
+        source = int(y*ratio_h)
+        if source not in rows:
+            rows[source] = bytes(pick(pixels.data[source * row_size:(source + 1) * row_size]))
+        data.append(rows[source])
+    return PixelBuffer(w, h, b''.join(data))
+
+def half_pixels(pixels):
+    # 2x2 box filter, an odd last row or column is dropped
+    w = pixels.width // 2
+    h = pixels.height // 2
+    row_size = pixels.width * 3
+    top = b''.join([pixels.data[2 * y * row_size:2 * y * row_size + w * 6] for y in range(h)])
+    bottom = b''.join([pixels.data[(2 * y + 1) * row_size:(2 * y + 1) * row_size + w * 6] for y in range(h)])
+    rows = bytes_average(top, bottom)
+    data = bytearray(w * h * 3)
+    for c in range(3):
+        #pixels pair up within a row since the rows have an even width
+        data[c::3] = bytes_average(rows[c::6], rows[c + 3::6])
+    return PixelBuffer(w, h, bytes(data))
+
+def build_pyramid(pixels):
+    levels = [pixels]
+    while min(levels[-1].width, levels[-1].height) >= 2 and max(levels[-1].width, levels[-1].height) > PYRAMID_MIN:
+        levels.append(half_pixels(levels[-1]))
+    return levels
+
+def pyramid_level(levels, w, h):
+    # smallest level that is still at least w x h, so shrinking from it never needs pixels it lacks
+    level = 0
+    while level + 1 < len(levels) and levels[level + 1].width >= w and levels[level + 1].height >= h:
+        level += 1
+    return level
+
+def mask_channels(pixels, r, g, b):
+    # clear every disabled channel in one go
+    data = bytearray(pixels.data)
+    for channel, enabled in enumerate((r, g, b)):
+        if not enabled:
+            data[channel::3] = bytes(pixels.width * pixels.height)
+    return pixels._replace(data=bytes(data))
+
+def show_image(new_img):
+    image.config(image="")
+    image.image= None
+    image.configure(image=new_img)
+    image.image = new_img
+
+def place_image(img):
+    global image
+    if image: #refresh
+        image.destroy()
+    image = tk.Label(root, image=img)
+    image.image = img
+    image.grid(row=3, column=1)
+
+def show_pixels(pixels, levels=None):
+    global current_pixels, old_pixels, pyramid, view_cache_bytes, rendered
+    #buffers are never changed in place, so no copy is needed
+    old_pixels = pixels
+    current_pixels = pixels
+    pyramid = levels or build_pyramid(pixels)
+    view_cache.clear()
+    view_cache_bytes = 0
+    brightness_slider.set(50)
+    scale_slider.set(50)
+    place_image(photo_image(pixels.data, pixels.width, pixels.height))
+    rendered = (50, 50, True, True, True)
+
+def view_pixels(w, h, val):
+    #resized from the nearest pyramid level then brightened, recent results are kept for dragging back
+    global view_cache_bytes
+    key = (w, h, val)
+    if key in view_cache:
+        view_cache.move_to_end(key)
+        return view_cache[key]
+    if val == 50:
+        pixels = resize_pixels(pyramid[pyramid_level(pyramid, w, h)], w, h)
+    else:
+        pixels = adjust_brightness(view_pixels(w, h, 50), val / 50)
+    view_cache[key] = pixels
+    view_cache_bytes += len(pixels.data)
+    while view_cache_bytes > VIEW_CACHE_BYTES and len(view_cache) > 1:
+        key, old = view_cache.popitem(last=False)
+        view_cache_bytes -= len(old.data)
+    return pixels
+
+def render_view():
+    #draw the image for the current slider and channel settings
+    global current_pixels, render_pending, rendered
+    render_pending = None
+    if not pyramid:
+        return
+    state = (scale_slider.get(), brightness_slider.get(), r, g, b)
+    if state == rendered:
+        return
+    rendered = state
+    # 50% is original 25% half the size, factor is 0 - 2
+    factor = state[0] / 50
+    w = int(old_pixels.width * factor)
+    h = int(old_pixels.height * factor)
+    #if 0% image disappears
+    if w <= 0 or h <= 0:
+        current_pixels = PixelBuffer(w, h, b'')
+        image.config(image="")
+        image.image= None
+        return
+    current_pixels = view_pixels(w, h, state[1])
+    pixels = current_pixels if r and g and b else mask_channels(current_pixels, r, g, b)
+    show_image(photo_image(pixels.data, pixels.width, pixels.height))
+
+def schedule_render():
+    #slider ticks only queue one render, which reads the latest values when it runs
+    global render_pending
+    if render_pending is None:
+        render_pending = root.after(SLIDER_MS, render_view)
+
+def bmp_pixels(bmp_bytes):
+    #header fields and r,g,b pixels of a whole bmp file
+    if (check_is_bmp(bmp_bytes) != b'BM'):
+        raise ValueError("This is not a BMP file, retry")
+    w = get_width(bmp_bytes)
+    h = get_height(bmp_bytes)
+    bpp = get_bpp(bmp_bytes)
+    if bpp not in [1, 4, 8, 16, 24]:
+        print("Error: bpp not valid")
+    colour_table = get_colour_table(bmp_bytes) if bpp in [1, 4, 8] else None
+    with stage("render", len(bmp_bytes)) as record:
+        rgb = bmp_to_rgb(get_pixel_data(bmp_bytes), colour_table, w, h, bpp)
+        record["bytes_out"] = len(rgb)
+    pixels = PixelBuffer(w, h, rgb)
+    with stage("pyramid", len(rgb)):
+        levels = build_pyramid(pixels)
+    return {"size": get_file_size(bmp_bytes), "width": w, "height": h, "bpp": bpp, "pixels": pixels,
+            "levels": levels}
+
+# the *_job functions run on the worker thread and never touch tk widgets,
+# their results are handed over by poll_jobs
+def load_job(file_path, job):
+    key = decoded_key(file_path)
+    result = decoded_cache_get(key)
+    if result is None:
+        with open(file_path, "rb") as f:
+            result = bmp_pixels(f.read())
+        decoded_cache_put(key, result, sum(len(level.data) for level in result["levels"]))
+    return result
+
+def compress_job(file_path, job, cache=False):
+    #cache is the viewer's checkbox, read on the tk thread like --cache on the command line
+    compress = compress_cached if cache else compress_file
+    return compress(file_path, stream=True, progress=job_progress(job))
+
+def decompress_job(file_path, job):
+    #a recently opened file comes straight from memory
+    key = decoded_key(file_path)
+    result = decoded_cache_get(key)
+    if result is not None:
+        return result
+    preview = read_preview(file_path)
+    if preview:
+        #blown up to about full size so it can stand in for the image
+        preview = scale_pixels(preview, file_info(file_path)["width"] / max(preview.width, 1))
+        job_events.put((job, "preview", preview))
+    sink = io.BytesIO()
+    decompress_stream(file_path, sink, job_progress(job))
+    result = bmp_pixels(sink.getvalue())
+    decoded_cache_put(key, result, sum(len(level.data) for level in result["levels"]))
+    return result
+
+def job_progress(job):
+    #progress callback for the codec, a cancel request stops the job at the next band
+    def progress(done, total):
+        if job["cancel"].is_set():
+            raise JobCancelled()
+        job["progress"] = (done, total)
+    return progress
+
+def run_jobs():
+    #worker thread, one job at a time in the order they were queued
+    while True:
+        job = job_queue.get()
+        try:
+            if job["cancel"].is_set():
+                raise JobCancelled()
+            job_events.put((job, "done", job["function"](job)))
+        except Exception as e:
+            job_events.put((job, "error", e))
+
+def submit_job(name, function, on_done, on_preview=None):
+    global worker
+    job = {"name": name, "function": function, "on_done": on_done, "on_preview": on_preview,
+           "cancel": Event(), "progress": None}
+    active_jobs.append(job)
+    job_queue.put(job)
+    if worker is None:
+        worker = Thread(target=run_jobs, daemon=True)
+        worker.start()
+    return job
+
+def cancel_jobs():
+    for job in active_jobs:
+        job["cancel"].set()
+
+def poll_jobs():
+    #runs on the tk thread every POLL_MS, the only place job results reach the widgets
+    root.after(POLL_MS, poll_jobs)
+    while True:
+        try:
+            job, event, value = job_events.get_nowait()
+        except queue.Empty:
+            break
+        if event == "preview":
+            if job["on_preview"] and not job["cancel"].is_set():
+                job["on_preview"](value)
+            continue
+        active_jobs.remove(job)
+        if event == "done":
+            job["on_done"](value)
+        elif isinstance(value, JobCancelled):
+            check_label.config(text=f"{job['name']} cancelled")
+        else:
+            print(f"{job['name']} failed: {value}")
+            check_label.config(text=f"{job['name']} failed\n{value}")
+
+    text = ""
+    if active_jobs:
+        text = active_jobs[0]["name"]
+        if active_jobs[0]["progress"]:
+            done, total = active_jobs[0]["progress"]
+            text += f" {100 * done // max(total, 1)}%"
+        if len(active_jobs) > 1:
+            text += f" ({len(active_jobs) - 1} queued)"
+    progress_label.config(text=text)
 
 def browse_file():
     filepath = tk.filedialog.askopenfilename()
@@ -495,221 +2919,18 @@ def display_header_metadata(s, w, h, bpp):
     bpp_label.config(text="Bits Per Pixel: " + str(bpp))
 
 def change_brightness(val):
-    global current_pixels
-    #print(current_pixels)
     # 50% is original 25% half as bright
-    # factor is 0 - 2
-    new_val = float(val) / 50
-    #if 50% just keep the original picture
-    if new_val == 1.0:
-        return
-    w = len(current_pixels[0])
-    h = len(current_pixels)
-    new_img = tk.PhotoImage(width=w, height=h)
-    y_count = 0
-    #iterate through current_pixels so that the size doesnt reset
-    for y in (current_pixels):
-        x_count = 0
-        for x in y:
-            if (new_val < 1.0): #make darker
-                r = min(255, int(x[0] * new_val))
-                g = min(255, int(x[1] * new_val))
-                b = min(255, int(x[2] * new_val))
-            else: #make brighter
-                r = min(255, int(x[0] * new_val + (new_val-1)*128))
-                g = min(255, int(x[1] * new_val + (new_val-1)*128))
-                b = min(255, int(x[2] * new_val + (new_val-1)*128))
-            
-            new_img.put(f"#{r:02x}{g:02x}{b:02x}", (x_count, y_count))
-            x_count+=1
-        y_count+=1
-    
-    image.config(image="")
-    image.image= None
-    image.configure(image=new_img)
-    image.image = new_img
+    schedule_render()
 
 def change_size(val):
-    global current_pixels, old_pixels
-    #print(old_pixels)
-    current_pixels.clear() #do not add to the original picture, change it
-    new_val = float(val) / 50
     #50% original, 25% is half the size
-    # factor is 0 - 2
-    #if 50% just return original
-    if new_val == 1.0:
-        return
-    #print(old_pixels)
-    w = len(old_pixels[0]) * new_val
-    h = len(old_pixels) * new_val
-    #if 0% image disappears
-    if (w == 0 or h == 0):
-        image.config(image="")
-        image.image= None
-        return
-
-    ratio_w = len(old_pixels[0]) / w
-    ratio_h = len(old_pixels) / h
-    new_img = tk.PhotoImage(width=int(w), height=int(h))
-    
-    for y in range(int(h)):
-        row=[]
-        for x in range(int(w)):
-            #using pixel aggregation and flooring them with int
-            r = old_pixels[int(y*ratio_h)][int(x*ratio_w)][0]
-            g = old_pixels[int(y*ratio_h)][int(x*ratio_w)][1]
-            b = old_pixels[int(y*ratio_h)][int(x*ratio_w)][2]
-            row.append((r, g, b))
-            new_img.put(f"#{r:02x}{g:02x}{b:02x}", (x, y))
-        current_pixels.append(row)
-    
-    image.config(image="")
-    image.image= None
-    image.configure(image=new_img)
-    image.image = new_img
-    brightness_slider.set(50)
-
-def display_image(file_path, pixel_data, colour_table, w, h, bpp):
-    global current_pixels
-    img = tk.PhotoImage(width=w, height=h)
-    old_pixels.clear()
-    # calculate if bpp is 24
-    #3 bytes per pixel
-    if bpp == 24:
-        for y in range(h):
-            row=[]
-            # pad to 4-bytes, going from bottom to top
-            a = (((bpp * w + 31) // 32) * 4) * (h - 1 - y) 
-            for x in range(w):
-                #location of the pixel's first byte
-                c = a + x * 3
-                
-                r = pixel_data[c+2]
-                g = pixel_data[c+1]
-                b = pixel_data[c]
-                row.append((r, g, b))
-                img.put(f"#{r:02x}{g:02x}{b:02x}", (x, y))
-            old_pixels.append(row)
-    # for 8
-    elif bpp == 8:
-        #every pixel maps to one index
-        for y in range(h):
-            row=[]
-            # pad to 4-bytes, going from bottom to top
-            a = (((bpp * w + 31) // 32) * 4) * (h - 1 - y)
-            for x in range(w):
-                c = a + x 
-                colour_index = pixel_data[c]
-                
-                # Every index is 4 bytes with reserved
-                r = colour_table[(colour_index*4)+2]
-                g = colour_table[(colour_index*4)+1]
-                b = colour_table[(colour_index*4)]
-                
-                row.append((r, g, b))
-                #print(colour)
-                img.put(f"#{r:02x}{g:02x}{b:02x}", (x, y))
-            old_pixels.append(row)
-    #for 4
-    # two pixels per byte
-    elif bpp == 4:
-        for y in range(h):
-            row =[]
-            # padded, going from bottom to top
-            a = (((bpp * w + 31) // 32) * 4) * (h - 1 - y)
-            for x in range(w):
-                c = a + (x // 2) 
-                
-                if x % 2 != 0:
-                    # lower part, four least significant bits
-                    # 4 right values
-                    colour_index = pixel_data[c] & 0x0F
-
-                else:
-                    # upper part four most significant bits
-                    # 4 left values
-                    # push values to the right and retrieve
-                    colour_index = (pixel_data[c] >> 4) & 0x0F
-                
-                
-                r = colour_table[(colour_index*4)+2]
-                g = colour_table[(colour_index*4)+1]
-                b = colour_table[(colour_index*4)]
-                
-                row.append((r, g, b))
-                #print(colour)
-                img.put(f"#{r:02x}{g:02x}{b:02x}", (x, y))
-            old_pixels.append(row)
-
-    #for 1
-    # 8 pixels for a byte
-    elif bpp == 1:
-
-        for y in range(h):
-            row=[]
-            a = (((bpp * w + 31) // 32) * 4) * (h - 1 - y)
-            for x in range(w):
-                # byte index
-                c = a + (x // 8)
-                # bit index
-                z = 7 - (x % 8)
-                
-                # get one bit for the pixel
-                colour_index = (pixel_data[c] >>  z) & 0x01
-                
-                r=colour_table[(colour_index*4)+2]
-                g=colour_table[(colour_index*4)+1]
-                b=colour_table[(colour_index*4)]
-                
-                row.append((r, g, b))
-                img.put(f"#{r:02x}{g:02x}{b:02x}", (x, y))
-            old_pixels.append(row)
-
-    #make a deep copy
-    current_pixels = [[pixel for pixel in row] for row in old_pixels]
-    #print(current_pixels)
-    return img
-                
+    schedule_render()
 
 def rgb_toggle():
-    
-    global current_pixels, r, g, b, image
-    if not current_pixels:
+    if not current_pixels or not current_pixels.data:
         # if current pixels is empty
         return
-    
-    w= len(current_pixels[0])
-    h = len(current_pixels)
-    new_img = tk.PhotoImage(width=w, height=h)
-    for y in range(h):
-        for x in range(w):
-            # retrieve r,g,b tuple
-            rgb= current_pixels[y][x]
-            
-            if (r): 
-                #enable r
-                new_r = rgb[0]
-            else:
-                #disable r
-                new_r=0
-            if (g):
-                #enable g
-                new_g = rgb[1]
-            else:
-                #disable g
-                new_g=0
-            if (b):
-                #enable b
-                new_b = rgb[2]
-            else:
-                #disable g
-                new_b = 0
-            new_img.put(f"#{new_r:02x}{new_g:02x}{new_b:02x}", (x, y))
-    image.config(image="")
-    image.image = None
-    image.configure(image = new_img)
-    image.image = new_img
-    brightness_slider.set(50)
+    render_view()
 
 def r_toggle():
     global r
@@ -727,87 +2948,355 @@ def b_toggle():
     rgb_toggle()
 
 def get_metadata():
-    global image, old_pixels, current_pixels
     file_path = file_path_entry.get()
     print(file_path)
-    with open(file_path, "rb") as f:
-        bmp_bytes = f.read()
-
-    if (check_is_bmp(bmp_bytes) != b'BM'):
-        print("Not a BMP file")
-        check_label.config(text="This is not a BMF file, retry")
-        return #so it does not crash
+    submit_job(f"Loading {os.path.basename(file_path)}", partial(load_job, file_path), loaded)
+
+def loaded(result):
+    print("This is a BMF file")
+    check_label.config(text="BMF file check successful")
+    display_header_metadata(result["size"], result["width"], result["height"], result["bpp"])
+    show_pixels(result["pixels"], result["levels"])
+
+def cli_job(command, file_path, output_path, jobs=1, block_size=BLOCK_SIZE, stream=False, predictor=None,
+            planar=True, coder="huffman", tile_width=None, preview=None, rle=False, lz_effort=LZ_EFFORT,
+            lz_window=LZ_WINDOW, reference=None, profile_memory=False):
+    #runs in a worker process
+    with Profile(memory=profile_memory):
+        if command == "compress":
+            return compress_file(file_path, output_path, jobs, block_size, stream, predictor, planar, coder,
+                                 tile_width, preview, rle, lz_effort, lz_window, reference=reference)
+        if command == "decompress":
+            return decompress_file(file_path, output_path, jobs, stream, reference=reference)
+    return file_info(file_path)
+
+def collect_files(paths, extension):
+    #files are taken as given, directories are searched for the extension
+    #cache manifests are skipped, --cache writes them into output folders that info is then run on
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    if name in (CACHE_MANIFEST, CACHE_MANIFEST + ".tmp"):
+                        continue
+                    if name.lower().endswith(extension):
+                        files.append(os.path.join(folder, name))
+        else:
+            files.append(path)
+    return files
+
+def output_path_for(file_path, extension, output_dir):
+    if output_dir is None:
+        return file_path.rsplit('.', 1)[0] + extension
+    name = os.path.basename(file_path).rsplit('.', 1)[0] + extension
+    return os.path.join(output_dir, name)
+
+def format_stats(command, stats):
+    if command == "info" and stats["format"] == "CMPTARC":
+        return (f"{stats['input']}: CMPTARC {stats['members']} members, {stats['tables']} shared tables, "
+                f"{stats['size']} bytes (original {stats['original_size']} bytes, ratio {stats['ratio']:.4f})")
+    if command == "info":
+        text = f"{stats['input']}: {stats['format']} {stats['width']}x{stats['height']} {stats['bpp']} bpp, {stats['size']} bytes"
+        if stats["format"] == "CMPT365":
+            text += f" (version {stats['version']}, original {stats['original_size']} bytes, ratio {stats['ratio']:.4f}"
+            if "blocks" in stats:
+                text += f", {stats['blocks']} blocks"
+            if stats.get("planar"):
+                text += ", planar"
+            if stats.get("tile_width"):
+                text += f", {stats['tile_width']} px tiles"
+            if stats.get("preview"):
+                text += ", preview"
+            if stats.get("rle"):
+                text += ", rle"
+            if stats.get("reference"):
+                text += f", delta from {stats['reference'][:16]}"
+            if "coder" in stats:
+                text += f", {stats['coder']}"
+            text += ")"
+        return text
+    sizes = (stats['original_size'], stats['compressed_size'])
+    if command == "decompress":
+        sizes = sizes[::-1]
+    if stats.get("cached"):
+        return f"{stats['input']} -> {stats['output']}: up to date, ratio {stats['ratio']:.4f} (cached)"
+    text = (f"{stats['input']} -> {stats['output']}: {sizes[0]} -> {sizes[1]} bytes, "
+            f"ratio {stats['ratio']:.4f}, {stats['time_ms']:.2f} ms")
+    if "mode" in stats:
+        text += f" ({stats['mode']})"
+    return text
+
+def format_profile(stats):
+    #one line per stage, nested stages indented under their parent
+    stages = stats.get("stages") or {}
+    total = sum(entry["ns"] for name, entry in stages.items() if "/" not in name) or 1
+    lines = []
+    for name, entry in stages.items():
+        text = (f"  {'  ' * name.count('/')}{name.rsplit('/', 1)[-1]:<{12 - 2 * name.count('/')}} "
+                f"{entry['ns'] / 1e6:10.2f} ms {100 * entry['ns'] / total:5.1f}%  x{entry['calls']}")
+        if entry["bytes_in"] and entry["bytes_out"]:
+            text += f"  {entry['bytes_in']} -> {entry['bytes_out']} bytes"
+        elif entry["bytes_in"] or entry["bytes_out"]:
+            text += f"  {entry['bytes_in'] or entry['bytes_out']} bytes"
+        if entry["symbols"]:
+            text += f", {entry['symbols']} symbols"
+        if "peak" in entry:
+            text += f", peak {entry['peak'] / 1024:.0f} KiB"
+        lines.append(text)
+    return "\n".join(lines)
+
+def add_codec_arguments(sub):
+    #how the pixels are coded, shared by compress and archive
+    sub.add_argument("--buffer-size", type=int, default=BLOCK_SIZE,
+                     help="bytes of pixel data per block (default %(default)s)")
+    sub.add_argument("--predictor", choices=list(PREDICTORS), default="none",
+                     help="row prediction filter applied before Huffman coding")
+    sub.add_argument("--interleaved", action="store_true",
+                     help="one table per block for 24 bpp images instead of one per colour plane")
+    sub.add_argument("--coder", choices=list(ENTROPY_CODERS) + ["auto"], default="huffman",
+                     help="entropy coder for the pixel bytes (default %(default)s), auto picks the coder "
+                          "(lz77 included), the predictor, the layout and --rle from a sample of rows")
+    sub.add_argument("--tile-width", type=int, default=0,
+                     help=f"cut row bands into tiles this many pixels wide (multiple of {TILE_ALIGN}) "
+                          "so regions can be decoded on their own")
+    sub.add_argument("--lz-effort", type=int, choices=list(LZ_LEVELS), default=LZ_EFFORT,
+                     help="match search effort for --coder lz77, 1 fastest, 9 smallest "
+                          "(default %(default)s)")
+    sub.add_argument("--lz-window", type=int, default=LZ_WINDOW,
+                     help="bytes a --coder lz77 match can reach back (default %(default)s)")
+    sub.add_argument("--rle", action="store_true",
+                     help="run length code runs of one colour index (or plane byte) before the entropy "
+                          "coder, for palette images and flat screenshots (--coder auto decides itself)")
+    sub.add_argument("--preview", type=int, default=0, metavar="SCALE",
+                     help="store a 1/SCALE size preview the viewer can show before the full decode")
+
+def codec_options(args):
+    #add_codec_arguments values as compress_bytes keywords
+    return {"block_size": args.buffer_size, "predictor": None if args.predictor == "none" else args.predictor,
+            "planar": not args.interleaved, "coder": args.coder, "tile_width": args.tile_width or None,
+            "preview": args.preview or None, "rle": args.rle, "lz_effort": args.lz_effort,
+            "lz_window": args.lz_window}
+
+def archive_cli(args):
+    if args.command == "archive":
+        #only the codec options given on the command line, small members are compressed with them as well
+        defaults = cache_settings({})
+        options = {name: value for name, value in codec_options(args).items() if value != defaults[name]}
+        for stats in archive_add(args.archive, collect_files(args.paths, ".bmp"), replace=args.force, **options):
+            print(format_stats("compress", stats))
+        return 0
+    if args.command == "list":
+        for name, entry in archive_members(args.archive).items():
+            table = {ARCHIVE_CONTAINER: "container", ARCHIVE_OWN_TABLE: "own table"}.get(
+                entry["table"], f"shared table {entry['table']}")
+            print(f"{name}: {entry['width']}x{entry['height']} {entry['bpp']} bpp, "
+                  f"{entry['original_size']} -> {entry['size']} bytes ({table})")
+        return 0
+    os.makedirs(args.output_dir, exist_ok=True)
+    failed = 0
+    for name, bmp_bytes in archive_extract(args.archive, args.names or None):
+        #names come from the archive, keep them inside the output folder
+        output_path = os.path.join(args.output_dir, os.path.basename(name))
+        if os.path.exists(output_path) and not args.force:
+            print(f"{name}: {output_path} exists, use --force to overwrite", file=sys.stderr)
+            failed += 1
+            continue
+        with open(output_path, "wb") as f:
+            f.write(bmp_bytes)
+        print(f"{args.archive}:{name} -> {output_path}: {len(bmp_bytes)} bytes")
+    return 1 if failed else 0
+
+def run_cli(argv):
+    parser = argparse.ArgumentParser(prog="LosslessCompressor.py",
+                                     description="Huffman compressor for BMP images (.cmpt365 files)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command, help_text in (("compress", "compress BMP files to .cmpt365"),
+                               ("decompress", "decompress .cmpt365 files back to BMP"),
+                               ("info", "print header metadata")):
+        sub = commands.add_parser(command, help=help_text)
+        sub.add_argument("paths", nargs="+", help="files or directories")
+        sub.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+        if command != "info":
+            sub.add_argument("-o", "--output-dir", help="write outputs here instead of next to the inputs")
+            sub.add_argument("-f", "--force", action="store_true", help="overwrite existing outputs")
+            sub.add_argument("--stream", action="store_true",
+                             help="work one block at a time so memory is bounded by the buffer size")
+            sub.add_argument("--profile", action="store_true", help="print the time spent in each stage")
+            sub.add_argument("--profile-memory", action="store_true",
+                             help="with --profile, also trace the peak memory of each stage (slower)")
+            sub.add_argument("--reference", metavar="FILE",
+                             help="code the differences from this .bmp or .cmpt365 frame (compress), or the "
+                                  "frame a delta file was made from (decompress)")
+        if command == "compress":
+            add_codec_arguments(sub)
+            sub.add_argument("--cache", action="store_true",
+                             help=f"skip files whose output is up to date (tracked in {CACHE_MANIFEST} "
+                                  "next to the outputs)")
+    sub = commands.add_parser("archive", help="pack BMP files into an archive, appending if it exists")
+    sub.add_argument("archive", help="archive file")
+    sub.add_argument("paths", nargs="+", help="files or directories")
+    sub.add_argument("-f", "--force", action="store_true", help="replace members with the same name")
+    add_codec_arguments(sub)
+    extract = sub = commands.add_parser("extract", help="unpack archive members as BMP files")
+    sub.add_argument("archive", help="archive file")
+    sub.add_argument("names", nargs="*", help="members to extract (default all)")
+    sub.add_argument("-o", "--output-dir", default=".", help="write the BMP files here")
+    sub.add_argument("-f", "--force", action="store_true", help="overwrite existing outputs")
+    sub = commands.add_parser("list", help="print the members of an archive")
+    sub.add_argument("archive", help="archive file")
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "extract":
+        #member names can also come after the options, which one pass over the subcommands cannot take
+        args = extract.parse_intermixed_args(argv[argv.index("extract") + 1:], argparse.Namespace(command="extract"))
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    if args.command in ("archive", "extract", "list"):
+        try:
+            return archive_cli(args)
+        except (OSError, ValueError) as e:
+            print(f"{args.archive}: {e}", file=sys.stderr)
+            return 1
+    options = {}
+    if args.command != "info":
+        options["stream"] = args.stream
+        options["reference"] = args.reference
+    if args.command == "compress":
+        options.update(codec_options(args))
+
+    extension = {"compress": ".bmp", "decompress": ".cmpt365", "info": ""}[args.command]
+    out_extension = {"compress": ".cmpt365", "decompress": ".bmp"}.get(args.command)
+    files = collect_files(args.paths, extension)
+    if args.command != "info" and args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    jobs = []
+    failed = 0
+    profile_memory = args.command != "info" and args.profile and args.profile_memory
+    cache = args.command == "compress" and args.cache
+    manifests = {} #manifest path -> manifest, loaded once per output folder
+    keys = {} #input file -> (manifest path, content key) for files that still need compressing
+    for file_path in files:
+        output_path = None
+        if out_extension:
+            output_path = output_path_for(file_path, out_extension, args.output_dir)
+            if cache:
+                manifest_path = manifest_path_for(output_path)
+                if manifest_path not in manifests:
+                    manifests[manifest_path] = load_manifest(manifest_path)
+                try:
+                    key = content_key(file_path, cache_settings(options))
+                except OSError as e:
+                    print(f"{file_path}: {e}", file=sys.stderr)
+                    failed += 1
+                    continue
+                stats = cache_lookup(manifests[manifest_path], key, file_path, output_path)
+                if stats:
+                    print(format_stats(args.command, stats))
+                    continue
+                keys[file_path] = (manifest_path, key)
+            #a stale output the cache wrote itself can be replaced without --force
+            tracked = cache and os.path.basename(output_path) in manifests[manifest_path]
+            if os.path.exists(output_path) and not args.force and not tracked:
+                print(f"{file_path}: {output_path} exists, use --force to overwrite", file=sys.stderr)
+                failed += 1
+                continue
+        jobs.append((file_path, output_path))
+
+    def report(file_path, run):
+        nonlocal failed
+        try:
+            stats = run()
+            print(format_stats(args.command, stats))
+            if args.command != "info" and args.profile and stats.get("stages"):
+                print(format_profile(stats))
+            if file_path in keys:
+                manifest_path, key = keys[file_path]
+                cache_store(manifests[manifest_path], key, stats["output"], stats)
+        except Exception as e:
+            print(f"{file_path}: {e}", file=sys.stderr)
+            failed += 1
+
+    if args.jobs <= 1 or len(jobs) <= 1:
+        #a single file uses the workers for its blocks instead
+        for file_path, output_path in jobs:
+            report(file_path, lambda: cli_job(args.command, file_path, output_path, args.jobs, **options,
+                                              profile_memory=profile_memory))
     else:
-        print("This is a BMF file")
-        check_label.config(text="BMF file check successful")
-    old_pixels.clear()
-    current_pixels.clear()
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = {pool.submit(cli_job, args.command, file_path, output_path, **options,
+                                   profile_memory=profile_memory): file_path
+                       for file_path, output_path in jobs}
+            for future in as_completed(futures):
+                report(futures[future], future.result)
+    if cache:
+        for manifest_path in set(manifest_path for manifest_path, key in keys.values()):
+            save_manifest(manifest_path, manifests[manifest_path])
+        counters = cache_stats()
+        print(f"cache: {counters['compress_hits']} hits, {counters['compress_misses']} misses")
+    return 1 if failed else 0
+
+def build_gui():
+    global root, check_label, size_label, width_label, height_label, bpp_label, progress_label
+    global brightness_slider, scale_slider, file_path_entry, r_butt, g_butt, b_butt, cache_var
+    root = tk.Tk()
+    #metadata
+    tk.Label(root, text="File Path").grid(row=0, column=0)
+    check_label=tk.Label(root, text="")
+    check_label.grid(row=8, column=0)
+    tk.Label(root, text="Header Metadata:").grid(row=3, column=0)
+    size_label=tk.Label(root, text="File Size: ")
+    size_label.grid(row=4, column=0)
+    width_label=tk.Label(root, text="Image Width: ")
+    width_label.grid(row=5, column=0)
+    height_label=tk.Label(root, text="Image height: ")
+    height_label.grid(row=6, column=0)
+    bpp_label=tk.Label(root, text="Bits Per Pixel: ")
+    bpp_label.grid(row=7, column=0)
+
+    #sliders
+    brightness_slider = tk.Scale(root, from_=0, to=100, orient=tk.HORIZONTAL, label="Brightness", command=change_brightness)
+    brightness_slider.grid(row=9, column=7)
     brightness_slider.set(50)
-    #remove old image overlap
-    try:
-        if image:
-            image.destroy()
-    except NameError:
-        pass
-    file_size = get_file_size(bmp_bytes)
-    file_width = get_width(bmp_bytes)
-    file_height = get_height(bmp_bytes)
-    file_bpp = get_bpp(bmp_bytes)
-    pixel_data = get_pixel_data(bmp_bytes)
-    colour_table = None
-    display_header_metadata(file_size, file_width, file_height, file_bpp)
-
-    if (file_bpp in [1, 4, 8, 16, 24]):
-        pixel_data=get_pixel_data(bmp_bytes)
-    else:
-        print("Error: bpp not valid")
-
-    if (file_bpp in [1, 4, 8]):
-        colour_table=get_colour_table(bmp_bytes)
-    img=display_image(file_path, pixel_data, colour_table, file_width, file_height, file_bpp)
-    # img=tk.PhotoImage(file=file_path)
-    image=tk.Label(root, image=img)
-    image.image=img
-    image.grid(row=3, column=1)
-    
-
-
-root = tk.Tk()
-#metadata
-tk.Label(root, text="File Path").grid(row=0, column=0)
-check_label=tk.Label(root, text="")
-check_label.grid(row=8, column=0)
-tk.Label(root, text="Header Metadata:").grid(row=3, column=0)
-size_label=tk.Label(root, text="File Size: ")
-size_label.grid(row=4, column=0)
-width_label=tk.Label(root, text="Image Width: ")
-width_label.grid(row=5, column=0)
-height_label=tk.Label(root, text="Image height: ")
-height_label.grid(row=6, column=0)
-bpp_label=tk.Label(root, text="Bits Per Pixel: ")
-bpp_label.grid(row=7, column=0)
-
-#sliders
-brightness_slider = tk.Scale(root, from_=0, to=100, orient=tk.HORIZONTAL, label="Brightness", command=change_brightness)
-brightness_slider.grid(row=9, column=7)
-brightness_slider.set(50)
-scale_slider = tk.Scale(root, from_=0, to=100, orient=tk.HORIZONTAL, label="Size Scaler", command=change_size)
-scale_slider.grid(row=9, column=8)
-scale_slider.set(50)
-file_path_entry = tk.Entry(root, width=80)
-file_path_entry.grid(row=0, column=1)
-
-#buttons
-tk.Button(root, text="Browse", command=browse_file).grid(row=1, column=0)
-tk.Button(root, text="Get Metadata", command=get_metadata).grid(row=1, column=1)
-r_butt = tk.Button(root, text="Enable/Disable R", command=r_toggle)
-g_butt = tk.Button(root, text="Enable/Disable G", command=g_toggle)
-b_butt = tk.Button(root, text="Enable/Disable B", command=b_toggle)
-
-tk.Button(root, text="Compress (huffmann)", command=compress_bmp).grid(row=13, column=0)
-tk.Button(root, text="Decompress", command=decompress).grid(row=14, column=0)
-r_butt.grid(row=10, column = 0)
-g_butt.grid(row=11, column=0)
-b_butt.grid(row=12, column=0)
-
-root.mainloop()
+    scale_slider = tk.Scale(root, from_=0, to=100, orient=tk.HORIZONTAL, label="Size Scaler", command=change_size)
+    scale_slider.grid(row=9, column=8)
+    scale_slider.set(50)
+    file_path_entry = tk.Entry(root, width=80)
+    file_path_entry.grid(row=0, column=1)
+
+    #buttons
+    tk.Button(root, text="Browse", command=browse_file).grid(row=1, column=0)
+    tk.Button(root, text="Get Metadata", command=get_metadata).grid(row=1, column=1)
+    r_butt = tk.Button(root, text="Enable/Disable R", command=r_toggle)
+    g_butt = tk.Button(root, text="Enable/Disable G", command=g_toggle)
+    b_butt = tk.Button(root, text="Enable/Disable B", command=b_toggle)
+
+    tk.Button(root, text="Compress (huffmann)", command=compress_bmp).grid(row=13, column=0)
+    #off by default, on writes a .cmpt365_cache.json next to the output
+    cache_var = tk.BooleanVar(root, value=False)
+    tk.Checkbutton(root, text="Skip if up to date (cache)", variable=cache_var).grid(row=13, column=1)
+    tk.Button(root, text="Decompress", command=decompress).grid(row=14, column=0)
+    r_butt.grid(row=10, column = 0)
+    g_butt.grid(row=11, column=0)
+    b_butt.grid(row=12, column=0)
+    tk.Button(root, text="Cancel", command=cancel_jobs).grid(row=15, column=0)
+    progress_label = tk.Label(root, text="")
+    progress_label.grid(row=16, column=0)
+    root.after(POLL_MS, poll_jobs)
+    return root
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv:
+        return run_cli(argv)
+    #no arguments, start the viewer
+    if tk is None:
+        print("tkinter is not available, use the compress/decompress/info commands", file=sys.stderr)
+        return 1
+    build_gui().mainloop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
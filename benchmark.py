@@ -0,0 +1,292 @@
+import argparse, json, os, platform, statistics, sys, time, tracemalloc
+
+import LosslessCompressor as lc
+
+SAMPLES = ["BIOS.bmp", "Fall.bmp", "earth.bmp", "nature.bmp", "nature_2.bmp",
+           "pal1.bmp", "pal1bg.bmp", "pal4.bmp", "pal8gs.bmp"]
+
+def bitwise_huffman_decoding(encoded_bytes, bitlength, lengths):
+    #previous decoder, one bit and one dict probe per step
+    huffman_codes = lc.huffman_code(lengths)
+    if not huffman_codes:
+        return b''
+    decoded = {}
+    for index, (c, l) in huffman_codes.items():
+        decoded[(c, l)] = index
+
+    output = bytearray()
+    value = 0
+    length = 0
+    num_read = 0
+    for x in encoded_bytes:
+        for y in range(8):
+            if num_read >= bitlength:
+                break
+            b = (x >> (7 - y)) & 0x01
+            value = (value << 1) | b
+            num_read = num_read + 1
+            length = length + 1
+            index = (value, length)
+            if index in decoded:
+                output.append(decoded[index])
+                value = 0
+                length = 0
+        if num_read >= bitlength:
+            break
+    return bytes(output)
+
+def shift_huffman_encoding(data_bytes, huffman_codes):
+    #previous encoder, one shift/mask step per symbol
+    buffer = 0
+    counter = 0
+    output = bytearray()
+    for data in data_bytes:
+        coding, length = huffman_codes[data]
+        counter = counter + length
+        buffer = (buffer << length) | coding
+        while counter >= 8:
+            x = counter - 8
+            output.append((buffer >> x) & 0xFF)
+            buffer = buffer & ((1 << x) - 1)
+            counter = counter - 8
+    if counter > 0:
+        output.append((buffer << (8 - counter)) & 0xFF)
+    tot = 0
+    value = [huffman_codes[y][1] for y in data_bytes]
+    for x in value:
+        tot = tot + x
+    bitlength = 0
+    for x in data_bytes:
+        bitlength = bitlength + huffman_codes[x][1]
+    return bytes(output), bitlength
+
+def best_time(function, repeat):
+    #best of repeat runs after one warm-up call
+    result = function()
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def bench_codec(path, repeat):
+    with open(path, "rb") as f:
+        bmp_bytes = f.read()
+    pixel_data = lc.get_pixel_data(bmp_bytes)
+    lengths = lc.huffman_tree(lc.pixel_frequency_table(pixel_data))
+    huffman_codes = lc.huffman_code(lengths)
+
+    enc_before, old_encoded = best_time(lambda: shift_huffman_encoding(pixel_data, huffman_codes), repeat)
+    enc_after, new_encoded = best_time(lambda: lc.huffman_encoding(pixel_data, huffman_codes), repeat)
+    if old_encoded != new_encoded:
+        raise AssertionError(f"{path}: encoders disagree")
+    encoded_bytes, bitlength = new_encoded
+
+    dec_before, old_output = best_time(lambda: bitwise_huffman_decoding(encoded_bytes, bitlength, lengths), repeat)
+    dec_after, new_output = best_time(lambda: lc.huffman_decoding(encoded_bytes, bitlength, lengths), repeat)
+    if old_output != new_output or new_output != pixel_data:
+        raise AssertionError(f"{path}: decoders disagree")
+    mb = len(pixel_data) / 1e6
+    return mb / enc_before, mb / enc_after, mb / dec_before, mb / dec_after
+
+def bench_predictors(path, repeat):
+    #ratio and throughput of every prediction filter on one file
+    with open(path, "rb") as f:
+        bmp_bytes = f.read()
+    mb = len(bmp_bytes) / 1e6
+    results = []
+    for predictor in lc.PREDICTORS:
+        option = None if predictor == "none" else predictor
+        compress_time, (new_bytes, stats) = best_time(lambda: lc.compress_bytes(bmp_bytes, predictor=option), repeat)
+        decompress_time, (old_bytes, stats) = best_time(lambda: lc.decompress_bytes(new_bytes), repeat)
+        if old_bytes != bmp_bytes:
+            raise AssertionError(f"{path}: {predictor} round trip failed")
+        results.append((predictor, len(bmp_bytes) / len(new_bytes), mb / compress_time, mb / decompress_time))
+    return results
+
+def bench_coders(path, repeat):
+    #every entropy coder on the raw pixel bytes, plus the old bitwise huffman decoder
+    with open(path, "rb") as f:
+        bmp_bytes = f.read()
+    pixel_data = lc.get_pixel_data(bmp_bytes)
+    mb = len(pixel_data) / 1e6
+    results = []
+    for name, coder in lc.ENTROPY_CODERS.items():
+        encode_time, (table, bitlength, encoded_bytes) = best_time(lambda: coder.encode(pixel_data), repeat)
+        decode_time, output = best_time(lambda: coder.decode(encoded_bytes, bitlength, table, len(pixel_data)), repeat)
+        if output != pixel_data:
+            raise AssertionError(f"{path}: {name} round trip failed")
+        size = len(encoded_bytes) + coder.table.size
+        results.append((name, size, mb / encode_time, mb / decode_time))
+        if name == "huffman":
+            #the block starts with its compact table, the old decoder only gets the code lengths
+            lengths, pos = lc.parse_huffman_table(encoded_bytes, 0)
+            bitwise_time, output = best_time(
+                lambda: bitwise_huffman_decoding(encoded_bytes[pos:], bitlength - 8 * pos, lengths), repeat)
+            results.append(("bitwise", size, None, mb / bitwise_time))
+    return len(pixel_data), results
+
+def timed_runs(function, warmup, repeat):
+    #seconds of every timed run after the warm-up calls
+    for i in range(warmup):
+        result = function()
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+def peak_memory(function):
+    #peak bytes allocated by python while function runs
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def bench_suite_file(path, warmup, repeat, options):
+    with open(path, "rb") as f:
+        bmp_bytes = f.read()
+    mb = len(bmp_bytes) / 1e6
+    compress_times, (new_bytes, stats) = timed_runs(lambda: lc.compress_bytes(bmp_bytes, **options), warmup, repeat)
+    decompress_times, (old_bytes, stats) = timed_runs(lambda: lc.decompress_bytes(new_bytes), warmup, repeat)
+    # memory is measured in separate runs, tracing slows everything down
+    compress_peak = peak_memory(lambda: lc.compress_bytes(bmp_bytes, **options))
+    decompress_peak = peak_memory(lambda: lc.decompress_bytes(new_bytes))
+    return {
+        "file": os.path.basename(path),
+        "size": len(bmp_bytes),
+        "compressed_size": len(new_bytes),
+        "ratio": len(bmp_bytes) / len(new_bytes),
+        "compress_mb_s": mb / statistics.median(compress_times),
+        "decompress_mb_s": mb / statistics.median(decompress_times),
+        "compress_best_mb_s": mb / min(compress_times),
+        "decompress_best_mb_s": mb / min(decompress_times),
+        "compress_peak_bytes": compress_peak,
+        "decompress_peak_bytes": decompress_peak,
+        "round_trip": old_bytes == bmp_bytes
+    }
+
+def compare_results(results, baseline, tolerance):
+    #list of regression messages against a stored baseline
+    regressions = []
+    old_results = {entry["file"]: entry for entry in baseline["results"]}
+    for entry in results:
+        name = entry["file"]
+        if not entry["round_trip"]:
+            regressions.append(f"{name}: round trip failed")
+        old = old_results.get(name)
+        if old is None:
+            continue
+        if entry["ratio"] < old["ratio"] * (1 - 1e-9):
+            regressions.append(f"{name}: ratio {old['ratio']:.4f} -> {entry['ratio']:.4f}")
+        for key in ("compress_mb_s", "decompress_mb_s"):
+            if entry[key] < old[key] * (1 - tolerance):
+                regressions.append(f"{name}: {key} {old[key]:.2f} -> {entry[key]:.2f}")
+        for key in ("compress_peak_bytes", "decompress_peak_bytes"):
+            if entry[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {old[key]} -> {entry[key]}")
+    return regressions
+
+def run_huffman(args, files):
+    print(f"{'':<14}{'---------- encode MB/s ----------':>34}{'---------- decode MB/s ----------':>34}")
+    print(f"{'file':<14}{'shift':>12}{'batched':>12}{'speedup':>10}{'bitwise':>12}{'table':>12}{'speedup':>10}")
+    for path in files:
+        enc_before, enc_after, dec_before, dec_after = bench_codec(path, args.repeat)
+        print(f"{os.path.basename(path):<14}"
+              f"{enc_before:>12.2f}{enc_after:>12.2f}{enc_after / enc_before:>9.1f}x"
+              f"{dec_before:>12.2f}{dec_after:>12.2f}{dec_after / dec_before:>9.1f}x")
+    return 0
+
+def run_predictors(args, files):
+    print(f"{'file':<14}{'predictor':<11}{'ratio':>8}{'compress MB/s':>15}{'decompress MB/s':>17}")
+    for path in files:
+        for predictor, ratio, compress_speed, decompress_speed in bench_predictors(path, args.repeat):
+            print(f"{os.path.basename(path):<14}{predictor:<11}{ratio:>8.3f}"
+                  f"{compress_speed:>15.2f}{decompress_speed:>17.2f}")
+    return 0
+
+def run_coders(args, files):
+    print(f"{'file':<14}{'coder':<9}{'bytes':>10}{'bits/byte':>11}{'encode MB/s':>13}{'decode MB/s':>13}")
+    for path in files:
+        size, results = bench_coders(path, args.repeat)
+        for name, coded_size, encode_speed, decode_speed in results:
+            encode_text = f"{encode_speed:>13.2f}" if encode_speed else f"{'-':>13}"
+            print(f"{os.path.basename(path):<14}{name:<9}{coded_size:>10}{8 * coded_size / max(size, 1):>11.3f}"
+                  f"{encode_text}{decode_speed:>13.2f}")
+    return 0
+
+def run_suite(args, files):
+    options = {"block_size": args.block_size, "coder": args.coder}
+    if args.predictor != "none":
+        options["predictor"] = args.predictor
+    results = []
+    print(f"{'file':<14}{'ratio':>8}{'comp MB/s':>11}{'decomp MB/s':>13}{'comp peak KB':>14}{'decomp peak KB':>16}  round trip")
+    for path in files:
+        entry = bench_suite_file(path, args.warmup, args.repeat, options)
+        results.append(entry)
+        print(f"{entry['file']:<14}{entry['ratio']:>8.3f}{entry['compress_mb_s']:>11.2f}{entry['decompress_mb_s']:>13.2f}"
+              f"{entry['compress_peak_bytes'] / 1024:>14.0f}{entry['decompress_peak_bytes'] / 1024:>16.0f}"
+              f"  {'ok' if entry['round_trip'] else 'FAILED'}")
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "settings": {"warmup": args.warmup, "repeat": args.repeat, "predictor": args.predictor,
+                     "block_size": args.block_size, "coder": args.coder},
+        "results": results
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = not all(entry["round_trip"] for entry in results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != report["settings"]:
+            print("warning: baseline was recorded with different settings", file=sys.stderr)
+        regressions = compare_results(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if not regressions:
+            print(f"no regressions against {args.baseline}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the .cmpt365 codec")
+    commands = parser.add_subparsers(dest="command", required=True)
+    huffman = commands.add_parser("huffman", help="old vs new Huffman encoder/decoder")
+    predictors = commands.add_parser("predictors", help="ratio and MB/s of every prediction filter")
+    coders = commands.add_parser("coders", help="size and MB/s of every entropy coder")
+    suite = commands.add_parser("suite", help="throughput, ratio, peak memory and round trip per image")
+    for sub in (huffman, predictors, coders, suite):
+        sub.add_argument("files", nargs="*", help="BMP files (default: bundled samples)")
+        sub.add_argument("--repeat", type=int, default=3, help="timed runs")
+    suite.add_argument("--warmup", type=int, default=1, help="untimed runs before timing")
+    suite.add_argument("--predictor", choices=list(lc.PREDICTORS), default="none")
+    suite.add_argument("--block-size", type=int, default=lc.BLOCK_SIZE)
+    suite.add_argument("--coder", choices=list(lc.ENTROPY_CODERS) + ["auto"], default="huffman")
+    suite.add_argument("--json", help="write results to this JSON file")
+    suite.add_argument("--baseline", help="JSON results to compare against")
+    suite.add_argument("--tolerance", type=float, default=0.10,
+                       help="allowed throughput/memory change before flagging (default %(default)s)")
+    args = parser.parse_args()
+
+    files = getattr(args, "files", None)
+    if not files:
+        here = os.path.dirname(os.path.abspath(__file__))
+        files = [os.path.join(here, name) for name in SAMPLES]
+
+    run = {"huffman": run_huffman, "predictors": run_predictors, "coders": run_coders,
+           "suite": run_suite}[args.command]
+    return run(args, files)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#samples and helpers shared by the test modules
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import LosslessCompressor as lc
+
+DATA = os.path.join(ROOT, "tests", "data")
+SAMPLES = ["pal1.bmp", "pal4.bmp", "pal8gs.bmp"]
+# layouts every coder is round tripped with
+OPTIONS = [{}, {"block_size": 512}, {"predictor": "paeth"}, {"planar": False},
+           {"predictor": "adaptive", "tile_width": 32, "preview": 4}]
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def sample(name):
+    return read(os.path.join(ROOT, name))
+
+def small_24bpp(w=100, h=40):
+    #bottom left corner of BIOS.bmp, small enough to run every coder on
+    bmp_bytes = sample("BIOS.bmp")
+    pixel_data = lc.get_pixel_data(bmp_bytes)
+    stride = ((24 * lc.get_width(bmp_bytes) + 31) // 32) * 4
+    rows = b''.join(pixel_data[y * stride:y * stride + 3 * w] for y in range(h))
+    return lc.make_bmp_header(54 + len(rows), w, h, 24, None, len(rows)) + rows
+
+def images():
+    return [(name, sample(name)) for name in SAMPLES] + [("small24", small_24bpp())]
+
+def rgb_pixels(bmp_bytes):
+    #top down r,g,b pixels of a whole bmp, what decode_region crops from
+    w, h, bpp = lc.get_width(bmp_bytes), lc.get_height(bmp_bytes), lc.get_bpp(bmp_bytes)
+    colour_table = lc.get_colour_table(bmp_bytes) if bpp in (1, 4, 8) else None
+    return lc.PixelBuffer(w, h, lc.bmp_to_rgb(lc.get_pixel_data(bmp_bytes), colour_table, w, h, bpp))
+
+def with_first_entry(cmpt365_bytes, bitlength, offset):
+    #the same file with the first block index entry pointing somewhere else
+    metadata = lc.parse_block_header(cmpt365_bytes)
+    entry_pos = metadata["header_end"] + metadata["header_size"]
+    raw_size = lc.BLOCK_ENTRY.unpack_from(cmpt365_bytes, entry_pos)[0]
+    entry = lc.BLOCK_ENTRY.pack(raw_size, bitlength, offset)
+    return cmpt365_bytes[:entry_pos] + entry + cmpt365_bytes[entry_pos + lc.BLOCK_ENTRY.size:]
+
+def stream_round_trip(test, tmp, bmp_bytes, **options):
+    #streaming has to write the same file as in-memory compression and decode back to the bmp
+    src = os.path.join(tmp, "in.bmp")
+    write(src, bmp_bytes)
+    lc.compress_file(src, os.path.join(tmp, "a.cmpt365"), block_size=1024, **options)
+    lc.compress_file(src, os.path.join(tmp, "b.cmpt365"), block_size=1024, stream=True, **options)
+    test.assertEqual(read(os.path.join(tmp, "a.cmpt365")), read(os.path.join(tmp, "b.cmpt365")))
+    lc.decompress_file(os.path.join(tmp, "b.cmpt365"), os.path.join(tmp, "out.bmp"), stream=True)
+    test.assertEqual(read(os.path.join(tmp, "out.bmp")), bmp_bytes)
+
+def round_trips(test, options_list=OPTIONS, **fixed):
+    #every sample compressed with fixed plus each of options_list has to decode back to the bmp
+    for name, bmp_bytes in images():
+        for options in options_list:
+            with test.subTest(image=name, **options):
+                cmpt365_bytes = lc.compress_bytes(bmp_bytes, **{**fixed, **options})[0]
+                test.assertEqual(lc.decompress_bytes(cmpt365_bytes)[0], bmp_bytes)
+
+def truncations(test, **options):
+    #pal4.bmp in 512 byte blocks cut every 7 bytes, no cut file may decode
+    cmpt365_bytes = lc.compress_bytes(sample("pal4.bmp"), block_size=512, **options)[0]
+    for cut in range(0, len(cmpt365_bytes), 7):
+        with test.subTest(cut=cut), test.assertRaises(ValueError):
+            lc.decompress_bytes(cmpt365_bytes[:cut])
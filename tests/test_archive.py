@@ -0,0 +1,77 @@
+#multi image archives
+import contextlib, io, os, tempfile, unittest
+
+from common import lc, ROOT, SAMPLES, read, sample
+
+
+class ArchiveTest(unittest.TestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.cmpta")
+            files = [os.path.join(ROOT, name) for name in SAMPLES + ["BIOS.bmp"]]
+            lc.archive_add(path, files)
+            self.assertEqual(dict(lc.archive_extract(path)), {name: sample(name) for name in SAMPLES + ["BIOS.bmp"]})
+            self.assertEqual(lc.archive_member(path, "pal4.bmp"), sample("pal4.bmp"))
+
+    def test_append_and_replace(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.cmpta")
+            lc.archive_add(path, [os.path.join(ROOT, "pal1.bmp")])
+            lc.archive_add(path, [os.path.join(ROOT, "pal4.bmp")])
+            self.assertEqual(list(lc.archive_members(path)), ["pal1.bmp", "pal4.bmp"])
+            with self.assertRaises(ValueError):
+                lc.archive_add(path, [os.path.join(ROOT, "pal4.bmp")], names=["pal1.bmp"])
+            lc.archive_add(path, [os.path.join(ROOT, "pal4.bmp")], names=["pal1.bmp"], replace=True)
+            self.assertEqual(lc.archive_member(path, "pal1.bmp"), sample("pal4.bmp"))
+
+    def test_options_reach_small_members(self):
+        #pal8gs.bmp is much smaller with a predictor than as a plain huffman stream
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.cmpta")
+            files = [os.path.join(ROOT, name) for name in SAMPLES]
+            modes = {os.path.basename(stats["input"]): stats["mode"]
+                     for stats in lc.archive_add(path, files, coder="auto")}
+            self.assertEqual(modes["pal8gs.bmp"], "container")
+            standalone = lc.compress_bytes(sample("pal8gs.bmp"), coder="auto")[0]
+            self.assertEqual(lc.archive_members(path)["pal8gs.bmp"]["size"], len(standalone))
+            self.assertEqual(dict(lc.archive_extract(path)), {name: sample(name) for name in SAMPLES})
+
+    def test_cli(self):
+        #codec options reach the members, member names can come after the options
+        with tempfile.TemporaryDirectory() as tmp:
+            path, out = os.path.join(tmp, "a.cmpta"), os.path.join(tmp, "out")
+            files = [os.path.join(ROOT, name) for name in SAMPLES]
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(lc.run_cli(["archive", path, *files, "--coder", "auto"]), 0)
+                self.assertEqual(lc.run_cli(["extract", path, "-o", out, "pal4.bmp", "pal8gs.bmp"]), 0)
+            standalone = lc.compress_bytes(sample("pal8gs.bmp"), coder="auto")[0]
+            self.assertEqual(lc.archive_members(path)["pal8gs.bmp"]["size"], len(standalone))
+            self.assertEqual(sorted(os.listdir(out)), ["pal4.bmp", "pal8gs.bmp"])
+            self.assertEqual(read(os.path.join(out, "pal4.bmp")), sample("pal4.bmp"))
+
+
+class CorruptArchiveTest(unittest.TestCase):
+    def test_failed_append_keeps_archive(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.cmpta")
+            lc.archive_add(path, [os.path.join(ROOT, "pal1.bmp")])
+            before = read(path)
+            with self.assertRaises(ValueError):
+                lc.archive_add(path, [os.path.join(ROOT, "earth.bmp")], coder="lz77", lz_effort=99)
+            self.assertEqual(read(path), before)
+            self.assertEqual(list(lc.archive_members(path)), ["pal1.bmp"])
+
+    def test_truncated_archive(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.cmpta")
+            lc.archive_add(path, [os.path.join(ROOT, name) for name in SAMPLES])
+            archive_bytes = read(path)
+            for cut in range(0, len(archive_bytes), len(archive_bytes) // 16):
+                with self.subTest(cut=cut), self.assertRaises(ValueError):
+                    with open(path, "wb") as f:
+                        f.write(archive_bytes[:cut])
+                    dict(lc.archive_extract(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
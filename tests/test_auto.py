@@ -0,0 +1,40 @@
+#automatic mode selection and the stored coder
+import random, unittest
+
+from common import lc, sample, round_trips
+
+
+class AutoModeTest(unittest.TestCase):
+    def test_round_trip(self):
+        for coder in ["auto", "stored"]:
+            with self.subTest(coder=coder):
+                round_trips(self, coder=coder)
+
+    def test_noise_is_stored(self):
+        pixels = random.Random(365).randbytes(3000)
+        bmp_bytes = lc.make_bmp_header(54 + len(pixels), 50, 20, 24, None, len(pixels)) + pixels
+        cmpt365_bytes = lc.compress_bytes(bmp_bytes, coder="auto")[0]
+        self.assertEqual(lc.parse_block_header(cmpt365_bytes)["coder"], "stored")
+        self.assertEqual(lc.decompress_bytes(cmpt365_bytes)[0], bmp_bytes)
+
+    def test_lz77_is_a_candidate(self):
+        #pal4.bmp repeats whole runs of rows, which only the match stage can use
+        bmp_bytes = sample("pal4.bmp")
+        cmpt365_bytes, stats = lc.compress_bytes(bmp_bytes, coder="auto")
+        self.assertEqual(stats["mode"], "lz77, no predictor")
+        self.assertEqual(cmpt365_bytes, lc.compress_bytes(bmp_bytes, coder="lz77")[0])
+
+    def test_rle_is_a_candidate(self):
+        #rows of grey runs, one byte repeated for the whole run
+        rng = random.Random(365)
+        rows = b''.join((b''.join(bytes([rng.randrange(256)]) * 3 * rng.randrange(1, 30) for i in range(10))
+                         + bytes(300))[:300] for y in range(40))
+        bmp_bytes = lc.make_bmp_header(54 + len(rows), 100, 40, 24, None, len(rows)) + rows
+        cmpt365_bytes, stats = lc.compress_bytes(bmp_bytes, coder="auto")
+        self.assertTrue(stats["mode"].endswith(", rle"))
+        self.assertTrue(lc.parse_block_header(cmpt365_bytes)["flags"] & lc.FLAG_RLE)
+        self.assertEqual(lc.decompress_bytes(cmpt365_bytes)[0], bmp_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+#compression cache manifests
+import contextlib, io, os, shutil, tempfile, threading, unittest
+
+from common import lc, ROOT, sample, read, write
+
+
+class CacheTest(unittest.TestCase):
+    def test_compress_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "in.bmp")
+            write(src, sample("pal4.bmp"))
+            self.assertNotIn("cached", lc.compress_cached(src))
+            self.assertTrue(lc.compress_cached(src)["cached"])
+            #other settings or a changed input compress again
+            self.assertNotIn("cached", lc.compress_cached(src, predictor="up"))
+            write(src, sample("pal1.bmp"))
+            self.assertNotIn("cached", lc.compress_cached(src, predictor="up"))
+            self.assertEqual(lc.decompress_bytes(read(os.path.join(tmp, "in.cmpt365")))[0], sample("pal1.bmp"))
+
+    def test_viewer_compress_skips_cache_by_default(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "in.bmp")
+            write(src, sample("pal4.bmp"))
+            lc.compress_job(src, {"cancel": threading.Event()})
+            self.assertFalse(os.path.exists(os.path.join(tmp, lc.CACHE_MANIFEST)))
+            lc.compress_job(src, {"cancel": threading.Event()}, cache=True)
+            self.assertTrue(os.path.exists(os.path.join(tmp, lc.CACHE_MANIFEST)))
+
+    def test_cli_info_on_cached_output(self):
+        #the manifest --cache leaves in the output folder is not an input for info
+        with tempfile.TemporaryDirectory() as tmp:
+            src, out = os.path.join(tmp, "in"), os.path.join(tmp, "out")
+            os.mkdir(src)
+            shutil.copy(os.path.join(ROOT, "pal4.bmp"), src)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(lc.run_cli(["compress", "--cache", "-j", "1", "-o", out, src]), 0)
+                self.assertTrue(os.path.exists(os.path.join(out, lc.CACHE_MANIFEST)))
+                self.assertEqual(lc.run_cli(["info", "-j", "1", out]), 0)
+            self.assertNotIn(lc.CACHE_MANIFEST, output.getvalue())
+            self.assertIn("pal4.cmpt365", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+#delta frames against a reference image
+import os, tempfile, unittest
+
+from common import lc, images, write, rgb_pixels
+
+def changed_frame(bmp_bytes):
+    #the same image with a few bytes in the middle of the pixel data flipped
+    frame = bytearray(bmp_bytes)
+    middle = len(bmp_bytes) - len(lc.get_pixel_data(bmp_bytes)) // 2
+    for i in range(middle, middle + 24):
+        frame[i] ^= 0x5A
+    return bytes(frame)
+
+
+class DeltaTest(unittest.TestCase):
+    def test_delta_frames(self):
+        for name, bmp_bytes in images():
+            frame = changed_frame(bmp_bytes)
+            for options in [{}, {"tile_width": 32}, {"rle": True}, {"coder": "auto"}]:
+                with self.subTest(image=name, **options):
+                    cmpt365_bytes = lc.compress_bytes(frame, reference=bmp_bytes, **options)[0]
+                    self.assertEqual(lc.decompress_bytes(cmpt365_bytes, reference=bmp_bytes)[0], frame)
+                    with self.assertRaises(ValueError):
+                        lc.decompress_bytes(cmpt365_bytes)
+                    with self.assertRaises(ValueError):
+                        lc.decompress_bytes(cmpt365_bytes, reference=frame)
+
+    def test_decode_region(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "d.cmpt365")
+            for name, bmp_bytes in images():
+                frame = changed_frame(bmp_bytes)
+                full = rgb_pixels(frame)
+                write(path, lc.compress_bytes(frame, reference=bmp_bytes, tile_width=32)[0])
+                with self.subTest(image=name):
+                    self.assertEqual(lc.decode_region(path, 3, 5, 40, 20, reference=bmp_bytes),
+                                     lc.crop_pixels(full, 3, 5, 40, 20))
+
+    def test_reference_must_match(self):
+        name, bmp_bytes = images()[0]
+        other = images()[1][1]
+        with self.assertRaises(ValueError):
+            lc.compress_bytes(bmp_bytes, reference=other)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,24 @@
+#the lz77 match stage
+import unittest
+
+from common import lc, images
+
+
+class Lz77Test(unittest.TestCase):
+    def test_effort_and_window(self):
+        name, bmp_bytes = images()[-1]
+        for effort in lc.LZ_LEVELS:
+            for window in [1, 300, lc.LZ_WINDOW]:
+                with self.subTest(effort=effort, window=window):
+                    cmpt365_bytes = lc.compress_bytes(bmp_bytes, coder="lz77", lz_effort=effort, lz_window=window)[0]
+                    self.assertEqual(lc.decompress_bytes(cmpt365_bytes)[0], bmp_bytes)
+
+    def test_bad_options(self):
+        name, bmp_bytes = images()[0]
+        for options in [{"lz_effort": 0}, {"lz_effort": 10}, {"lz_window": 0}, {"lz_window": lc.LZ_MAX_WINDOW + 1}]:
+            with self.subTest(**options), self.assertRaises(ValueError):
+                lc.compress_bytes(bmp_bytes, coder="lz77", **options)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,24 @@
+#planar and interleaved layouts of 24 bpp images
+import unittest
+
+from common import lc, small_24bpp
+
+
+class PlanarTest(unittest.TestCase):
+    def test_planar_and_interleaved(self):
+        bmp_bytes = small_24bpp()
+        for planar in [True, False]:
+            for options in [{}, {"predictor": "paeth"}, {"block_size": 512}]:
+                with self.subTest(planar=planar, **options):
+                    cmpt365_bytes = lc.compress_bytes(bmp_bytes, planar=planar, **options)[0]
+                    self.assertEqual(bool(lc.parse_block_header(cmpt365_bytes)["flags"] & lc.FLAG_PLANAR), planar)
+                    self.assertEqual(lc.decompress_bytes(cmpt365_bytes)[0], bmp_bytes)
+
+    def test_partial_rows_keep_leftover_bytes(self):
+        #111 bytes a row with no padding, so the data ends part way into a 112 byte row
+        bmp_bytes = small_24bpp(37, 9)
+        self.assertEqual(lc.decompress_bytes(lc.compress_bytes(bmp_bytes)[0])[0], bmp_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
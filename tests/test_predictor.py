@@ -0,0 +1,20 @@
+#row prediction filters before the entropy coder
+import unittest
+
+from common import lc, images, round_trips
+
+
+class PredictorTest(unittest.TestCase):
+    def test_every_predictor(self):
+        round_trips(self, [{"predictor": predictor, "block_size": block_size}
+                           for predictor in lc.PREDICTORS for block_size in [lc.BLOCK_SIZE, 512]])
+
+    def test_parallel_filtering(self):
+        name, bmp_bytes = images()[-1]
+        cmpt365_bytes = lc.compress_bytes(bmp_bytes, predictor="adaptive", block_size=1024, jobs=2)[0]
+        self.assertEqual(cmpt365_bytes, lc.compress_bytes(bmp_bytes, predictor="adaptive", block_size=1024)[0])
+        self.assertEqual(lc.decompress_bytes(cmpt365_bytes, jobs=2)[0], bmp_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+#embedded previews
+import os, tempfile, unittest
+
+from common import lc, images, small_24bpp, write, stream_round_trip
+
+CODERS = list(lc.ENTROPY_CODERS)
+
+
+class PreviewTest(unittest.TestCase):
+    def test_every_coder(self):
+        for name, bmp_bytes in images():
+            for coder in CODERS:
+                for preview in [2, 4]:
+                    with self.subTest(image=name, coder=coder, preview=preview):
+                        cmpt365_bytes = lc.compress_bytes(bmp_bytes, coder=coder, preview=preview)[0]
+                        self.assertEqual(lc.decompress_bytes(cmpt365_bytes)[0], bmp_bytes)
+
+    def test_read_preview(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "p.cmpt365")
+            write(path, lc.compress_bytes(small_24bpp(), preview=4)[0])
+            preview = lc.read_preview(path)
+            self.assertEqual((preview.width, preview.height), (25, 10))
+
+    def test_stream_matches_in_memory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, bmp_bytes in images():
+                with self.subTest(image=name):
+                    stream_round_trip(self, tmp, bmp_bytes, preview=2, tile_width=32)
+
+    def test_top_down_bmp(self):
+        bmp_bytes = bytearray(small_24bpp())
+        bmp_bytes[22:26] = (-40).to_bytes(4, "little", signed=True)
+        with self.assertRaises(ValueError):
+            lc.compress_bytes(bytes(bmp_bytes), preview=2)
+
+
+class CorruptPreviewTest(unittest.TestCase):
+    def test_cut_in_preview_header(self):
+        #the streaming and region readers skip the preview without parsing it
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "p.cmpt365")
+            cmpt365_bytes = lc.compress_bytes(small_24bpp(), preview=2)[0]
+            metadata = lc.parse_block_header(cmpt365_bytes)
+            preview_pos = metadata["header_end"] + metadata["header_size"]
+            for cut in range(preview_pos, preview_pos + lc.PREVIEW_HEADER.size):
+                write(path, cmpt365_bytes[:cut])
+                with self.subTest(cut=cut):
+                    with self.assertRaises(ValueError):
+                        lc.decompress_file(path, os.path.join(tmp, "out.bmp"), stream=True)
+                    with self.assertRaises(ValueError):
+                        lc.decode_region(path, 0, 0, 1, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
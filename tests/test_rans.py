@@ -0,0 +1,38 @@
+#the rans entropy coder
+import unittest
+
+from common import lc
+
+
+class RansTest(unittest.TestCase):
+    def test_single_symbol(self):
+        rans = lc.ENTROPY_CODERS["rans"]
+        for data in [b'', b'\x07', bytes(3000)]:
+            with self.subTest(size=len(data)):
+                table, bitlength, encoded_bytes = rans.encode(data)
+                self.assertEqual(rans.decode(encoded_bytes, bitlength, table, len(data)), data)
+
+
+class CorruptRansTest(unittest.TestCase):
+    def test_raw_size_is_checked(self):
+        rans = lc.ENTROPY_CODERS["rans"]
+        data = bytes(5000) + bytes(range(200))
+        table, bitlength, encoded_bytes = rans.encode(data)
+        for raw_size in [len(data) * 50, (1 << 32) - 1]:
+            with self.assertRaises(ValueError):
+                rans.decode(encoded_bytes, bitlength, table, raw_size)
+
+    def test_index_raw_size_is_checked(self):
+        #a single symbol rans block says nothing about its length, the index limit catches it
+        bmp_bytes = lc.make_bmp_header(54 + 1024 + 64, 16, 4, 8, bytes(1024), 64) + bytes(64)
+        cmpt365_bytes = bytearray(lc.compress_bytes(bmp_bytes, coder="rans")[0])
+        metadata = lc.parse_block_header(cmpt365_bytes)
+        entry_pos = metadata["header_end"] + metadata["header_size"]
+        cmpt365_bytes[entry_pos:entry_pos + 4] = (0xFFFFFFFF).to_bytes(4, "little")
+        #parsing alone decodes nothing, so this is the index check and not a later one
+        with self.assertRaises(ValueError):
+            lc.parse_block_file(bytes(cmpt365_bytes))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+#run length pre-stage
+import unittest
+
+from common import lc
+
+
+class RleTest(unittest.TestCase):
+    def test_run_lengths(self):
+        #runs around the longest one byte token and ones that need the base-128 extension
+        for length in [lc.RLE_MIN_RUN, 0x7F + lc.RLE_MIN_RUN - 1, 0x7F + lc.RLE_MIN_RUN, 0x7F + lc.RLE_MIN_RUN + 1,
+                       20000]:
+            data = b'ab' + b'x' * length + bytes(range(200))
+            with self.subTest(length=length):
+                self.assertEqual(lc.rle_decoding(lc.rle_encoding(data), len(data)), data)
+
+
+class CorruptRleTest(unittest.TestCase):
+    def test_run_lengths_are_bounded(self):
+        for encoded_bytes in [b'\xff\xff\xff\xff\xff\xff\x7f\x00', b'\xff' + b'\xff' * 12 + b'\x01']:
+            with self.assertRaises(ValueError):
+                lc.rle_decoding(encoded_bytes, 1 << 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#round trips of the block container on the bundled samples, plus the corrupt input cases
+#run from the repository root with `python -m unittest discover -s tests` (pytest finds it too)
+import os, random, tempfile, unittest
+
+from common import lc, DATA, SAMPLES, read, write, sample, small_24bpp, round_trips, truncations
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_every_coder(self):
+        #every coder with and without the rle stage, on every sample and layout
+        for coder in lc.ENTROPY_CODERS:
+            for rle in [False, True]:
+                with self.subTest(coder=coder, rle=rle):
+                    round_trips(self, coder=coder, rle=rle)
+
+    def test_parallel_decode(self):
+        bmp_bytes = small_24bpp()
+        cmpt365_bytes = lc.compress_bytes(bmp_bytes, block_size=1024)[0]
+        self.assertEqual(lc.compress_bytes(bmp_bytes, block_size=1024, jobs=2)[0], cmpt365_bytes)
+        self.assertEqual(lc.decompress_bytes(cmpt365_bytes, jobs=2)[0], bmp_bytes)
+
+    def test_v1_files_decode(self):
+        #written by the original single table compressor, they only keep the image metadata
+        for name in SAMPLES:
+            with self.subTest(image=name):
+                bmp_bytes = lc.decompress_bytes(read(os.path.join(DATA, name.replace(".bmp", "_v1.cmpt365"))))[0]
+                original = sample(name)
+                self.assertEqual(lc.get_pixel_data(bmp_bytes), lc.get_pixel_data(original))
+
+
+class CorruptInputTest(unittest.TestCase):
+    def test_truncated_files(self):
+        for coder in lc.ENTROPY_CODERS:
+            for rle in [False, True]:
+                with self.subTest(coder=coder, rle=rle):
+                    truncations(self, coder=coder, rle=rle)
+
+    def test_not_cmpt365(self):
+        for data in [b'', b'BM' + bytes(60), b'CMPT365' + bytes(4)]:
+            with self.subTest(data=data[:8]), self.assertRaises(ValueError):
+                lc.decompress_bytes(data)
+
+    def test_unsupported_version_and_coder(self):
+        #version 2 files kept huffman code lengths in the index, coder 4 was the static table coder
+        cmpt365_bytes = lc.compress_bytes(sample("pal4.bmp"))[0]
+        header = list(lc.CONTAINER_HEADER.unpack_from(cmpt365_bytes))
+        for version, flags in [(2, header[3]), (header[2], header[3] & ~lc.CODER_MASK | 4 << lc.CODER_SHIFT)]:
+            corrupt = lc.CONTAINER_HEADER.pack(*header[:2], version, flags, *header[4:])
+            with self.subTest(version=version, flags=flags), self.assertRaises(ValueError):
+                lc.decompress_bytes(corrupt + cmpt365_bytes[lc.CONTAINER_HEADER.size:])
+
+    def test_header_sizes_are_checked(self):
+        #a huge width or bmp header size in the fixed header must not be allocated by any reader
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "c.cmpt365")
+            cmpt365_bytes = lc.compress_bytes(sample("pal4.bmp"), tile_width=32, preview=2)[0]
+            header = list(lc.CONTAINER_HEADER.unpack_from(cmpt365_bytes))
+            for field in [5, 8]:
+                corrupt = header[:field] + [(1 << 32) - 1] + header[field + 1:]
+                write(path, lc.CONTAINER_HEADER.pack(*corrupt) + cmpt365_bytes[lc.CONTAINER_HEADER.size:])
+                with self.subTest(field=field):
+                    for decode in self.readers(path, header[5], header[6]):
+                        with self.assertRaises(ValueError):
+                            decode()
+
+    def test_random_corruption(self):
+        #a damaged file may still decode to something, but ValueError is the only error any reader raises
+        rng = random.Random(365)
+        bmp_bytes = sample("pal4.bmp")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "c.cmpt365")
+            for coder in lc.ENTROPY_CODERS:
+                cmpt365_bytes = lc.compress_bytes(bmp_bytes, coder=coder, tile_width=32, block_size=512, preview=2)[0]
+                for i in range(8):
+                    corrupt = bytearray(cmpt365_bytes)
+                    for pos in rng.sample(range(len(corrupt)), 3):
+                        corrupt[pos] = rng.randrange(256)
+                    write(path, corrupt)
+                    for decode in self.readers(path, lc.get_width(bmp_bytes), lc.get_height(bmp_bytes)):
+                        with self.subTest(coder=coder, i=i):
+                            try:
+                                decode()
+                            except ValueError:
+                                pass
+
+    def readers(self, path, w, h):
+        #in memory, streamed and region decoding of the whole file at path
+        out = os.path.join(os.path.dirname(path), "out.bmp")
+        return [lambda: lc.decompress_bytes(read(path)),
+                lambda: lc.decompress_file(path, out, stream=True),
+                lambda: lc.decode_region(path, 0, 0, w, h)]
+
+
+if __name__ == "__main__":
+    unittest.main()
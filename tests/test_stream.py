@@ -0,0 +1,46 @@
+#streaming compression and decompression against the in-memory path
+import os, tempfile, unittest
+
+from common import lc, images, sample, read, write, stream_round_trip, with_first_entry
+
+
+class StreamTest(unittest.TestCase):
+    def test_stream_matches_in_memory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, bmp_bytes in images():
+                for options in [{}, {"rle": True}]:
+                    with self.subTest(image=name, **options):
+                        stream_round_trip(self, tmp, bmp_bytes, **options)
+
+    def test_stream_decode_of_in_memory_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, bmp_bytes in images():
+                with self.subTest(image=name):
+                    write(os.path.join(tmp, "a.cmpt365"), lc.compress_bytes(bmp_bytes, block_size=700)[0])
+                    lc.decompress_file(os.path.join(tmp, "a.cmpt365"), os.path.join(tmp, "out.bmp"), stream=True)
+                    self.assertEqual(read(os.path.join(tmp, "out.bmp")), bmp_bytes)
+
+
+class CorruptStreamTest(unittest.TestCase):
+    def test_truncated_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.cmpt365")
+            cmpt365_bytes = lc.compress_bytes(sample("pal4.bmp"), block_size=512)[0]
+            for cut in range(0, len(cmpt365_bytes), len(cmpt365_bytes) // 16):
+                write(path, cmpt365_bytes[:cut])
+                with self.subTest(cut=cut), self.assertRaises(ValueError):
+                    lc.decompress_file(path, os.path.join(tmp, "out.bmp"), stream=True)
+
+    def test_entry_past_end_of_file(self):
+        #streamed blocks are read at their index offsets, an entry past the end must not be read or allocated
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.cmpt365")
+            cmpt365_bytes = lc.compress_bytes(sample("pal4.bmp"), block_size=512)[0]
+            for bitlength, offset in [(1 << 62, 0), (8, 1 << 60), (8 * len(cmpt365_bytes), 0)]:
+                write(path, with_first_entry(cmpt365_bytes, bitlength, offset))
+                with self.subTest(bitlength=bitlength, offset=offset), self.assertRaises(ValueError):
+                    lc.decompress_file(path, os.path.join(tmp, "out.bmp"), stream=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
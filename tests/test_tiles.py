@@ -0,0 +1,84 @@
+#tiled files and decode_region
+import os, tempfile, unittest
+
+from common import lc, images, read, write, rgb_pixels, with_first_entry, round_trips
+
+
+class TileTest(unittest.TestCase):
+    def test_every_coder(self):
+        for coder in lc.ENTROPY_CODERS:
+            with self.subTest(coder=coder):
+                round_trips(self, [{}, {"block_size": 512}, {"predictor": "paeth", "planar": False}], coder=coder,
+                            tile_width=32)
+
+    def test_tile_width_must_be_aligned(self):
+        name, bmp_bytes = images()[0]
+        with self.assertRaises(ValueError):
+            lc.compress_bytes(bmp_bytes, tile_width=40)
+
+    def test_decode_region(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, bmp_bytes in images():
+                full = rgb_pixels(bmp_bytes)
+                path = os.path.join(tmp, "r.cmpt365")
+                for options in [{}, {"tile_width": 32, "block_size": 512}, {"tile_width": 64, "predictor": "med"},
+                                {"tile_width": 32, "block_size": 512, "rle": True}]:
+                    write(path, lc.compress_bytes(bmp_bytes, **options)[0])
+                    for x, y, w, h in [(0, 0, 1, 1), (3, 5, 40, 20), (0, 0, full.width, full.height)]:
+                        with self.subTest(image=name, region=(x, y, w, h), **options):
+                            self.assertEqual(lc.decode_region(path, x, y, w, h), lc.crop_pixels(full, x, y, w, h))
+
+    def test_region_outside_image(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            name, bmp_bytes = images()[0]
+            path = os.path.join(tmp, "r.cmpt365")
+            write(path, lc.compress_bytes(bmp_bytes, tile_width=32)[0])
+            full = rgb_pixels(bmp_bytes)
+            for x, y, w, h in [(0, 0, 0, 1), (-1, 0, 2, 2), (0, 0, full.width + 1, 1)]:
+                with self.subTest(region=(x, y, w, h)), self.assertRaises(ValueError):
+                    lc.decode_region(path, x, y, w, h)
+
+
+class CorruptTileTest(unittest.TestCase):
+    def test_band_layout_is_checked(self):
+        #block_rows divides region rows and bounds rle runs, block_count has to match the bands it gives
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "r.cmpt365")
+            cmpt365_bytes = lc.compress_bytes(images()[0][1], tile_width=32, block_size=512, rle=True)[0]
+            header = list(lc.CONTAINER_HEADER.unpack_from(cmpt365_bytes))
+            for block_rows, block_count in [(0, header[11]), (header[6] + 1, header[11]), (1 << 31, header[11]),
+                                            (header[10], header[11] + 2), (header[10] * 2, header[11])]:
+                corrupt = lc.CONTAINER_HEADER.pack(*header[:10], block_rows, block_count)
+                write(path, corrupt + cmpt365_bytes[lc.CONTAINER_HEADER.size:])
+                with self.subTest(block_rows=block_rows, block_count=block_count):
+                    with self.assertRaises(ValueError):
+                        lc.decompress_bytes(read(path))
+                    with self.assertRaises(ValueError):
+                        lc.decode_region(path, 0, 0, 1, 1)
+
+    def test_truncated_region(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "r.cmpt365")
+            bmp_bytes = images()[1][1]
+            w, h = lc.get_width(bmp_bytes), lc.get_height(bmp_bytes)
+            cmpt365_bytes = lc.compress_bytes(bmp_bytes, tile_width=32, block_size=512)[0]
+            #the whole image, so every cut lands in a block the region reads
+            for cut in range(0, len(cmpt365_bytes), len(cmpt365_bytes) // 16):
+                write(path, cmpt365_bytes[:cut])
+                with self.subTest(cut=cut), self.assertRaises(ValueError):
+                    lc.decode_region(path, 0, 0, w, h)
+
+    def test_entry_past_end_of_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "r.cmpt365")
+            bmp_bytes = images()[1][1]
+            w, h = lc.get_width(bmp_bytes), lc.get_height(bmp_bytes)
+            cmpt365_bytes = lc.compress_bytes(bmp_bytes, tile_width=32, block_size=512)[0]
+            for bitlength, offset in [(1 << 62, 0), (8, 1 << 60), (8 * len(cmpt365_bytes), 0)]:
+                write(path, with_first_entry(cmpt365_bytes, bitlength, offset))
+                with self.subTest(bitlength=bitlength, offset=offset), self.assertRaises(ValueError):
+                    lc.decode_region(path, 0, 0, w, h)
+
+
+if __name__ == "__main__":
+    unittest.main()